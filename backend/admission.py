@@ -0,0 +1,315 @@
+"""Admission control and per-tenant rate limiting for the API.
+
+``AdmissionMiddleware`` sorts every request into a ``CostClass`` by its
+route (``ROUTE_COSTS``, light by default) and runs it under that class's
+``ConcurrencyLimiter``: at most ``concurrency`` requests of the class run at
+once, up to ``queue_size`` more wait in FIFO order for at most ``max_wait``
+seconds, and anything beyond that is shed at once with a ``503`` and a
+``Retry-After`` estimated from the queue and recent service times.  Cheap
+requests therefore keep flowing while dashboards and 1000-row lists queue
+behind their own, smaller limit.
+
+Before that, each tenant (the user behind the bearer token, or the client
+address for anonymous calls such as logins) pays the class's ``TOKEN_COSTS`` from a token
+bucket refilled at ``RATE_LIMIT_PER_SECOND`` up to ``RATE_LIMIT_BURST``; an
+empty bucket gets a ``429`` with ``Retry-After``.  Limits are per worker.
+Behind a reverse proxy the peer address is the proxy's, so for peers in
+``FORWARDED_ALLOW_IPS`` (comma separated, ``*`` for any; the same setting
+as uvicorn's ``--forwarded-allow-ips``) the client address is taken from
+``X-Forwarded-For`` instead.
+
+Streams that are meant to stay open (``EXEMPT_ROUTES``) bypass both.
+Limits are read from ``ADMISSION_<CLASS>_CONCURRENCY``, ``..._QUEUE`` and
+``..._MAX_WAIT`` and the counters are served at
+``/api/admin/admission`` for sizing workers.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from enum import Enum
+from functools import lru_cache
+from typing import Callable, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+class CostClass(str, Enum):
+    LIGHT = "light"
+    HEAVY = "heavy"
+    BULK = "bulk"
+
+ROUTE_COSTS = {
+    ("GET", "/api/leads"): CostClass.HEAVY,
+    ("GET", "/api/contacts"): CostClass.HEAVY,
+    ("GET", "/api/deals"): CostClass.HEAVY,
+    ("POST", "/api/deals/transitions"): CostClass.HEAVY,
+    ("GET", "/api/analytics/dashboard"): CostClass.HEAVY,
+    ("GET", "/api/analytics/forecast"): CostClass.HEAVY,
+    ("GET", "/api/search"): CostClass.HEAVY,
+    ("GET", "/api/duplicates/{collection}"): CostClass.HEAVY,
+    ("GET", "/api/admin/indexes/report"): CostClass.HEAVY,
+    ("POST", "/api/import/{collection}"): CostClass.BULK,
+    ("GET", "/api/export/{collection}"): CostClass.BULK,
+}
+
+# Long-lived streams, and the counters needed to diagnose an overload
+EXEMPT_ROUTES = {("GET", "/api/events"), ("GET", "/api/admin/admission")}
+
+TOKEN_COSTS = {CostClass.LIGHT: 1, CostClass.HEAVY: 5, CostClass.BULK: 20}
+
+RATE_LIMIT_PER_SECOND = float(os.environ.get('RATE_LIMIT_PER_SECOND', 20))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 100))
+RATE_LIMIT_MAX_TENANTS = 10000
+FORWARDED_ALLOW_IPS = frozenset(ip.strip() for ip in os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1').split(','))
+
+# (concurrency, queue size, max wait in seconds) per class
+DEFAULT_LIMITS = {
+    CostClass.LIGHT: (64, 256, 2.0),
+    CostClass.HEAVY: (8, 32, 2.0),
+    CostClass.BULK: (2, 4, 10.0),
+}
+
+WAIT_SAMPLES = 1024
+
+
+def class_limits(cost: CostClass) -> tuple:
+    concurrency, queue_size, max_wait = DEFAULT_LIMITS[cost]
+    prefix = f"ADMISSION_{cost.name}_"
+    return (
+        int(os.environ.get(prefix + "CONCURRENCY", concurrency)),
+        int(os.environ.get(prefix + "QUEUE", queue_size)),
+        float(os.environ.get(prefix + "MAX_WAIT", max_wait)),
+    )
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """FIFO semaphore with a bounded queue and a bounded wait."""
+
+    def __init__(self, concurrency: int, queue_size: int, max_wait: float):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        # Moving average of how long a request holds its slot, for Retry-After
+        self._service_seconds = 0.05
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.peak_queued = 0
+
+    def retry_after(self) -> int:
+        expected = self._service_seconds * (len(self._waiters) + 1) / self.concurrency
+        return max(1, math.ceil(expected))
+
+    async def acquire(self) -> float:
+        """Take a slot and return the seconds spent waiting for it, or raise ``Overloaded``."""
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self._admit(0.0)
+            return 0.0
+        if len(self._waiters) >= self.queue_size:
+            self.shed_queue_full += 1
+            raise Overloaded("queue full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            # release() may have handed us the slot just as the wait ran out
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                waiter.cancel()
+                self.shed_timeout += 1
+                raise Overloaded("wait timed out", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        waited = time.monotonic() - start
+        self._admit(waited)
+        return waited
+
+    def release(self, service_seconds: float):
+        self._service_seconds = 0.9 * self._service_seconds + 0.1 * service_seconds
+        # Hand the slot straight to the next waiter so a newcomer cannot overtake the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _admit(self, waited: float):
+        self.admitted += 1
+        self._waits.append(waited)
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 2) if waits else 0,
+            "wait_p99_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 2) if waits else 0,
+            "service_ms": round(self._service_seconds * 1000, 2),
+        }
+
+
+class TokenBuckets:
+    """One token bucket per tenant, the least recently used evicted beyond ``max_entries``."""
+
+    def __init__(self, rate: float, burst: float, max_entries: int = RATE_LIMIT_MAX_TENANTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self.limited = 0
+
+    def take(self, key: str, cost: float) -> float:
+        """Spend ``cost`` tokens; returns 0 if allowed, else the seconds until they are available."""
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / self.rate
+            self.limited += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tenants": len(self._buckets),
+            "limited": self.limited,
+        }
+
+
+class Admission:
+    """Limiters and buckets of one worker.
+
+    ``tenant_key(token)`` maps a bearer token to a stable tenant id, or
+    ``None`` if the token is not valid.
+    """
+
+    def __init__(self, router, tenant_key: Callable[[str], Optional[str]],
+                 trusted_proxies: frozenset = FORWARDED_ALLOW_IPS):
+        self.router = router
+        self.tenant_key = tenant_key
+        self.trusted_proxies = trusted_proxies
+        self.limiters = {cost: ConcurrencyLimiter(*class_limits(cost)) for cost in CostClass}
+        self.buckets = TokenBuckets(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+        self.route_path = lru_cache(maxsize=4096)(self._route_path)
+
+    def _route_path(self, method: str, path: str) -> Optional[str]:
+        scope = {"type": "http", "method": method, "path": path}
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return None
+
+    def tenant(self, scope) -> str:
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer":
+                    tenant = self.tenant_key(token)
+                    if tenant is not None:
+                        return f"user:{tenant}"
+                break
+        return f"addr:{self.client_address(scope)}"
+
+    def _trusted(self, address: str) -> bool:
+        return "*" in self.trusted_proxies or address in self.trusted_proxies
+
+    def client_address(self, scope) -> str:
+        """The peer address, or the client's as forwarded by a trusted proxy."""
+        client = scope.get("client")
+        address = client[0] if client else "unknown"
+        if not self._trusted(address):
+            return address
+        hops = [
+            hop.strip()
+            for name, value in scope["headers"] if name == b"x-forwarded-for"
+            for hop in value.decode("latin-1").split(",")
+        ]
+        # Walk back through our own proxies; hops further left are whatever the client sent
+        for hop in reversed(hops):
+            if hop and not self._trusted(hop):
+                return hop
+        return hops[0] if hops and hops[0] else address
+
+    def stats(self) -> dict:
+        return {
+            "classes": {cost.value: limiter.stats() for cost, limiter in self.limiters.items()},
+            "rate_limit": self.buckets.stats(),
+        }
+
+
+class AdmissionMiddleware:
+    """Plain ASGI middleware, so that streamed responses pass through untouched."""
+
+    def __init__(self, app, admission: Admission):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        admission = self.admission
+        route = (scope["method"], admission.route_path(scope["method"], scope["path"]))
+        if route in EXEMPT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        cost = ROUTE_COSTS.get(route, CostClass.LIGHT)
+        wait = admission.buckets.take(admission.tenant(scope), TOKEN_COSTS[cost])
+        if wait:
+            await self._reject(scope, receive, send, 429, "Rate limit exceeded", math.ceil(wait))
+            return
+        limiter = admission.limiters[cost]
+        try:
+            await limiter.acquire()
+        except Overloaded as e:
+            await self._reject(scope, receive, send, 503, f"Server is busy ({e.reason}), retry later", e.retry_after)
+            return
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.monotonic() - start)
+
+    @staticmethod
+    async def _reject(scope, receive, send, status_code: int, detail: str, retry_after: int):
+        response = JSONResponse({"detail": detail}, status_code=status_code, headers={"Retry-After": str(retry_after)})
+        await response(scope, receive, send)
@@ -0,0 +1,86 @@
+import asyncio
+from typing import Optional
+
+from models import LeadStage, DealStage
+
+ACTIVE_DEAL_STAGES = [DealStage.PROSPECT.value, DealStage.PROPOSAL.value, DealStage.NEGOTIATION.value]
+
+
+def scope_filter(owner_id: Optional[str] = None) -> dict:
+    # Admins see every document, everyone else only what they created
+    return {} if owner_id is None else {"created_by": owner_id}
+
+
+def lead_stats_pipeline(match: dict, key="$stage") -> list:
+    # One row per stage; the total is the sum of the rows
+    return [
+        {"$match": match},
+        {"$group": {"_id": key, "count": {"$sum": 1}}},
+    ]
+
+
+def deal_stats_pipeline(match: dict, key=None) -> list:
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": key,
+            "total_deals": {"$sum": 1},
+            "won_deals": {"$sum": {"$cond": [{"$eq": ["$stage", DealStage.WON.value]}, 1, 0]}},
+            "pipeline_value": {"$sum": {"$cond": [
+                {"$in": ["$stage", ACTIVE_DEAL_STAGES]},
+                {"$ifNull": ["$value", 0]},
+                0,
+            ]}},
+        }},
+    ]
+
+
+def contact_stats_pipeline(match: dict) -> list:
+    return [
+        {"$match": match},
+        {"$count": "total_contacts"},
+    ]
+
+
+async def _aggregate(collection, pipeline: list) -> list:
+    return await collection.aggregate(pipeline).to_list(None)
+
+
+def build_dashboard(lead_rows: list, deal_rows: list, contact_rows: list) -> dict:
+    lead_stages = {stage.value: 0 for stage in LeadStage}
+    for row in lead_rows:
+        if row["_id"] in lead_stages:
+            lead_stages[row["_id"]] = row["count"]
+    total_leads = sum(row["count"] for row in lead_rows)
+
+    deal_stats = deal_rows[0] if deal_rows else {}
+    total_deals = deal_stats.get("total_deals", 0)
+    won_deals = deal_stats.get("won_deals", 0)
+    pipeline_value = deal_stats.get("pipeline_value", 0)
+
+    total_contacts = contact_rows[0]["total_contacts"] if contact_rows else 0
+
+    return {
+        "total_leads": total_leads,
+        "total_contacts": total_contacts,
+        "total_deals": total_deals,
+        "won_deals": won_deals,
+        "pipeline_value": pipeline_value,
+        "conversion_rate": (won_deals / total_deals * 100) if total_deals > 0 else 0,
+        "lead_stages": lead_stages
+    }
+
+
+async def compute_dashboard(db, owner_id: Optional[str] = None) -> dict:
+    """Compute every dashboard figure with a single aggregation per collection.
+
+    The three pipelines are independent so they run concurrently; the whole
+    dashboard costs one round trip of latency instead of one per figure.
+    """
+    match = scope_filter(owner_id)
+    lead_rows, deal_rows, contact_rows = await asyncio.gather(
+        _aggregate(db.leads, lead_stats_pipeline(match)),
+        _aggregate(db.deals, deal_stats_pipeline(match)),
+        _aggregate(db.contacts, contact_stats_pipeline(match)),
+    )
+    return build_dashboard(lead_rows, deal_rows, contact_rows)
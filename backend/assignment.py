@@ -0,0 +1,219 @@
+"""Automatic assignment of new leads across a pool of users.
+
+``LEAD_ASSIGNMENT`` selects who gets a lead created without ``assigned_to``:
+
+* ``manual`` (default): nobody, the lead stays unassigned until it is set.
+* ``round_robin``: the pool member with the fewest assignments so far.
+* ``least_loaded``: the member with the fewest open (not converted) leads,
+  ties going round robin.
+
+The pool is the ``assignees`` collection, one document per user, managed
+through ``/api/admin/assignees``::
+
+    {"_id": <user id>, "sources": [...], "active": true, "open_leads": 12, "assigned": 340}
+
+A member only takes leads from its ``sources`` (every source by default),
+which is how leads of a source are routed to a team.
+
+Picking a member is one ``find_one_and_update``: it takes the first eligible
+member in the strategy's order (index backed; the pool is small anyway) and
+``$inc``s its counters in the same atomic write, so concurrent creates in
+any number of workers each take their own turn and ``leads`` is never
+scanned.  Imports take the turns of a whole batch in memory instead
+(``assign_leads``: one read of the pool and one ``$inc`` per member), and
+updates, merges and deletes that open, close or reassign a lead ``$inc``
+the load of the members involved.
+
+The counters are only maintained while a strategy is on, and they can drift
+(a crash between the pick and the insert, data edited outside the API);
+``reconcile`` recounts the open leads of every member.  Run it after
+switching a strategy on, and from time to time:
+
+    cd backend && python -m assignment [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+from enum import Enum
+from typing import Optional
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+
+from models import LeadSource, LeadStage, enum_value
+from storage import command_db
+
+class AssignmentStrategy(str, Enum):
+    MANUAL = "manual"
+    ROUND_ROBIN = "round_robin"
+    LEAST_LOADED = "least_loaded"
+
+LEAD_ASSIGNMENT = AssignmentStrategy(os.environ.get('LEAD_ASSIGNMENT', AssignmentStrategy.MANUAL.value))
+
+# Which eligible member a strategy picks first; _id makes the order total
+PICK_ORDER = {
+    AssignmentStrategy.ROUND_ROBIN: [("assigned", ASCENDING), ("_id", ASCENDING)],
+    AssignmentStrategy.LEAST_LOADED: [("open_leads", ASCENDING), ("assigned", ASCENDING), ("_id", ASCENDING)],
+}
+
+ASSIGNEE_INDEXES = [
+    IndexModel([("active", ASCENDING), ("sources", ASCENDING)] + order)
+    for order in PICK_ORDER.values()
+]
+
+
+def is_open(lead: dict) -> bool:
+    return enum_value(lead.get("stage")) != LeadStage.CONVERTED.value
+
+
+def load_delta(before: Optional[dict], after: Optional[dict]) -> dict:
+    """``{user id: change in open leads}`` of a lead going from ``before`` to ``after`` (None if absent)."""
+    delta = {}
+    for lead, sign in ((before, -1), (after, 1)):
+        if lead is not None and lead.get("assigned_to") and is_open(lead):
+            delta[lead["assigned_to"]] = delta.get(lead["assigned_to"], 0) + sign
+    return {user_id: change for user_id, change in delta.items() if change}
+
+
+async def track_load(db, before: Optional[dict], after: Optional[dict], strategy: AssignmentStrategy = LEAD_ASSIGNMENT):
+    """Apply the ``load_delta`` of a lead change to the members involved."""
+    if strategy == AssignmentStrategy.MANUAL:
+        return
+    delta = load_delta(before, after)
+    if delta:
+        await db.assignees.bulk_write(
+            [UpdateOne({"_id": user_id}, {"$inc": {"open_leads": change}}) for user_id, change in delta.items()],
+            ordered=False,
+        )
+
+
+async def assign_lead(db, lead: dict, strategy: AssignmentStrategy = LEAD_ASSIGNMENT) -> dict:
+    """Set ``assigned_to`` of a new lead that has none and count the lead in its assignee's load.
+
+    The lead stays unassigned if no active member takes its source.
+    """
+    if strategy == AssignmentStrategy.MANUAL:
+        return lead
+    if lead.get("assigned_to"):
+        await track_load(db, None, lead, strategy)
+        return lead
+    member = await db.assignees.find_one_and_update(
+        {"active": True, "sources": enum_value(lead.get("source"))},
+        {"$inc": {"assigned": 1, "open_leads": 1 if is_open(lead) else 0}},
+        projection={"_id": 1},
+        sort=PICK_ORDER[strategy],
+    )
+    if member is not None:
+        lead["assigned_to"] = member["_id"]
+    return lead
+
+
+async def assign_leads(db, leads: list, strategy: AssignmentStrategy = LEAD_ASSIGNMENT) -> list:
+    """``assign_lead`` for a batch of new leads, with one read of the pool and one write.
+
+    Turns are taken in memory in the strategy's order, so the batch spreads
+    as the same creates one by one would.  Creates racing the batch can make
+    the spread a little uneven, but every counter still gets its ``$inc``.
+    """
+    if strategy == AssignmentStrategy.MANUAL or not leads:
+        return leads
+    members = await db.assignees.find({"active": True}, {"sources": 1, "assigned": 1, "open_leads": 1}).to_list(None)
+    order = [field for field, _ in PICK_ORDER[strategy]]
+    incs = {}
+    for lead in leads:
+        user_id = lead.get("assigned_to")
+        if not user_id:
+            source = enum_value(lead.get("source"))
+            eligible = [member for member in members if source in member["sources"]]
+            if not eligible:
+                continue
+            member = min(eligible, key=lambda member: [member[field] for field in order])
+            member["assigned"] += 1
+            member["open_leads"] += is_open(lead)
+            user_id = lead["assigned_to"] = member["_id"]
+            counts = incs.setdefault(user_id, {"assigned": 0, "open_leads": 0})
+            counts["assigned"] += 1
+        elif is_open(lead):
+            counts = incs.setdefault(user_id, {"assigned": 0, "open_leads": 0})
+        else:
+            continue
+        counts["open_leads"] += is_open(lead)
+    if incs:
+        await db.assignees.bulk_write(
+            [UpdateOne({"_id": user_id}, {"$inc": counts}) for user_id, counts in incs.items()], ordered=False,
+        )
+    return leads
+
+
+async def _round_robin_start(db) -> int:
+    """Assignments a (re)joining member starts from, so that it does not take every lead until it catches up."""
+    first = await db.assignees.find_one({"active": True}, {"assigned": 1}, sort=[("assigned", ASCENDING)])
+    return first["assigned"] if first else 0
+
+
+async def set_assignee(db, user_id: str, sources: Optional[list], active: bool) -> dict:
+    """Add a user to the pool or change its sources and active flag; returns the member."""
+    member = await db.assignees.find_one({"_id": user_id})
+    changes = {"sources": [enum_value(source) for source in (sources or list(LeadSource))], "active": active}
+    if member is None:
+        # Backed by the (assigned_to, created_at, id) index of filter[assigned_to]
+        changes["open_leads"] = await db.leads.count_documents(
+            {"assigned_to": user_id, "stage": {"$ne": LeadStage.CONVERTED.value}}
+        )
+    if member is None or (active and not member["active"]):
+        # An inactive member takes no turns, so nothing races this write
+        changes["assigned"] = max(await _round_robin_start(db), member["assigned"] if member else 0)
+    return await db.assignees.find_one_and_update(
+        {"_id": user_id}, {"$set": changes}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+
+
+async def remove_assignee(db, user_id: str) -> bool:
+    return await db.assignees.find_one_and_delete({"_id": user_id}) is not None
+
+
+async def reconcile(db, dry_run: bool = False) -> dict:
+    """Recount the open leads of every member; returns ``{user id: {"stored", "expected"}}`` of the drifted ones.
+
+    A lead assigned between the count and the ``$set`` is missing from its
+    member's load.  Only ``least_loaded`` reads the load, and there that
+    member just carries one lead more than its turns assume until the next
+    recount.
+    """
+    stored = {member["_id"]: member.get("open_leads", 0) async for member in db.assignees.find({}, {"open_leads": 1})}
+    rows = await db.leads.aggregate([
+        {"$match": {"assigned_to": {"$in": list(stored)}, "stage": {"$ne": LeadStage.CONVERTED.value}}},
+        {"$group": {"_id": "$assigned_to", "open_leads": {"$sum": 1}}},
+    ]).to_list(None)
+    expected = {row["_id"]: row["open_leads"] for row in rows}
+    report = {
+        user_id: {"stored": count, "expected": expected.get(user_id, 0)}
+        for user_id, count in stored.items()
+        if count != expected.get(user_id, 0)
+    }
+    if report and not dry_run:
+        await db.assignees.bulk_write(
+            [UpdateOne({"_id": user_id}, {"$set": {"open_leads": counts["expected"]}}) for user_id, counts in report.items()],
+            ordered=False,
+        )
+    return report
+
+
+async def _main(dry_run: bool):
+    async with command_db() as db:
+        report = await reconcile(db, dry_run=dry_run)
+    if not report:
+        print("Assignee counters are consistent")
+    for user_id, counts in sorted(report.items()):
+        print(f"{user_id}: open_leads stored={counts['stored']} expected={counts['expected']}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recount the open leads of the assignment pool")
+    parser.add_argument("--dry-run", action="store_true", help="only report drift, do not rewrite counters")
+    args = parser.parse_args()
+    asyncio.run(_main(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
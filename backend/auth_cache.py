@@ -0,0 +1,88 @@
+"""Bounded LRU+TTL caches used by ``get_current_user``.
+
+Tokens are cached until they expire (the token -> email mapping never
+changes), users for a short configurable window so that a deactivated or
+edited user is picked up by every worker within that window even though
+invalidation is only in-process.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, deadline = entry
+        if deadline <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else 0,
+        }
+
+
+class AuthCache:
+    def __init__(self, max_entries: int, user_ttl_seconds: float, token_ttl_seconds: float):
+        self.tokens = TTLCache(max_entries, token_ttl_seconds)
+        self.users = TTLCache(max_entries, user_ttl_seconds)
+
+    def get_email(self, token: str) -> Optional[str]:
+        return self.tokens.get(token)
+
+    def set_email(self, token: str, email: str, expires_at: Optional[float] = None):
+        # Never outlive the token itself
+        ttl = None if expires_at is None else expires_at - time.time()
+        self.tokens.set(token, email, ttl)
+
+    def get_user(self, email: str):
+        return self.users.get(email)
+
+    def set_user(self, email: str, user):
+        self.users.set(email, user)
+
+    def invalidate_user(self, email: str):
+        self.users.invalidate(email)
+
+    def stats(self) -> dict:
+        return {"tokens": self.tokens.stats(), "users": self.users.stats()}
@@ -0,0 +1,135 @@
+"""Contention of automatic lead assignment under bursts of creates.
+
+Puts ``--assignees`` users in the assignment pool, then sends ``--creates``
+``POST /api/leads`` through the full route stack from ``--concurrency``
+concurrent clients in each of ``--workers`` processes (each with its own
+``server`` import, like uvicorn workers; the in-memory engine only supports
+one).  Besides creates per second and latency it checks the outcome: every
+create must have been counted exactly once (the members' ``assigned`` add up
+to the creates), round robin must spread them evenly (``spread`` is the
+largest minus the smallest count), and ``reconcile`` must find no drift in
+the open-lead counters.  ``--strategy manual`` is the baseline without
+assignment.
+
+    cd backend && python -m benchmarks.assignment --engine mongo --workers 4
+    cd backend && python -m benchmarks.assignment --engine memory --strategy least_loaded
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+from benchmarks.common import asgi_request, bench_server, summarize
+
+ADMIN_EMAIL = "bench-assign-admin@example.com"
+
+
+async def fire(app, token: str, creates: int, concurrency: int, offset: int) -> tuple:
+    """Send ``creates`` lead creates from ``concurrency`` clients; returns ``(latencies in ms, statuses)``."""
+    samples, statuses = [], {}
+    remaining = iter(range(offset, offset + creates))
+
+    async def client():
+        for number in remaining:
+            body = {"name": f"Burst {number}", "email": f"burst{number}@example.com"}
+            start = time.perf_counter()
+            status, _ = await asgi_request(app, "POST", "/api/leads", token, body=body)
+            samples.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples, statuses
+
+
+async def run_worker(engine: str, creates: int, concurrency: int, offset: int) -> tuple:
+    server = bench_server(engine)
+    await server.app.router.startup()
+    try:
+        token = server.create_access_token({"sub": ADMIN_EMAIL})
+        return await fire(server.app, token, creates, concurrency, offset)
+    finally:
+        await server.app.router.shutdown()
+
+
+def worker(engine: str, strategy: str, creates: int, concurrency: int, offset: int) -> tuple:
+    os.environ['LEAD_ASSIGNMENT'] = strategy
+    return asyncio.run(run_worker(engine, creates, concurrency, offset))
+
+
+async def seed_pool(db, assignees: int) -> list:
+    """A bench admin and ``assignees`` pool members; clears earlier bench leads and the pool."""
+    from assignment import set_assignee
+    from models import User, UserRole
+
+    emails = [ADMIN_EMAIL] + [f"bench-rep-{i}@example.com" for i in range(assignees)]
+    await db.users.delete_many({"email": {"$in": emails}})
+    users = [User(id="bench-assign-admin", email=emails[0], full_name="Bench Admin", role=UserRole.ADMIN)]
+    users += [
+        User(id=f"bench-rep-{i}", email=email, full_name=email, role=UserRole.CUSTOMER)
+        for i, email in enumerate(emails[1:])
+    ]
+    await db.users.insert_many([user.dict() for user in users])
+    await db.leads.delete_many({"created_by": users[0].id})
+    await db.assignees.delete_many({})
+    for user in users[1:]:
+        await set_assignee(db, user.id, None, True)
+    return users
+
+
+async def run(engine: str, strategy: str, workers: int, creates: int, concurrency: int, assignees: int):
+    os.environ['LEAD_ASSIGNMENT'] = strategy
+    server = bench_server(engine)
+    from assignment import reconcile
+
+    app, db = server.app, server.db
+    await app.router.startup()
+    try:
+        await seed_pool(db, assignees)
+        per_worker = creates // workers
+        start = time.perf_counter()
+        if workers == 1:
+            token = server.create_access_token({"sub": ADMIN_EMAIL})
+            results = [await fire(app, token, per_worker, concurrency, 0)]
+        else:
+            with multiprocessing.get_context("spawn").Pool(workers) as pool:
+                args = [(engine, strategy, per_worker, concurrency, i * per_worker) for i in range(workers)]
+                results = await asyncio.get_running_loop().run_in_executor(None, pool.starmap, worker, args)
+        elapsed = time.perf_counter() - start
+
+        samples = [sample for worker_samples, _ in results for sample in worker_samples]
+        statuses = {}
+        for _, worker_statuses in results:
+            for status, count in worker_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+        members = await db.assignees.find({}).to_list(None)
+        assigned = [member["assigned"] for member in members]
+        print(json.dumps({
+            "engine": engine, "strategy": strategy, "workers": workers, "concurrency": concurrency,
+            "assignees": assignees, "creates": len(samples), "status": statuses,
+            "creates_per_second": round(len(samples) / elapsed), **summarize(samples),
+            "assigned": sum(assigned), "open_leads": sum(member["open_leads"] for member in members),
+            "spread": max(assigned) - min(assigned),
+            "drifted_assignees": len(await reconcile(db, dry_run=True)),
+        }))
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--strategy", choices=["manual", "round_robin", "least_loaded"], default="round_robin")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--creates", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--assignees", type=int, default=20)
+    args = parser.parse_args()
+    if args.engine == "memory" and args.workers != 1:
+        parser.error("the in-memory engine is per process; use --engine mongo for several workers")
+    asyncio.run(run(args.engine, args.strategy, args.workers, args.creates, args.concurrency, args.assignees))
+
+
+if __name__ == "__main__":
+    main()
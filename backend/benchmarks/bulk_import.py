@@ -0,0 +1,100 @@
+"""Rows per second of the bulk import pipeline on a single worker.
+
+Feeds a generated CSV/NDJSON body in 64 KiB chunks (what Starlette hands the
+route) through ``bulk_import.import_records`` and reports two rates:
+``prepare_rows_per_s`` runs every batch through ``prepare_batch``, the CPU
+side of the import (parsing, validation, search prefixes, dedupe keys,
+assignment and scoring) without the inserts, and ``end_to_end_rows_per_s``
+is the whole import.  Each row also says how far it is from the 50k rows/s
+target, which a single worker does not reach: on the memory engine the
+prepare path alone costs ~45-50 us per row (~20k rows/s; validation and
+search prefixes are most of it) and the whole import runs at ~10-12k
+rows/s, so it takes four or five workers (or importers) to get there.
+
+    cd backend && python -m benchmarks.bulk_import --rows 200000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bulk_import import (
+    IMPORT_BATCH_SIZE, ImportCollection, ImportFormat, ImportReport, import_records, parse_body, prepare_batch,
+)
+from benchmarks.common import bench_db
+
+CHUNK_SIZE = 64 * 1024
+TARGET_ROWS_PER_S = 50000
+
+
+def make_body(rows: int, import_format: ImportFormat) -> bytes:
+    domains = ["example.com", "acme.io", "globex.net", "initech.org"]
+    records = [
+        {"name": f"Lead {i}", "email": f"lead{i}@{domains[i % len(domains)]}", "company": "Acme", "source": "campaign"}
+        for i in range(rows)
+    ]
+    if import_format == ImportFormat.NDJSON:
+        return "\n".join(json.dumps(record) for record in records).encode()
+    lines = ["name,email,company,source"]
+    lines += [f"{r['name']},{r['email']},{r['company']},{r['source']}" for r in records]
+    return "\n".join(lines).encode()
+
+
+async def chunked(body: bytes):
+    for start in range(0, len(body), CHUNK_SIZE):
+        yield body[start:start + CHUNK_SIZE]
+
+
+async def prepare_only(db, body: bytes, import_format: ImportFormat) -> int:
+    report = ImportReport()
+    rows, prepared = [], 0
+    async for row in parse_body(chunked(body), import_format):
+        rows.append(row)
+        if len(rows) >= IMPORT_BATCH_SIZE:
+            prepared += len((await prepare_batch(db, ImportCollection.LEADS, rows, "bench-owner", report))[0])
+            rows = []
+    return prepared + len((await prepare_batch(db, ImportCollection.LEADS, rows, "bench-owner", report))[0])
+
+
+async def run(rows: int):
+    client, db = bench_db()
+    results = []
+    try:
+        for import_format in ImportFormat:
+            body = make_body(rows, import_format)
+
+            start = time.perf_counter()
+            await prepare_only(db, body, import_format)
+            prepare_seconds = time.perf_counter() - start
+
+            await db.leads.delete_many({})
+            start = time.perf_counter()
+            report = await import_records(db, ImportCollection.LEADS, parse_body(chunked(body), import_format), "bench-owner")
+            total_seconds = time.perf_counter() - start
+
+            row = {
+                "format": import_format.value,
+                "rows": rows,
+                "inserted": report["inserted"],
+                "prepare_rows_per_s": round(rows / prepare_seconds),
+                "end_to_end_rows_per_s": round(rows / total_seconds),
+                "target_rows_per_s": TARGET_ROWS_PER_S,
+                "shortfall_rows_per_s": max(0, TARGET_ROWS_PER_S - round(rows / total_seconds)),
+            }
+            results.append(row)
+            print(json.dumps(row))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows))
+
+
+if __name__ == "__main__":
+    main()
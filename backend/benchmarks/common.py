@@ -0,0 +1,158 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway database next to the one configured in
+``backend/.env`` (``<DB_NAME>_bench``) and are started from the backend
+directory, e.g. ``python -m benchmarks.dashboard``.  With
+``STORAGE_ENGINE=memory`` they run against the in-memory engine instead,
+which leaves only the application's own cost in the numbers.
+"""
+import importlib
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlencode
+
+import orjson
+from dotenv import load_dotenv
+
+from models import LeadStage, LeadSource, DealStage
+from storage import StorageEngine, open_storage
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+OWNER_COUNT = 50
+INSERT_BATCH = 10000
+
+
+def bench_db():
+    engine = StorageEngine(os.environ.get('STORAGE_ENGINE', StorageEngine.MONGO.value))
+    return open_storage(engine, os.environ.get('MONGO_URL'), os.environ.get('DB_NAME', 'crm') + "_bench")
+
+
+def bench_server(engine: Optional[str] = None, rate_limits: bool = False):
+    """Import ``server`` on the benchmark database (or ``engine``), by default without per-tenant rate limits.
+
+    A benchmark client would otherwise be throttled long before the stack is
+    measured; admission concurrency limits stay as configured.
+    """
+    if engine is not None:
+        os.environ['STORAGE_ENGINE'] = engine
+    os.environ['DB_NAME'] = os.environ.get('DB_NAME', 'crm') + "_bench"
+    if not rate_limits:
+        os.environ.setdefault('RATE_LIMIT_PER_SECOND', '1000000')
+        os.environ.setdefault('RATE_LIMIT_BURST', '1000000')
+    return importlib.import_module("server")
+
+
+async def asgi_request(app, method: str, path: str, token: Optional[str] = None, params: Optional[dict] = None,
+                       body=None) -> tuple:
+    """``(status, body)`` of one request sent straight to the ASGI ``app``, with no client or socket."""
+    headers = [(b"host", b"bench"), (b"content-type", b"application/json")]
+    if token is not None:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(params or {}).encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    messages = [{"type": "http.request", "body": orjson.dumps(body) if body is not None else b"", "more_body": False}]
+    response = {"status": None, "body": []}
+
+    async def receive():
+        return messages.pop() if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+def owner_ids(count: int = OWNER_COUNT) -> list:
+    return [f"bench-owner-{i}" for i in range(count)]
+
+
+def fake_lead(owner: str, now: datetime) -> dict:
+    created = now - timedelta(minutes=random.randint(0, 60 * 24 * 365))
+    return {
+        "id": str(uuid.uuid4()),
+        "name": f"Lead {random.randint(0, 10**6)}",
+        "email": f"lead{random.randint(0, 10**9)}@example.com",
+        "phone": None,
+        "company": random.choice([None, "Acme", "Globex", "Initech", "Umbrella"]),
+        "stage": random.choice(list(LeadStage)).value,
+        "source": random.choice(list(LeadSource)).value,
+        "notes": None,
+        "assigned_to": None,
+        "created_by": owner,
+        "created_at": created,
+        "updated_at": created,
+    }
+
+
+def fake_deal(owner: str, now: datetime) -> dict:
+    created = now - timedelta(minutes=random.randint(0, 60 * 24 * 365))
+    return {
+        "id": str(uuid.uuid4()),
+        "title": f"Deal {random.randint(0, 10**6)}",
+        "value": round(random.uniform(500, 100000), 2),
+        "expected_close_date": now + timedelta(days=random.randint(-90, 270)),
+        "stage": random.choice(list(DealStage)).value,
+        "description": None,
+        "contact_id": str(uuid.uuid4()),
+        "created_by": owner,
+        "created_at": created,
+        "updated_at": created,
+    }
+
+
+async def seed(collection, factory, total: int, owners: list):
+    """Fill ``collection`` with ``total`` generated documents spread over ``owners``."""
+    await collection.delete_many({})
+    now = datetime.utcnow()
+    inserted = 0
+    while inserted < total:
+        size = min(INSERT_BATCH, total - inserted)
+        docs = [factory(owners[(inserted + i) % len(owners)], now) for i in range(size)]
+        await collection.insert_many(docs, ordered=False)
+        inserted += size
+
+
+async def measure(fn, repeat: int) -> dict:
+    """Await ``fn()`` ``repeat`` times and summarize the latencies in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples: list) -> dict:
+    """Latency percentiles of ``samples`` (milliseconds)."""
+    samples = sorted(samples)
+    return {
+        "min_ms": round(samples[0], 2),
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+        "max_ms": round(samples[-1], 2),
+    }
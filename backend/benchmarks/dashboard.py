@@ -0,0 +1,65 @@
+"""Latency of /api/analytics/dashboard at increasing data volumes.
+
+Compares the aggregation engine in ``analytics.compute_dashboard`` with the
+previous implementation (one ``count_documents`` per figure plus a capped
+``find`` for the pipeline value) for admin and customer scope.
+
+    cd backend && python -m benchmarks.dashboard --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+
+from analytics import ACTIVE_DEAL_STAGES, compute_dashboard
+from indexes import ensure_indexes
+from models import LeadStage, DealStage
+from benchmarks.common import bench_db, fake_deal, fake_lead, measure, owner_ids, seed
+
+
+async def legacy_dashboard(db, owner_id=None):
+    match = {} if owner_id is None else {"created_by": owner_id}
+    total_leads = await db.leads.count_documents(match)
+    total_contacts = await db.contacts.count_documents(match)
+    total_deals = await db.deals.count_documents(match)
+    won_deals = await db.deals.count_documents({**match, "stage": DealStage.WON})
+    pipeline_value = 0
+    active_deals = await db.deals.find({**match, "stage": {"$in": ACTIVE_DEAL_STAGES}}).to_list(1000)
+    for deal in active_deals:
+        pipeline_value += deal.get("value", 0)
+    lead_stages = {}
+    for stage in LeadStage:
+        lead_stages[stage.value] = await db.leads.count_documents({**match, "stage": stage})
+    return total_leads, total_contacts, total_deals, won_deals, pipeline_value, lead_stages
+
+
+async def run(sizes, repeat):
+    client, db = bench_db()
+    owners = owner_ids()
+    results = []
+    try:
+        await ensure_indexes(db)
+        for size in sizes:
+            await seed(db.leads, fake_lead, size, owners)
+            await seed(db.deals, fake_deal, size, owners)
+            for scope, owner_id in (("admin", None), ("customer", owners[0])):
+                for name, fn in (("aggregation", compute_dashboard), ("legacy", legacy_dashboard)):
+                    stats = await measure(lambda: fn(db, owner_id), repeat)
+                    row = {"documents": size, "scope": scope, "engine": name, **stats}
+                    results.append(row)
+                    print(json.dumps(row))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
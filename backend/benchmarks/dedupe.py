@@ -0,0 +1,108 @@
+"""Throughput of the dedupe batch job and latency of the create-time check.
+
+Seeds leads of which ``--duplicate-ratio`` are re-entries of an earlier lead
+with the usual variations (case, ``+tag`` and dots in Gmail addresses,
+formatted phone numbers, reordered names, legal suffixes), then times the
+batch job end to end and ``find_possible_duplicates`` for customer scope.
+The create-time target is a p99 under 5 ms.
+
+    cd backend && python -m benchmarks.dedupe --sizes 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from dedupe import DedupeCollection, find_possible_duplicates, run_dedupe, set_dedupe_keys
+from indexes import ensure_indexes
+from benchmarks.common import bench_db, fake_lead, measure, owner_ids, seed
+from benchmarks.search import COMPANIES, FIRST_NAMES, LAST_NAMES
+
+
+def unique_lead(owner, now):
+    lead = fake_lead(owner, now)
+    first, last = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+    number = random.randint(0, 10**7)
+    lead.update({
+        "name": f"{first} {last}",
+        "email": f"{first}.{last}{number}@gmail.com".lower(),
+        "phone": f"555{number:07d}",
+        "company": f"{random.choice(COMPANIES)} Inc",
+    })
+    return lead
+
+
+def variant(lead):
+    """The same person entered again, slightly differently."""
+    first, last = lead["name"].split(" ", 1)
+    local, domain = lead["email"].lower().split("@")
+    phone = lead["phone"]
+    return {
+        **lead,
+        "name": random.choice([f"{last} {first}", lead["name"].upper()]),
+        "email": random.choice([f"{local.replace('.', '').split('+')[0]}+crm@{domain}", lead["email"].upper()]),
+        "phone": phone and random.choice([None, f"+1 ({phone[:3]}) {phone[3:6]}-{phone[6:]}"]),
+        "company": lead["company"].replace(" Inc", " Incorporated"),
+    }
+
+
+def lead_factory(duplicate_ratio):
+    recent = []
+
+    def factory(owner, now):
+        if recent and random.random() < duplicate_ratio:
+            # Variants keep the original's owner, duplicates are only looked for within a scope
+            lead = {**variant(random.choice(recent)), "id": fake_lead(owner, now)["id"]}
+        else:
+            lead = unique_lead(owner, now)
+            recent.append(lead)
+            del recent[:-1000]
+        return set_dedupe_keys(lead)
+    return factory
+
+
+async def run(sizes, repeat, duplicate_ratio):
+    client, db = bench_db()
+    owners = owner_ids()
+    results = []
+    try:
+        await ensure_indexes(db)
+        for size in sizes:
+            await seed(db.leads, lead_factory(duplicate_ratio), size, owners)
+            await db.duplicate_candidates.delete_many({})
+            start = time.perf_counter()
+            report = await run_dedupe(db, [DedupeCollection.LEADS])
+            elapsed = time.perf_counter() - start
+            row = {"documents": size, "job": "batch", "seconds": round(elapsed, 2),
+                   "docs_per_second": round(size / elapsed), **report[DedupeCollection.LEADS.value]}
+            results.append(row)
+            print(json.dumps(row))
+
+            # Re-entries of existing leads, so the check finds (and scores) real matches
+            originals = await db.leads.find({"created_by": owners[0]}, {"_id": 0}).limit(repeat).to_list(repeat)
+            samples = [set_dedupe_keys({**variant(lead), "id": None}) for lead in originals]
+            samples *= repeat // max(len(samples), 1) + 1
+            stats = await measure(
+                lambda: find_possible_duplicates(db, DedupeCollection.LEADS, samples.pop(), owners[0]), repeat
+            )
+            row = {"documents": size, "job": "create check", **stats}
+            results.append(row)
+            print(json.dumps(row))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat, args.duplicate_ratio))
+
+
+if __name__ == "__main__":
+    main()
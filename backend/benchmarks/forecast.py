@@ -0,0 +1,89 @@
+"""Cost of /api/analytics/forecast at increasing deal volumes.
+
+Times the endpoint's computation end to end (both column reads plus the
+bucketing) and, on the same already loaded deals, the vectorized bucketing
+against the equivalent loop over dicts it replaces.
+
+    cd backend && python -m benchmarks.forecast --sizes 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from analytics import ACTIVE_DEAL_STAGES
+from forecast import STAGE_PROBABILITIES, compute_forecast, month_start, pipeline_buckets, read_columns
+from indexes import ensure_indexes
+from benchmarks.common import bench_db, fake_deal, measure, owner_ids, seed
+
+MONTHS_AHEAD = 12
+
+
+def loop_buckets(docs: list, now: datetime) -> dict:
+    """The per-dict implementation, kept as the baseline."""
+    first = now.strftime("%Y-%m")
+    buckets = defaultdict(lambda: {"deals": 0, "value": 0.0, "weighted_value": 0.0})
+    for doc in docs:
+        month = doc["expected_close_date"].strftime("%Y-%m")
+        if month < first:
+            continue
+        bucket = buckets[(month, doc["stage"])]
+        bucket["deals"] += 1
+        bucket["value"] += doc["value"]
+        bucket["weighted_value"] += doc["value"] * STAGE_PROBABILITIES[doc["stage"]]
+    return buckets
+
+
+async def run(sizes, repeat):
+    client, db = bench_db()
+    owners = owner_ids()
+    results = []
+    try:
+        await ensure_indexes(db)
+        for size in sizes:
+            await seed(db.deals, fake_deal, size, owners)
+            now = datetime.utcnow()
+            for scope, owner_id in (("admin", None), ("customer", owners[0])):
+                stats = await measure(lambda: compute_forecast(db, owner_id, MONTHS_AHEAD, 12, now), repeat)
+                row = {"deals": size, "scope": scope, "stage": "endpoint", **stats}
+                results.append(row)
+                print(json.dumps(row))
+
+            query = {"stage": {"$in": ACTIVE_DEAL_STAGES}}
+            start = time.perf_counter()
+            columns = await read_columns(db.deals, query, "expected_close_date")
+            load_ms = (time.perf_counter() - start) * 1000
+            docs = await db.deals.find(query, {"_id": 0, "value": 1, "stage": 1, "expected_close_date": 1}).to_list(None)
+            current = month_start(now)
+            for name, fn in (
+                ("numpy", lambda: pipeline_buckets(*columns, current, MONTHS_AHEAD)),
+                ("dict loop", lambda: loop_buckets(docs, now)),
+            ):
+                samples = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    fn()
+                    samples.append((time.perf_counter() - start) * 1000)
+                row = {"deals": size, "scope": "admin", "stage": f"bucketing ({name})",
+                       "open_deals": len(docs), "column_load_ms": round(load_ms, 2),
+                       "min_ms": round(min(samples), 2), "p50_ms": round(sorted(samples)[len(samples) // 2], 2)}
+                results.append(row)
+                print(json.dumps(row))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
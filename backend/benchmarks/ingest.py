@@ -0,0 +1,90 @@
+"""Lead ingestion throughput and latency: per-request writes against group commit.
+
+``--clients`` concurrent clients each create ``--per-client`` leads back to
+back, the way a burst of web-form posts reaches one worker.  ``direct`` is
+the per-request path (``insert_one``-sized ``commit_created`` per lead),
+``group_commit`` waits on a shared ``WriteBuffer`` batch and
+``write_behind`` only waits to be queued; its elapsed time includes draining
+the buffer, so throughput counts stored leads in every mode.
+
+    cd backend && python -m benchmarks.ingest --clients 1 16 64 256
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from bulk_import import ImportCollection
+from indexes import ensure_indexes
+from write_buffer import INGEST_BATCH_SIZE, INGEST_MAX_DELAY_MS, IngestMode, WriteBuffer, commit_created
+from benchmarks.common import bench_db, fake_lead, owner_ids, summarize
+
+
+async def run_clients(create, clients: int, per_client: int, owners: list) -> list:
+    async def client(index: int) -> list:
+        samples = []
+        for _ in range(per_client):
+            lead = fake_lead(owners[index % len(owners)], datetime.utcnow())
+            start = time.perf_counter()
+            await create(lead)
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples
+
+    results = await asyncio.gather(*(client(index) for index in range(clients)))
+    return [sample for samples in results for sample in samples]
+
+
+async def run(client_counts, per_client, batch_size, max_delay_ms):
+    client, db = bench_db()
+    owners = owner_ids()
+    try:
+        await ensure_indexes(db)
+        for clients in client_counts:
+            for mode in IngestMode:
+                await db.leads.delete_many({})
+                buffer = None
+                if mode == IngestMode.DIRECT:
+                    async def create(lead):
+                        await commit_created(db, ImportCollection.LEADS, [lead])
+                else:
+                    buffer = WriteBuffer(db, ImportCollection.LEADS, batch_size, max_delay_ms)
+                    buffer.start()
+                    wait = mode == IngestMode.GROUP_COMMIT
+
+                    async def create(lead):
+                        await buffer.submit(lead, wait=wait)
+
+                start = time.perf_counter()
+                samples = await run_clients(create, clients, per_client, owners)
+                if buffer is not None:
+                    await buffer.close()
+                elapsed = time.perf_counter() - start
+
+                stored = await db.leads.count_documents({})
+                row = {
+                    "mode": mode.value,
+                    "clients": clients,
+                    "leads": stored,
+                    "leads_per_s": round(stored / elapsed),
+                    **summarize(samples),
+                }
+                if buffer is not None:
+                    row["batches"] = buffer.batches
+                print(json.dumps(row))
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--per-client", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--max-delay-ms", type=float, default=INGEST_MAX_DELAY_MS)
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.per_client, args.batch_size, args.max_delay_ms))
+
+
+if __name__ == "__main__":
+    main()
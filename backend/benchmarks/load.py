@@ -0,0 +1,339 @@
+"""Load test of the API: requests per second and p50/p95/p99 per route.
+
+Seeds ``--leads`` leads and ``--deals`` deals over ``--users`` customers (and
+an admin) into the benchmark database, ``<DB_NAME>_bench`` on ``MONGO_URL``,
+or the in-process engine with ``--engine memory``.  Virtual users then send
+requests drawn from a ``MIXES`` entry to ``server.app``, through the whole
+middleware stack but without sockets.  The load generator shares the
+process with the app, so the numbers are per worker.
+
+* closed loop (default): ``--concurrency`` virtual users, each sending its
+  next request as soon as the previous one is answered.
+* open loop (``--rate``): requests start every ``1/rate`` seconds whatever
+  the backlog, and latency counts from the scheduled start, so a stalled
+  server shows up as latency instead of as fewer requests.
+
+Every run uses the same data and request sequence for a given ``--seed``.
+The report is written as JSON (``--output``, by default
+``benchmarks/results/load-<mix>-<commit>.json``) with the commit and the
+settings.  ``--baseline`` compares it with an earlier report, lists the
+routes whose p95 or throughput got worse by more than ``--tolerance`` and
+exits with status 1 if there are any.
+
+    cd backend && python -m benchmarks.load --engine memory --mix default --duration 30
+    cd backend && python -m benchmarks.load --mix morning --rate 400 --baseline benchmarks/results/load-morning-abc1234.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from models import DealStage, LeadSource, User, UserRole
+from benchmarks.common import asgi_request, bench_server, fake_deal, fake_lead, owner_ids, seed, summarize
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+PASSWORD = "bench-password"
+ADMIN_SHARE = 0.1
+LEAD_PAGE_SIZE = 50
+DEAL_PAGE_SIZE = 200
+DEAL_SAMPLE = 200
+
+# Relative weights of the operations below
+MIXES = {
+    "default": {
+        "dashboard": 20, "list_leads": 25, "list_deals": 15, "create_lead": 15, "pipeline_drag": 20, "login": 5,
+    },
+    # Everyone opening the app at once
+    "morning": {"dashboard": 45, "list_leads": 20, "list_deals": 25, "login": 10},
+    # Web-form bursts
+    "ingest": {"create_lead": 80, "list_leads": 10, "dashboard": 10},
+    # Board reorganisation
+    "pipeline": {"pipeline_drag": 60, "list_deals": 30, "dashboard": 10},
+}
+
+
+class VirtualUser:
+    def __init__(self, email: str, token: str, deal_ids: list, rng: random.Random):
+        self.email = email
+        self.token = token
+        self.deal_ids = deal_ids
+        self.rng = rng
+
+
+def dashboard(user: VirtualUser) -> tuple:
+    return "GET", "/api/analytics/dashboard", None, None
+
+
+def list_leads(user: VirtualUser) -> tuple:
+    return "GET", "/api/leads", {"limit": LEAD_PAGE_SIZE}, None
+
+
+def list_deals(user: VirtualUser) -> tuple:
+    return "GET", "/api/deals", {"limit": DEAL_PAGE_SIZE}, None
+
+
+def create_lead(user: VirtualUser) -> tuple:
+    rng = user.rng
+    lead = {
+        "name": f"Lead {rng.randint(0, 10**6)}",
+        "email": f"load{rng.randint(0, 10**9)}@example.com",
+        "company": rng.choice([None, "Acme", "Globex", "Initech"]),
+        "source": rng.choice(list(LeadSource)).value,
+    }
+    return "POST", "/api/leads", None, lead
+
+
+def pipeline_drag(user: VirtualUser) -> tuple:
+    move = {"deal_id": user.rng.choice(user.deal_ids), "stage": user.rng.choice(list(DealStage)).value}
+    return "POST", "/api/deals/transitions", None, {"moves": [move]}
+
+
+def login(user: VirtualUser) -> tuple:
+    return "POST", "/api/auth/login", None, {"email": user.email, "password": PASSWORD}
+
+
+OPERATIONS = {
+    "dashboard": dashboard,
+    "list_leads": list_leads,
+    "list_deals": list_deals,
+    "create_lead": create_lead,
+    "pipeline_drag": pipeline_drag,
+    "login": login,
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.statuses = {}
+        self.routes = {}
+        self.recording = False
+
+    def record(self, operation: str, route: str, status: int, elapsed_ms: float):
+        if not self.recording:
+            return
+        self.routes[operation] = route
+        self.samples.setdefault(operation, []).append(elapsed_ms)
+        counts = self.statuses.setdefault(operation, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def report(self, seconds: float) -> dict:
+        routes = {}
+        for operation, samples in sorted(self.samples.items()):
+            statuses = self.statuses[operation]
+            routes[operation] = {
+                "route": self.routes[operation],
+                "requests": len(samples),
+                "rps": round(len(samples) / seconds, 1),
+                "errors": sum(count for status, count in statuses.items() if status >= 400),
+                "statuses": {str(status): count for status, count in sorted(statuses.items())},
+                **summarize(samples),
+            }
+        every = [sample for samples in self.samples.values() for sample in samples]
+        total = {
+            "requests": len(every),
+            "rps": round(len(every) / seconds, 1),
+            "errors": sum(route["errors"] for route in routes.values()),
+            **(summarize(every) if every else {}),
+        }
+        return {"total": total, "routes": routes}
+
+
+async def send(app, user: VirtualUser, operation: str, recorder: Recorder, started: float):
+    method, path, params, body = OPERATIONS[operation](user)
+    token = None if operation == "login" else user.token
+    status, _ = await asgi_request(app, method, path, token, params, body)
+    recorder.record(operation, f"{method} {path}", status, (time.perf_counter() - started) * 1000)
+
+
+async def closed_loop(app, users: list, mix: dict, recorder: Recorder, concurrency: int, seconds: float):
+    operations, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + seconds
+
+    async def virtual_user(user: VirtualUser):
+        while time.perf_counter() < deadline:
+            await send(app, user, user.rng.choices(operations, weights)[0], recorder, time.perf_counter())
+
+    await asyncio.gather(*(virtual_user(users[index % len(users)]) for index in range(concurrency)))
+
+
+async def open_loop(app, users: list, mix: dict, recorder: Recorder, rate: float, seconds: float, rng: random.Random):
+    operations, weights = list(mix), list(mix.values())
+    start = time.perf_counter()
+    tasks = set()
+    for index in range(int(rate * seconds)):
+        due = start + index / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        user = rng.choice(users)
+        task = asyncio.create_task(send(app, user, rng.choices(operations, weights)[0], recorder, due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+
+async def seed_data(server, users: int, leads: int, deals: int, rng: random.Random) -> tuple:
+    """Seed the benchmark data; returns ``(admin email, [(customer email, deal ids)])``."""
+    import passwords
+    from rollups import reconcile
+
+    db = server.db
+    # The generators draw from the module-level RNG
+    random.seed(rng.random())
+    owners = owner_ids(users)
+    await seed(db.leads, fake_lead, leads, owners)
+    await seed(db.deals, fake_deal, deals, owners)
+    password = await passwords.hash_password(PASSWORD)
+    accounts = [User(email="load-admin@example.com", full_name="Load Admin", role=UserRole.ADMIN)]
+    accounts += [User(id=owner, email=f"{owner}@example.com", full_name=owner) for owner in owners]
+    await db.users.delete_many({"email": {"$in": [account.email for account in accounts]}})
+    await db.users.insert_many([{**account.dict(), "password": password} for account in accounts])
+    await reconcile(db)
+
+    customers = []
+    for owner, account in zip(owners, accounts[1:]):
+        deal_ids = [deal["id"] async for deal in db.deals.find({"created_by": owner}, {"id": 1}).limit(DEAL_SAMPLE)]
+        customers.append((account.email, deal_ids))
+    return accounts[0].email, customers
+
+
+def git_commit() -> dict:
+    root = Path(__file__).resolve().parent.parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "unknown", "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Operations whose p95 or throughput regressed by more than ``tolerance`` against ``baseline``."""
+    changed = sorted(key for key, value in report["settings"].items() if baseline["settings"].get(key) != value)
+    if changed:
+        print(json.dumps({"warning": "baseline ran with different settings", "settings": changed}))
+    regressions = []
+    for operation, route in report["routes"].items():
+        before = baseline["routes"].get(operation)
+        if before is None:
+            continue
+        p95_change = route["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_change = route["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        row = {
+            "operation": operation,
+            "p95_ms": route["p95_ms"],
+            "baseline_p95_ms": before["p95_ms"],
+            "p95_change": round(p95_change, 3),
+            "rps": route["rps"],
+            "baseline_rps": before["rps"],
+            "rps_change": round(rps_change, 3),
+        }
+        print(json.dumps({"compare": row}))
+        if p95_change > tolerance or rps_change < -tolerance:
+            regressions.append(row)
+    return regressions
+
+
+async def run(args) -> dict:
+    server = bench_server(args.engine, rate_limits=args.rate_limits)
+    app = server.app
+    mix = MIXES[args.mix]
+    rng = random.Random(args.seed)
+    await app.router.startup()
+    try:
+        start = time.perf_counter()
+        admin_email, customers = await seed_data(server, args.users, args.leads, args.deals, rng)
+        print(json.dumps({"stage": "seed", "seconds": round(time.perf_counter() - start, 1)}))
+
+        admin = VirtualUser(admin_email, server.create_access_token({"sub": admin_email}),
+                            [deal_id for _, deal_ids in customers for deal_id in deal_ids[:5]],
+                            random.Random(rng.random()))
+        users = [
+            VirtualUser(email, server.create_access_token({"sub": email}), deal_ids, random.Random(rng.random()))
+            for email, deal_ids in customers
+        ]
+        # Admins are a minority of the sessions, as in a sales team
+        users += [admin] * max(1, round(len(users) * ADMIN_SHARE))
+
+        recorder = Recorder()
+        for seconds, recording in ((args.warmup, False), (args.duration, True)):
+            recorder.recording = recording
+            started = time.perf_counter()
+            if args.rate:
+                await open_loop(app, users, mix, recorder, args.rate, seconds, rng)
+            else:
+                await closed_loop(app, users, mix, recorder, args.concurrency, seconds)
+        elapsed = time.perf_counter() - started
+    finally:
+        await app.router.shutdown()
+
+    return {
+        **git_commit(),
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {
+            "engine": os.environ.get('STORAGE_ENGINE', 'mongo'),
+            "mix": args.mix,
+            "weights": mix,
+            "mode": "open" if args.rate else "closed",
+            "rate": args.rate,
+            "concurrency": None if args.rate else args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "rate_limits": args.rate_limits,
+            "data": {"users": args.users, "leads": args.leads, "deals": args.deals},
+        },
+        "seconds": round(elapsed, 2),
+        **recorder.report(elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=["memory", "mongo"], default=None,
+                        help="storage engine; defaults to STORAGE_ENGINE")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--rate", type=float, default=None, help="requests per second, open loop")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--leads", type=int, default=100000)
+    parser.add_argument("--deals", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rate-limits", action="store_true", help="keep the per-tenant rate limits")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    for operation, route in report["routes"].items():
+        print(json.dumps({"operation": operation, **route}))
+    print(json.dumps({"operation": "total", **report["total"]}))
+
+    output = args.output or RESULTS_DIR / f"load-{args.mix}-{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(json.dumps({"output": str(output)}))
+
+    if args.baseline is not None:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print(json.dumps({"regressions": [row["operation"] for row in regressions]}))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""p50/p99 latency of /api/leads while a login storm runs on the same worker.
+
+A probe calls ``get_leads`` every few milliseconds while ``--logins``
+concurrent clients log in back to back.  ``pool`` is the shipped behaviour
+(scrypt in the bounded hash pool); ``inline`` runs the same KDF directly on
+the event loop to show what the pool protects against.
+
+    cd backend && python -m benchmarks.login_storm --logins 32 --seconds 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import passwords
+import server
+from models import User, UserCreate, UserLogin, UserRole
+from benchmarks.common import bench_db, fake_lead, seed
+
+PROBE_INTERVAL = 0.005
+
+
+async def _inline(fn, *args):
+    return fn(*args)
+
+
+async def probe(user: User, stop: asyncio.Event) -> list:
+    """Latency is measured from when the request was due, so time spent
+    waiting for a blocked event loop counts just like it would for a client."""
+    samples = []
+    due = time.perf_counter()
+    while not stop.is_set():
+        await server.get_leads(limit=100, cursor=None, current_user=user)
+        samples.append((time.perf_counter() - due) * 1000)
+        due = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+    return samples
+
+
+async def storm(credentials: UserLogin, stop: asyncio.Event) -> int:
+    logins = 0
+    while not stop.is_set():
+        await server.login(credentials)
+        logins += 1
+        # Give the probe a chance to run even if the driver answers without yielding
+        await asyncio.sleep(0)
+    return logins
+
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "probes": len(samples),
+        "p50_ms": round(statistics.median(samples), 2),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+        "max_ms": round(samples[-1], 2),
+    }
+
+
+async def run_mode(mode: str, user: User, credentials: UserLogin, logins: int, seconds: float) -> dict:
+    original = passwords._run
+    if mode == "inline":
+        passwords._run = _inline
+    try:
+        stop = asyncio.Event()
+        probe_task = asyncio.ensure_future(probe(user, stop))
+        storm_tasks = [asyncio.ensure_future(storm(credentials, stop)) for _ in range(logins)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        samples = await probe_task
+        completed = sum(await asyncio.gather(*storm_tasks))
+    finally:
+        passwords._run = original
+    return {"mode": mode, "concurrent_logins": logins, "logins_per_s": round(completed / seconds, 1), **summarize(samples)}
+
+
+async def run(logins: int, seconds: float):
+    client, db = bench_db()
+    server.db = db
+    results = []
+    try:
+        await db.users.delete_many({})
+        password = "bench-password"
+        registered = await server.register(UserCreate(
+            email="storm@example.com", full_name="Storm", password=password, role=UserRole.CUSTOMER,
+        ))
+        await seed(db.leads, fake_lead, 1000, [registered.id])
+        credentials = UserLogin(email=registered.email, password=password)
+
+        stop = asyncio.Event()
+        baseline = asyncio.ensure_future(probe(registered, stop))
+        await asyncio.sleep(seconds)
+        stop.set()
+        results.append({"mode": "idle", "concurrent_logins": 0, "logins_per_s": 0, **summarize(await baseline)})
+        print(json.dumps(results[-1]))
+
+        for mode in ("pool", "inline"):
+            results.append(await run_mode(mode, registered, credentials, logins, seconds))
+            print(json.dumps(results[-1]))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login clients")
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Per-request and per-command cost of the metrics instrumentation.
+
+Needs no database.  ``request`` drives a minimal ASGI app directly, bare and
+wrapped in ``MetricsMiddleware`` (resolving routes against the real app's
+router, as in production), so the difference is the middleware alone.
+``command`` feeds one started/succeeded pair per iteration through
+``MongoCommandMetrics``.  ``scrape`` renders ``/metrics`` with every route
+and a hundred collection/command series populated.
+
+    cd backend && python -m benchmarks.metrics --iterations 100000
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import metrics
+import server
+from metrics import MetricsMiddleware, MongoCommandMetrics
+
+PATHS = ["/api/leads", "/api/leads/0b1c7e5a-2f7e-4a57-9a53-0d4a3f2c1e11", "/api/analytics/dashboard"]
+
+
+async def plain_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def drive(app, iterations: int) -> float:
+    """Microseconds per request."""
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scopes = [
+        {"type": "http", "method": "GET" if index != 1 else "PATCH", "path": path, "headers": []}
+        for index, path in enumerate(PATHS)
+    ]
+    start = time.perf_counter()
+    for index in range(iterations):
+        await app(scopes[index % len(scopes)], receive, send)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def commands(iterations: int) -> float:
+    """Microseconds per started/succeeded pair."""
+    listener = MongoCommandMetrics(slow_ms=0)
+    started = SimpleNamespace(command_name="find", command={"find": "leads", "filter": {}}, connection_id=1, request_id=0)
+    succeeded = SimpleNamespace(command_name="find", connection_id=1, request_id=0, duration_micros=850,
+                                reply={"cursor": {"firstBatch": [{}] * 50}})
+    start = time.perf_counter()
+    for index in range(iterations):
+        started.request_id = succeeded.request_id = index
+        listener.started(started)
+        listener.succeeded(succeeded)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def scrape(repeat: int = 20) -> dict:
+    for route in server.app.router.routes:
+        for status in ("200", "404"):
+            metrics.REQUEST_DURATION.observe(("GET", route.path, status), 0.01)
+    for index in range(100):
+        metrics.MONGO_DURATION.observe((f"collection{index % 10}", f"command{index // 10}"), 0.001)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = metrics.REGISTRY.render()
+    return {"scrape_ms": round((time.perf_counter() - start) / repeat * 1000, 2), "scrape_bytes": len(body)}
+
+
+async def run(iterations: int):
+    wrapped = MetricsMiddleware(plain_app, route_path=server.admission.route_path)
+    # Warm the route cache and the series dicts, as in a running worker
+    await drive(wrapped, len(PATHS))
+    bare_us = await drive(plain_app, iterations)
+    wrapped_us = await drive(wrapped, iterations)
+    print(json.dumps({
+        "stage": "request",
+        "bare_us": round(bare_us, 2),
+        "instrumented_us": round(wrapped_us, 2),
+        "overhead_us": round(wrapped_us - bare_us, 2),
+    }))
+    print(json.dumps({"stage": "command", "overhead_us": round(commands(iterations), 2)}))
+    print(json.dumps({"stage": "scrape", **scrape()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
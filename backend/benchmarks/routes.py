@@ -0,0 +1,156 @@
+"""Latency of the full route stack, application cost apart from the database.
+
+Requests go through ``server.app`` as an ASGI callable (metrics, admission,
+CORS, routing, auth, serialization) with no HTTP client or socket in
+between, against ``--leads`` generated leads (spread over 50 customers) and
+their rollups.  With ``--engine memory`` the storage is the in-memory engine,
+so the numbers are the application's own cost; with ``--engine mongo`` (the
+database in ``backend/.env``, ``<DB_NAME>_bench``) the ``db_ms`` column is
+the time MongoDB commands took per request, from the command listener, and
+``app_ms`` the rest.
+
+The in-memory engine holds about 2 KB per lead, or twice that with
+``--search`` (search prefixes are seeded and ``/api/search`` is timed).
+
+    cd backend && python -m benchmarks.routes --engine memory --leads 1000000
+    cd backend && python -m benchmarks.routes --engine mongo --leads 1000000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+
+import orjson
+
+from benchmarks.common import INSERT_BATCH, asgi_request, bench_server, fake_lead, owner_ids, summarize
+
+CUSTOMERS = 50
+PAGE_SIZE = 50
+
+
+async def seed_leads(db, total: int, owners: list, with_search: bool) -> dict:
+    """Insert ``total`` leads; returns a sample of lead ids per owner."""
+    from search import SearchCollection, set_search_prefixes
+
+    await db.leads.delete_many({"created_by": {"$in": owners}})
+    now = datetime.utcnow()
+    sample = {owner: [] for owner in owners}
+    inserted = 0
+    while inserted < total:
+        size = min(INSERT_BATCH, total - inserted)
+        docs = [fake_lead(owners[(inserted + i) % len(owners)], now) for i in range(size)]
+        if with_search:
+            docs = [set_search_prefixes(SearchCollection.LEADS, doc) for doc in docs]
+        for doc in docs[:len(owners)]:
+            sample[doc["created_by"]].append(doc["id"])
+        await db.leads.insert_many(docs, ordered=False)
+        inserted += size
+    return sample
+
+
+async def seed_users(db, owners: list) -> list:
+    """One admin and a customer per owner id; returns their emails, admin first."""
+    from models import User, UserRole
+
+    emails = ["bench-admin@example.com"] + [f"{owner}@example.com" for owner in owners]
+    await db.users.delete_many({"email": {"$in": emails}})
+    users = [User(email=emails[0], full_name="Bench Admin", role=UserRole.ADMIN)]
+    users += [
+        User(id=owner, email=email, full_name=owner, role=UserRole.CUSTOMER)
+        for owner, email in zip(owners, emails[1:])
+    ]
+    await db.users.insert_many([user.dict() for user in users])
+    return emails
+
+
+def scenarios(admin: str, customer: str, owner_leads: list, next_cursor: str, with_search: bool) -> list:
+    """``(name, token, request factory)``; each factory returns ``(method, path, params, body)``."""
+    def create():
+        lead = {"name": f"Lead {random.randint(0, 10**6)}", "email": f"new{random.randint(0, 10**9)}@example.com"}
+        return "POST", "/api/leads", {}, lead
+
+    def patch():
+        return "PATCH", f"/api/leads/{random.choice(owner_leads)}", {}, {"notes": f"Call back {random.randint(0, 99)}"}
+
+    rows = [
+        ("auth_me", customer, lambda: ("GET", "/api/auth/me", {}, None)),
+        ("leads_page_admin", admin, lambda: ("GET", "/api/leads", {"limit": PAGE_SIZE}, None)),
+        ("leads_page_customer", customer, lambda: ("GET", "/api/leads", {"limit": PAGE_SIZE}, None)),
+        ("leads_next_page_customer", customer,
+         lambda: ("GET", "/api/leads", {"limit": PAGE_SIZE, "cursor": next_cursor}, None)),
+        ("leads_filtered_admin", admin,
+         lambda: ("GET", "/api/leads", {"limit": PAGE_SIZE, "filter[stage]": "new", "sort": "-created_at"}, None)),
+        ("dashboard_admin", admin, lambda: ("GET", "/api/analytics/dashboard", {}, None)),
+        ("dashboard_customer", customer, lambda: ("GET", "/api/analytics/dashboard", {}, None)),
+        ("create_lead", customer, create),
+        ("patch_lead", customer, patch),
+    ]
+    if with_search:
+        rows.append(("search_customer", customer, lambda: ("GET", "/api/search", {"q": "lead 12"}, None)))
+    return rows
+
+
+async def run(engine: str, leads: int, repeat: int, with_search: bool):
+    server = bench_server(engine)
+    import metrics
+    from rollups import reconcile
+
+    app, db = server.app, server.db
+    await app.router.startup()
+    try:
+        owners = owner_ids(CUSTOMERS)
+        start = time.perf_counter()
+        sample = await seed_leads(db, leads, owners, with_search)
+        emails = await seed_users(db, owners)
+        await reconcile(db)
+        print(json.dumps({"stage": "seed", "engine": engine, "leads": leads,
+                          "seconds": round(time.perf_counter() - start, 1)}))
+
+        admin, customer = (server.create_access_token({"sub": email}) for email in emails[:2])
+        status, body = await asgi_request(app, "GET", "/api/leads", customer, {"limit": PAGE_SIZE})
+        next_cursor = orjson.loads(body)["next_cursor"]
+
+        for name, token, factory in scenarios(admin, customer, sample[owners[0]], next_cursor, with_search):
+            # Warm caches and, for the in-memory engine, build the ordered index of the sort order
+            for _ in range(3):
+                method, path, params, body = factory()
+                await asgi_request(app, method, path, token, params, body)
+            samples, statuses = [], set()
+            commands_before, db_before = metrics.MONGO_DURATION.total()
+            for _ in range(repeat):
+                method, path, params, body = factory()
+                begin = time.perf_counter()
+                status, _ = await asgi_request(app, method, path, token, params, body)
+                samples.append((time.perf_counter() - begin) * 1000)
+                statuses.add(status)
+            commands_after, db_after = metrics.MONGO_DURATION.total()
+            row = {"scenario": name, "engine": engine, "leads": leads, "status": sorted(statuses), **summarize(samples)}
+            mean_ms = sum(samples) / repeat
+            if engine == "mongo":
+                db_ms = (db_after - db_before) * 1000 / repeat
+                row.update({
+                    "commands": round((commands_after - commands_before) / repeat, 1),
+                    "db_ms": round(db_ms, 2),
+                    "app_ms": round(mean_ms - db_ms, 2),
+                })
+            else:
+                row["app_ms"] = round(mean_ms, 2)
+            print(json.dumps(row))
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--leads", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--search", action="store_true", help="seed search prefixes and time /api/search")
+    args = parser.parse_args()
+    asyncio.run(run(args.engine, args.leads, args.repeat, args.search))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Throughput of full lead rescoring and latency of the incremental rescore.
+
+For each size, seeds unscored leads and times ``rescore_all`` twice: the
+backfill, which writes every score, and a rerun, which finds nothing to
+change and so measures reading and scoring alone.  ``score_leads`` on one
+batch and the update of a single lead, which writes its new score, are
+timed separately.
+The target is a full rescore of 1M leads in seconds.
+
+    cd backend && python -m benchmarks.scoring --sizes 100000 1000000
+    cd backend && STORAGE_ENGINE=memory python -m benchmarks.scoring
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from indexes import ensure_indexes
+from scoring import SCORING_BATCH_SIZE, changed_score, rescore_all, score_leads
+from updates import update_owned
+from benchmarks.common import bench_db, fake_lead, measure, owner_ids, seed
+
+
+def lead_factory(owner, now):
+    return {**fake_lead(owner, now), "version": 0}
+
+
+async def run(sizes, repeat):
+    client, db = bench_db()
+    owners = owner_ids()
+    try:
+        await ensure_indexes(db)
+        for size in sizes:
+            await seed(db.leads, lead_factory, size, owners)
+            for job in ("backfill", "rerun"):
+                report = await rescore_all(db)
+                print(json.dumps({"leads": size, "job": job, **report,
+                                  "leads_per_second": round(report["leads"] / max(report["seconds"], 1e-9))}))
+
+            batch = await db.leads.find({}).limit(SCORING_BATCH_SIZE).to_list(SCORING_BATCH_SIZE)
+            start = time.perf_counter()
+            score_leads(batch)
+            elapsed = time.perf_counter() - start
+            print(json.dumps({"leads": size, "job": "score_leads", "batch": len(batch),
+                              "us_per_lead": round(elapsed * 1e6 / len(batch), 3)}))
+
+            lead = await db.leads.find_one({"created_by": owners[0]}, {"_id": 0, "id": 1})
+            stages = iter(["contacted", "qualified"] * repeat)
+
+            async def update_one():
+                changes = {"stage": next(stages)}
+                await update_owned(db.leads, lead["id"], changes, None, "Lead", derive=changed_score)
+
+            print(json.dumps({"leads": size, "job": "update_lead", **await measure(update_one, repeat)}))
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Latency of /api/search (typeahead and full text) at increasing data volumes.
+
+Leads get realistic names, e-mails and companies so that prefixes have a
+natural spread, then random typeahead prefixes and text queries are timed
+for admin and customer scope.  The target is a p99 under 20 ms at 1M leads.
+
+    cd backend && python -m benchmarks.search --sizes 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from indexes import ensure_indexes
+from search import SearchCollection, SearchMode, search, set_search_prefixes
+from benchmarks.common import bench_db, fake_lead, measure, owner_ids, seed
+
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "David", "Elena",
+               "William", "Sofia", "Richard", "Chloe", "Joseph", "Amara", "Thomas", "Yuki", "Charles", "Priya"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Taylor", "Moore", "Jackson",
+              "Nakamura", "Okafor", "Schmidt", "Rossi", "Dubois", "Kowalski", "Novak", "Larsen", "Silva"]
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Vandelay", "Stark", "Wayne", "Tyrell", "Cyberdyne"]
+
+
+def search_lead(owner, now):
+    lead = fake_lead(owner, now)
+    first, last = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+    company = random.choice(COMPANIES)
+    lead.update({
+        "name": f"{first} {last}",
+        "email": f"{first}.{last}{random.randint(0, 9999)}@{company}.com".lower(),
+        "company": f"{company} {random.choice(['Inc', 'Ltd', 'GmbH', 'Labs'])}",
+        "notes": f"Met {first} at the {company} booth",
+    })
+    return set_search_prefixes(SearchCollection.LEADS, lead)
+
+
+def random_query(mode):
+    if mode == SearchMode.PREFIX:
+        word = random.choice(FIRST_NAMES + LAST_NAMES + COMPANIES).lower()
+        return word[:random.randint(2, len(word))]
+    return f"{random.choice(FIRST_NAMES)} {random.choice(COMPANIES)}"
+
+
+async def run(sizes, repeat, limit, modes):
+    client, db = bench_db()
+    owners = owner_ids()
+    results = []
+    try:
+        await ensure_indexes(db)
+        for size in sizes:
+            await seed(db.leads, search_lead, size, owners)
+            for scope, owner_id in (("admin", None), ("customer", owners[0])):
+                for mode in modes:
+                    stats = await measure(
+                        lambda: search(db, random_query(mode), mode, [SearchCollection.LEADS], owner_id, limit), repeat
+                    )
+                    row = {"documents": size, "scope": scope, "mode": mode.value, **stats}
+                    results.append(row)
+                    print(json.dumps(row))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--modes", type=SearchMode, nargs="+", default=list(SearchMode))
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat, args.limit, args.modes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Rows/s of the list response path before and after the orjson fast path.
+
+``model`` reproduces the previous route: one Pydantic model per document,
+then FastAPI's ``response_model`` validation and ``mode="json"``
+serialization followed by ``JSONResponse``'s ``json.dumps``.  ``fast`` is
+``ListSerializer.page_response`` on the projected documents.  No database
+is needed; documents are generated in memory.
+
+    cd backend && python -m benchmarks.serialization --rows 1000
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from models import Lead, Contact, Deal, Page
+from serialization import ListSerializer
+from benchmarks.common import fake_deal, fake_lead
+
+
+def fake_contact(owner: str, now: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "name": "Contact",
+        "email": "contact@example.com",
+        "phone": "+15550100",
+        "company": "Acme",
+        "position": "CEO",
+        "created_by": owner,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+FACTORIES = {Lead: fake_lead, Contact: fake_contact, Deal: fake_deal}
+
+
+def model_path(adapter, model, docs: list) -> bytes:
+    page = Page[model](items=[model(**doc) for doc in docs], limit=len(docs), next_cursor=None)
+    content = adapter.dump_python(adapter.validate_python(page), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def fast_path(serializer: ListSerializer, docs: list) -> bytes:
+    return serializer.page_response(docs, len(docs), None).body
+
+
+def rows_per_second(fn, make_docs, rows: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        docs = make_docs()
+        start = time.perf_counter()
+        fn(docs)
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+def run(rows: int, repeat: int):
+    now = datetime.utcnow()
+    results = []
+    for model, factory in FACTORIES.items():
+        base = [factory("bench-owner", now) for _ in range(rows)]
+        adapter = TypeAdapter(Page[model])
+        serializer = ListSerializer(model)
+        before = rows_per_second(
+            lambda docs: model_path(adapter, model, docs),
+            lambda: [{"_id": ObjectId(), **doc} for doc in base],
+            rows, repeat,
+        )
+        after = rows_per_second(
+            lambda docs: fast_path(serializer, docs),
+            lambda: [dict(doc) for doc in base],
+            rows, repeat,
+        )
+        row = {
+            "model": model.__name__,
+            "rows": rows,
+            "model_rows_per_s": round(before),
+            "fast_rows_per_s": round(after),
+            "speedup": round(after / before, 1),
+        }
+        results.append(row)
+        print(json.dumps(row))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
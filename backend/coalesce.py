@@ -0,0 +1,91 @@
+"""Single-flight coalescing of identical concurrent reads.
+
+When many admins open the dashboard or the pipeline at the same moment they
+send identical requests: same route, same scope (all admins share the
+global one), same query string.  ``SingleFlight.run(key, compute)`` starts
+``compute()`` for the first caller of a key and makes every caller that
+arrives while it runs await the same task, so the database sees one set of
+queries however many requests are waiting.  The task is shielded: a client
+that disconnects stops waiting, but the others still get the result.
+
+Routes key a computation on its ETag (see ``conditional``), which every
+caller derives from its own read of the scope's version row.  A caller
+therefore only joins work that started after that read, so it never gets a
+result older than a write it has already seen; only the dashboard of a scope
+without a rollup row has no version to key on.  Callers share the result,
+so it is rendered JSON (or a dict that is only read) and each caller wraps
+it in its own response.
+
+``COALESCE_TTL_MS`` (0, off, by default) additionally keeps a result for
+that long after it completed and serves it to later callers with the same
+key.  As keys carry the version, that only bounds how long the entries are
+kept (``COALESCE_MAX_ENTRIES`` bounds how many).
+
+Per-route counts of executed, coalesced and reused calls are served at
+``/api/admin/coalescing`` and as ``coalesced_reads_total`` on ``/metrics``.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Awaitable, Callable
+
+COALESCE_TTL_MS = float(os.environ.get('COALESCE_TTL_MS', 0))
+COALESCE_MAX_ENTRIES = int(os.environ.get('COALESCE_MAX_ENTRIES', 1024))
+
+OUTCOMES = ("executed", "coalesced", "reused")
+
+
+class SingleFlight:
+    """In-flight computations by key; a key is a tuple whose first item names the route."""
+
+    def __init__(self, ttl_seconds: float = COALESCE_TTL_MS / 1000, max_entries: int = COALESCE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._inflight = {}
+        self._recent = OrderedDict()
+        self._counts = {}
+
+    async def run(self, key: tuple, compute: Callable[[], Awaitable]):
+        counts = self._counts.setdefault(key[0], dict.fromkeys(OUTCOMES, 0))
+        if self.ttl_seconds:
+            cached = self._recent.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                counts["reused"] += 1
+                return cached[1]
+        task = self._inflight.get(key)
+        if task is None:
+            counts["executed"] += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._done, key))
+        else:
+            counts["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: tuple, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieving the exception also keeps asyncio from logging it when nobody waited
+        if task.cancelled() or task.exception() is not None or not self.ttl_seconds:
+            return
+        self._recent.pop(key, None)
+        self._recent[key] = (time.monotonic() + self.ttl_seconds, task.result())
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+
+    def counts(self) -> list:
+        """``[((route, outcome), count)]`` for the metrics collector."""
+        return [((route, outcome), count) for route, counts in self._counts.items() for outcome, count in counts.items()]
+
+    def stats(self) -> dict:
+        routes = {}
+        for route, counts in self._counts.items():
+            calls = sum(counts.values())
+            routes[route] = {
+                **counts,
+                "calls": calls,
+                "coalescing_ratio": round((calls - counts["executed"]) / calls, 3) if calls else 0.0,
+            }
+        return {"ttl_ms": self.ttl_seconds * 1000, "in_flight": len(self._inflight), "routes": routes}
@@ -0,0 +1,61 @@
+"""Strong ETags and ``If-None-Match`` handling for list and dashboard reads.
+
+A scope's rollup row (see ``rollups``) carries a version per collection that
+every write bumps, so the ETag of a list page is derived from the scope, the
+row's epoch, the collection's version and the query string, and that of the
+dashboard from the row itself.  Checking ``If-None-Match`` therefore costs
+one ``_id`` lookup on ``dashboard_rollups`` and never touches the data
+collections.
+
+The row is read before the data, so a write landing in between can only
+make an ETag older than its body (the next request refetches), never newer.
+Scopes without a row yet get no ETag.
+"""
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+# Only the version fields are needed for list pages
+VERSION_PROJECTION = {"epoch": 1, "versions": 1}
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def list_etag(row: Optional[dict], collection: str, request: Request, *extra) -> Optional[str]:
+    """``extra`` covers anything else the body depends on, e.g. the current month of a forecast."""
+    if row is None:
+        return None
+    version = row.get("versions", {}).get(collection, 0)
+    return make_etag(collection, row["_id"], row.get("epoch"), version, str(request.query_params), *extra)
+
+
+def row_etag(row: Optional[dict]) -> Optional[str]:
+    return None if row is None else make_etag(row)
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """``If-None-Match`` uses weak comparison, so a ``W/`` prefix is ignored."""
+    header = request.headers.get("if-none-match")
+    if etag is None or not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def with_etag(response: Response, etag: Optional[str]) -> Response:
+    if etag is not None:
+        response.headers["ETag"] = etag
+        # Revalidate on every use; the ETag makes that a 304 when nothing changed
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
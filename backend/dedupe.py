@@ -0,0 +1,377 @@
+"""Duplicate detection and merging for leads and contacts.
+
+Every lead and contact carries ``dedupe_keys``, blocking keys built from its
+normalized e-mail (``e:``), phone (``p:``) and name plus company (``nc:``),
+maintained on create, import and update like the search prefixes (an
+update writes both through ``derived_fields``).  Two documents are only
+ever compared when they share a key, so:
+
+* the create routes check for a possible duplicate with a single ``$in``
+  lookup on the multikey index (``find_possible_duplicates``), and
+* the batch job streams ``(key, document)`` pairs sorted by key, scores the
+  pairs inside each block and upserts them into ``duplicate_candidates``;
+  blocks larger than ``MAX_BLOCK_SIZE`` (a shared office phone, say) are
+  skipped rather than compared quadratically:
+
+    cd backend && python -m dedupe [--collection leads] [--dry-run]
+
+Candidates are reviewed through ``/api/duplicates`` and resolved with
+``merge_duplicates`` or dismissed.
+"""
+import argparse
+import asyncio
+import logging
+import re
+from datetime import datetime
+from enum import Enum
+from functools import partial
+from itertools import combinations
+from typing import Optional
+
+from fastapi import HTTPException, status
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+
+from assignment import track_load
+from events import ChangeAction, change_event, publish, refresh_event
+from rollups import apply_deltas, contact_delta, lead_delta
+from scoring import changed_score
+from search import SearchCollection, changed_search_prefixes, words
+from storage import command_db
+from updates import delete_owned, update_owned
+
+logger = logging.getLogger(__name__)
+
+MAX_BLOCK_SIZE = 100
+MAX_POSSIBLE_DUPLICATES = 5
+WRITE_BATCH_SIZE = 1000
+
+class DedupeCollection(str, Enum):
+    LEADS = "leads"
+    CONTACTS = "contacts"
+
+class CandidateStatus(str, Enum):
+    OPEN = "open"
+    DISMISSED = "dismissed"
+    MERGED = "merged"
+
+LABELS = {DedupeCollection.LEADS: "Lead", DedupeCollection.CONTACTS: "Contact"}
+
+# How much a shared key of each kind says about two records being the same person
+KEY_WEIGHTS = {"e": 0.9, "p": 0.7, "nc": 0.6}
+
+# Empty fields of the kept record are filled in from the merged one
+MERGE_FIELDS = {
+    DedupeCollection.LEADS: ["phone", "company", "notes", "assigned_to"],
+    DedupeCollection.CONTACTS: ["phone", "company", "position"],
+}
+
+KEY_FIELDS = ["email", "phone", "name", "company"]
+
+# A key matches a handful of records, so customers filter on created_by after the lookup
+DEDUPE_INDEXES = {
+    collection.value: [IndexModel([("dedupe_keys", ASCENDING)])]
+    for collection in DedupeCollection
+}
+
+CANDIDATE_INDEXES = [
+    IndexModel([("collection", ASCENDING), ("status", ASCENDING), ("score", DESCENDING)]),
+    IndexModel([("collection", ASCENDING), ("owners", ASCENDING), ("status", ASCENDING), ("score", DESCENDING)]),
+    IndexModel([("ids", ASCENDING)]),
+]
+
+DOT_INSENSITIVE_DOMAINS = {"gmail.com": "gmail.com", "googlemail.com": "gmail.com"}
+
+COMPANY_SUFFIXES = {
+    "inc", "incorporated", "ltd", "limited", "llc", "llp", "plc", "gmbh", "ag", "sa", "sarl", "bv", "nv",
+    "corp", "corporation", "co", "company", "the",
+}
+
+NON_DIGIT = re.compile(r"\D")
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    local, _, domain = (email or "").strip().lower().rpartition("@")
+    if not local or not domain:
+        return None
+    local = local.split("+", 1)[0]
+    if domain in DOT_INSENSITIVE_DOMAINS:
+        local, domain = local.replace(".", ""), DOT_INSENSITIVE_DOMAINS[domain]
+    return f"{local}@{domain}"
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    # The last ten digits, so "+1 (555) 010-2000" and "555 010 2000" agree
+    digits = NON_DIGIT.sub("", phone or "")
+    return digits[-10:] if len(digits) >= 7 else None
+
+
+def normalize_company(company: Optional[str]) -> Optional[str]:
+    return " ".join(word for word in words(company) if word not in COMPANY_SUFFIXES) or None
+
+
+def normalize_name(name: Optional[str]) -> Optional[str]:
+    # Word order is ignored so that "Smith, John" and "John Smith" agree
+    return " ".join(sorted(words(name))) or None
+
+
+def dedupe_keys(doc: dict) -> list:
+    keys = []
+    email = normalize_email(doc.get("email"))
+    if email:
+        keys.append(f"e:{email}")
+    phone = normalize_phone(doc.get("phone"))
+    if phone:
+        keys.append(f"p:{phone}")
+    name, company = normalize_name(doc.get("name")), normalize_company(doc.get("company"))
+    if name and company:
+        keys.append(f"nc:{name}|{company}")
+    return keys
+
+
+def set_dedupe_keys(doc: dict) -> dict:
+    doc["dedupe_keys"] = dedupe_keys(doc)
+    return doc
+
+
+def changed_dedupe_keys(before: dict, after: dict) -> dict:
+    """``{"dedupe_keys": ...}`` if an update changed one of their fields, else nothing."""
+    if all(before.get(field) == after.get(field) for field in KEY_FIELDS):
+        return {}
+    return {"dedupe_keys": dedupe_keys(after)}
+
+
+def derived_fields(collection: DedupeCollection, before: dict, after: dict) -> dict:
+    """Search prefixes, dedupe keys and (of a lead) score changed by an update; ``update_owned``'s ``derive``."""
+    derived = changed_search_prefixes(SearchCollection(collection.value), before, after)
+    derived.update(changed_dedupe_keys(before, after))
+    if collection == DedupeCollection.LEADS:
+        derived.update(changed_score(before, after))
+    return derived
+
+
+def match_score(kinds) -> float:
+    """Chance that two records are the same person, treating each shared key kind as independent evidence."""
+    miss = 1.0
+    for kind in kinds:
+        miss *= 1 - KEY_WEIGHTS[kind]
+    return round(1 - miss, 3)
+
+
+async def find_possible_duplicates(db, collection: DedupeCollection, doc: dict, owner_id: Optional[str]) -> list:
+    """Existing records in the caller's scope that share a blocking key with ``doc``."""
+    keys = doc.get("dedupe_keys") or dedupe_keys(doc)
+    if not keys:
+        return []
+    query = {"dedupe_keys": {"$in": keys}, "id": {"$ne": doc.get("id")}}
+    if owner_id is not None:
+        query["created_by"] = owner_id
+    projection = {"_id": 0, "id": 1, "name": 1, "email": 1, "dedupe_keys": 1}
+    matches = await db[collection.value].find(query, projection).limit(MAX_POSSIBLE_DUPLICATES).to_list(
+        MAX_POSSIBLE_DUPLICATES
+    )
+    results = []
+    for match in matches:
+        kinds = sorted({key.split(":", 1)[0] for key in set(match.pop("dedupe_keys", [])) & set(keys)})
+        results.append({**match, "matched_on": kinds, "score": match_score(kinds)})
+    results.sort(key=lambda match: -match["score"])
+    return results
+
+
+# Batch job
+
+async def backfill_keys(db, collection: DedupeCollection, batch_size: int = WRITE_BATCH_SIZE) -> int:
+    """Compute ``dedupe_keys`` for documents written before they existed."""
+    projection = {"_id": 1, **{field: 1 for field in KEY_FIELDS}}
+    requests, updated = [], 0
+    async for doc in db[collection.value].find({"dedupe_keys": {"$exists": False}}, projection):
+        requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"dedupe_keys": dedupe_keys(doc)}}))
+        if len(requests) >= batch_size:
+            await db[collection.value].bulk_write(requests, ordered=False)
+            updated += len(requests)
+            requests = []
+    if requests:
+        await db[collection.value].bulk_write(requests, ordered=False)
+        updated += len(requests)
+    return updated
+
+
+async def iter_blocks(db, collection: DedupeCollection):
+    """Yield ``(key, members)`` for every blocking key shared by more than one document."""
+    pipeline = [
+        {"$match": {"dedupe_keys.0": {"$exists": True}}},
+        {"$project": {"_id": 0, "id": 1, "created_by": 1, "dedupe_keys": 1}},
+        {"$unwind": "$dedupe_keys"},
+        {"$sort": {"dedupe_keys": 1}},
+    ]
+    key, members = None, []
+    async for row in db[collection.value].aggregate(pipeline, allowDiskUse=True):
+        if row["dedupe_keys"] != key:
+            if len(members) > 1:
+                yield key, members
+            key, members = row["dedupe_keys"], []
+        members.append(row)
+    if len(members) > 1:
+        yield key, members
+
+
+async def find_candidates(db, collection: DedupeCollection) -> tuple:
+    """Return ``({(id_a, id_b): pair}, report)`` for every pair sharing at least one key."""
+    pairs = {}
+    report = {"blocks": 0, "skipped_blocks": 0, "largest_block": 0}
+    async for key, members in iter_blocks(db, collection):
+        report["blocks"] += 1
+        report["largest_block"] = max(report["largest_block"], len(members))
+        if len(members) > MAX_BLOCK_SIZE:
+            report["skipped_blocks"] += 1
+            logger.warning("Skipping %s block %s with %d members", collection.value, key, len(members))
+            continue
+        kind = key.split(":", 1)[0]
+        for first, second in combinations(sorted(members, key=lambda member: member["id"]), 2):
+            pair = pairs.setdefault((first["id"], second["id"]), {
+                "owners": sorted({first["created_by"], second["created_by"]}),
+                "kinds": set(),
+            })
+            pair["kinds"].add(kind)
+    report["pairs"] = len(pairs)
+    return pairs, report
+
+
+async def write_candidates(db, collection: DedupeCollection, pairs: dict, batch_size: int = WRITE_BATCH_SIZE):
+    """Upsert the open candidates; reviewed pairs keep their status and pairs no longer found are dropped."""
+    run_at = datetime.utcnow()
+    requests = []
+    for (first, second), pair in pairs.items():
+        kinds = sorted(pair["kinds"])
+        requests.append(UpdateOne(
+            {"_id": f"{collection.value}:{first}:{second}"},
+            {
+                "$set": {
+                    "collection": collection.value,
+                    "ids": [first, second],
+                    "owners": pair["owners"],
+                    "matched_on": kinds,
+                    "score": match_score(kinds),
+                    "detected_at": run_at,
+                },
+                "$setOnInsert": {"status": CandidateStatus.OPEN.value},
+            },
+            upsert=True,
+        ))
+        if len(requests) >= batch_size:
+            await db.duplicate_candidates.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        await db.duplicate_candidates.bulk_write(requests, ordered=False)
+    await db.duplicate_candidates.delete_many({
+        "collection": collection.value,
+        "status": CandidateStatus.OPEN.value,
+        "detected_at": {"$lt": run_at},
+    })
+
+
+async def run_dedupe(db, collections: list, dry_run: bool = False) -> dict:
+    results = {}
+    for collection in collections:
+        keyed = await backfill_keys(db, collection)
+        pairs, report = await find_candidates(db, collection)
+        if not dry_run:
+            await write_candidates(db, collection, pairs)
+        results[collection.value] = {"keyed": keyed, **report}
+    return results
+
+
+# Review and merge
+
+def candidate_query(collection: DedupeCollection, owner_id: Optional[str], candidate_status: CandidateStatus) -> dict:
+    query = {"collection": collection.value, "status": candidate_status.value}
+    if owner_id is not None:
+        # Only pairs whose records both belong to the caller
+        query["owners"] = [owner_id]
+    return query
+
+
+async def dismiss_candidate(db, candidate_id: str, owner_id: Optional[str]):
+    query = {"_id": candidate_id}
+    if owner_id is not None:
+        query["owners"] = [owner_id]
+    result = await db.duplicate_candidates.update_one(query, {"$set": {"status": CandidateStatus.DISMISSED.value}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Duplicate candidate not found")
+
+
+async def merge_duplicates(db, collection: DedupeCollection, primary_id: str, duplicate_id: str,
+                           owner_id: Optional[str]) -> dict:
+    """Fold ``duplicate_id`` into ``primary_id`` and delete it; returns the updated primary.
+
+    Empty ``MERGE_FIELDS`` of the primary are filled in from the duplicate,
+    deals of a merged contact are moved over to the primary, and every
+    candidate pair involving the duplicate is marked as merged.
+    """
+    label = LABELS[collection]
+    if primary_id == duplicate_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Cannot merge a {label.lower()} into itself")
+    source = db[collection.value]
+    duplicate = await source.find_one({"id": duplicate_id}, {"_id": 0})
+    if duplicate is None:
+        raise HTTPException(status_code=404, detail=f"{label} not found")
+    if owner_id is not None and duplicate["created_by"] != owner_id:
+        raise HTTPException(status_code=403, detail=f"Not authorized to merge this {label.lower()}")
+
+    primary = await source.find_one({"id": primary_id}, {"_id": 0, **{field: 1 for field in MERGE_FIELDS[collection]}})
+    changes = {
+        field: duplicate[field]
+        for field in MERGE_FIELDS[collection]
+        if duplicate.get(field) and not (primary or {}).get(field)
+    }
+    before, after = await update_owned(
+        source, primary_id, changes, owner_id, label,
+        derive=partial(derived_fields, collection),
+    )
+    await delete_owned(source, duplicate_id, owner_id, label)
+
+    # The primary's owner row only needs its version bumped, unless it also owns the duplicate
+    removed = lead_delta(duplicate, -1) if collection == DedupeCollection.LEADS else contact_delta(-1)
+    await apply_deltas(db, collection.value, {after["created_by"]: {}, duplicate["created_by"]: removed})
+    events = [
+        change_event(collection.value, ChangeAction.UPDATED, after),
+        change_event(collection.value, ChangeAction.DELETED, duplicate),
+    ]
+    if collection == DedupeCollection.CONTACTS:
+        deal_owners = await db.deals.distinct("created_by", {"contact_id": duplicate_id})
+        if deal_owners:
+            await db.deals.update_many(
+                {"contact_id": duplicate_id},
+                {"$set": {"contact_id": primary_id, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}},
+            )
+            await apply_deltas(db, "deals", {owner: {} for owner in deal_owners})
+            events.extend(refresh_event("deals", owner) for owner in deal_owners)
+    await publish(db, events)
+    if collection == DedupeCollection.LEADS:
+        # The primary may take over the duplicate's assignee
+        await track_load(db, before, after)
+        await track_load(db, duplicate, None)
+
+    await db.duplicate_candidates.update_many(
+        {"ids": duplicate_id}, {"$set": {"status": CandidateStatus.MERGED.value}}
+    )
+    return after
+
+
+async def _main(collections: list, dry_run: bool):
+    async with command_db() as db:
+        results = await run_dedupe(db, collections, dry_run=dry_run)
+    for collection, report in results.items():
+        print(f"{collection}: " + " ".join(f"{name}={value}" for name, value in report.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate leads and contacts")
+    parser.add_argument("--collection", type=DedupeCollection, action="append",
+                        help="collection to scan (repeatable, default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="only report, do not write candidates")
+    args = parser.parse_args()
+    asyncio.run(_main(args.collection or list(DedupeCollection), args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Real-time push of lead, contact and deal changes over Server-Sent Events.
+
+Every write that applies a rollup delta also publishes change events (see
+``change_event`` and ``refresh_event``) by appending them to
+``change_events``, a capped collection.  Each worker tails that collection
+with a single tailable cursor and fans the events out to its own
+``/api/events`` subscribers, so a write served by one worker reaches the
+clients connected to every other worker.  Unlike change streams this works
+on a standalone ``mongod``, and a delete still carries the ``created_by``
+that scopes it: admins receive every event, customers only those of their
+own records.
+
+Each subscriber has a bounded queue.  A client that falls
+``SUBSCRIBER_BUFFER`` events behind has its queue dropped and receives a
+single ``resync`` event instead, telling it to refetch; a worker whose
+cursor was lost sends ``resync`` to all of its subscribers.  An idle
+connection costs one queue and a heartbeat comment every
+``HEARTBEAT_SECONDS``.
+
+The route authenticates a stream once, so ``stream_events`` asks it again
+every ``HEARTBEAT_SECONDS`` whether the user may still listen and ends the
+stream when not: a deactivated user stops receiving events once the auth
+cache lets go of it, and an expired token once it expires.
+
+Publishing is best effort: a failed insert is logged and never fails the
+write that triggered it.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+import orjson
+from fastapi import HTTPException, status
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from models import Contact, Deal, Lead
+
+EVENTS_COLLECTION = "change_events"
+EVENTS_MAX_BYTES = int(os.environ.get('CHANGE_EVENTS_MAX_BYTES', 16 * 1024 * 1024))
+SUBSCRIBER_BUFFER = int(os.environ.get('EVENTS_SUBSCRIBER_BUFFER', 256))
+MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 10000))
+HEARTBEAT_SECONDS = 15
+# Streams are closed after this long so that clients reconnect (and pick up a changed role)
+MAX_STREAM_SECONDS = 3600
+RECONNECT_MILLISECONDS = 3000
+TAIL_RETRY_SECONDS = 1
+
+logger = logging.getLogger(__name__)
+
+class ChangeAction(str, Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    REFRESH = "refresh"  # many records of the collection changed; refetch it
+
+EVENT_MODELS = {"leads": Lead, "contacts": Contact, "deals": Deal}
+
+RESYNC = {"action": "resync"}
+
+
+def change_event(collection: str, action: ChangeAction, doc: dict) -> dict:
+    """Event for one record; ``data`` holds its public fields, or nothing for a delete."""
+    data = None
+    if action != ChangeAction.DELETED:
+        data = {field: doc[field] for field in EVENT_MODELS[collection].model_fields if field in doc}
+    return {
+        "collection": collection,
+        "action": action.value,
+        "id": doc["id"],
+        "owner": doc["created_by"],
+        "data": data,
+        "at": datetime.utcnow(),
+    }
+
+
+def refresh_event(collection: str, owner_id: str) -> dict:
+    return {
+        "collection": collection,
+        "action": ChangeAction.REFRESH.value,
+        "id": None,
+        "owner": owner_id,
+        "data": None,
+        "at": datetime.utcnow(),
+    }
+
+
+async def publish(db, events: list):
+    if not events:
+        return
+    try:
+        await db[EVENTS_COLLECTION].insert_many(events, ordered=False)
+    except PyMongoError:
+        logger.warning("Could not publish %d change events", len(events), exc_info=True)
+
+
+async def ensure_events_collection(db):
+    try:
+        await db.create_collection(EVENTS_COLLECTION, capped=True, size=EVENTS_MAX_BYTES)
+    except CollectionInvalid:
+        pass
+
+
+class Subscription:
+    __slots__ = ("owner_id", "queue", "overflows")
+
+    def __init__(self, owner_id: Optional[str], buffer_size: int):
+        self.owner_id = owner_id
+        self.queue = asyncio.Queue(buffer_size)
+        self.overflows = 0
+
+    def offer(self, event: dict) -> bool:
+        """Queue ``event``; on overflow replace the backlog with a single ``RESYNC``."""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.overflows += 1
+            return False
+
+
+class EventBroker:
+    """In-process fan-out of change events to subscriptions, indexed by scope.
+
+    Admin subscriptions are kept under ``None``, so an event only visits the
+    admins and the subscriptions of its owner, not every open connection.
+    """
+
+    def __init__(self, buffer_size: int = SUBSCRIBER_BUFFER, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._by_owner: dict = {}
+        self._count = 0
+        self.events = 0
+        self.overflows = 0
+
+    def subscribe(self, owner_id: Optional[str]) -> Subscription:
+        if self._count >= self.max_subscribers:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many event subscribers")
+        subscription = Subscription(owner_id, self.buffer_size)
+        self._by_owner.setdefault(owner_id, set()).add(subscription)
+        self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._by_owner.get(subscription.owner_id)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.remove(subscription)
+        if not subscriptions:
+            del self._by_owner[subscription.owner_id]
+        self._count -= 1
+
+    def fan_out(self, event: dict):
+        self.events += 1
+        for owner_id in (None, event["owner"]):
+            for subscription in self._by_owner.get(owner_id, ()):
+                if not subscription.offer(event):
+                    self.overflows += 1
+
+    def resync_all(self):
+        for subscriptions in self._by_owner.values():
+            for subscription in subscriptions:
+                subscription.offer(RESYNC)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self._count,
+            "admin_subscribers": len(self._by_owner.get(None, ())),
+            "events": self.events,
+            "overflows": self.overflows,
+        }
+
+
+async def tail_events(db, broker: EventBroker):
+    """Fan out every event appended to ``EVENTS_COLLECTION`` after this worker started."""
+    collection = db[EVENTS_COLLECTION]
+    latest = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+    last_id = latest["_id"] if latest else None
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        try:
+            # A tailable cursor dies at once on an empty collection; retry below
+            async for event in collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT):
+                last_id = event["_id"]
+                broker.fan_out(event)
+        except PyMongoError:
+            # e.g. the capped collection wrapped past our position: events may be lost
+            logger.warning("Change event cursor lost, asking subscribers to resync", exc_info=True)
+            broker.resync_all()
+        await asyncio.sleep(TAIL_RETRY_SECONDS)
+
+
+def format_event(event: dict) -> bytes:
+    if event is RESYNC:
+        return b"event: resync\ndata: {}\n\n"
+    payload = {key: event[key] for key in ("collection", "action", "id", "data")}
+    return b"id: %s\nevent: change\ndata: %s\n\n" % (str(event["_id"]).encode(), orjson.dumps(payload))
+
+
+async def stream_events(broker: EventBroker, subscription: Subscription, heartbeat: float = HEARTBEAT_SECONDS,
+                        max_seconds: float = MAX_STREAM_SECONDS,
+                        authorized: Optional[Callable[[], Awaitable[bool]]] = None):
+    """SSE body for ``subscription``; unsubscribes when the client goes away or the stream expires.
+
+    ``authorized()`` is awaited every ``heartbeat`` seconds, and the stream
+    ends as soon as it returns False.
+    """
+    now = time.monotonic()
+    deadline, next_check = now + max_seconds, now + heartbeat
+    try:
+        yield b"retry: %d\n\n" % RECONNECT_MILLISECONDS
+        while (remaining := deadline - time.monotonic()) > 0:
+            if authorized is not None and time.monotonic() >= next_check:
+                if not await authorized():
+                    return
+                next_check = time.monotonic() + heartbeat
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,108 @@
+"""Streaming NDJSON/CSV export of whole collections.
+
+Rows are read from a Motor cursor in batches of ``EXPORT_BATCH_SIZE`` and
+each batch is encoded and handed to the client before the next one is
+fetched, so memory use depends on the batch size, not the export size.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Optional
+
+from pymongo import ASCENDING
+
+from models import Lead, Contact, Deal
+
+EXPORT_BATCH_SIZE = 2000
+
+class ExportCollection(str, Enum):
+    LEADS = "leads"
+    CONTACTS = "contacts"
+    DEALS = "deals"
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+EXPORT_MODELS = {
+    ExportCollection.LEADS: Lead,
+    ExportCollection.CONTACTS: Contact,
+    ExportCollection.DEALS: Deal,
+}
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+# Incremental exports filter on updated_at within the caller's scope
+EXPORT_INDEXES = [
+    [("updated_at", ASCENDING)],
+    [("created_by", ASCENDING), ("updated_at", ASCENDING)],
+]
+
+
+def export_fields(collection: ExportCollection) -> list:
+    return list(EXPORT_MODELS[collection].model_fields)
+
+
+def export_query(owner_id: Optional[str] = None, updated_since: Optional[datetime] = None) -> dict:
+    query = {} if owner_id is None else {"created_by": owner_id}
+    if updated_since is not None:
+        query["updated_at"] = {"$gte": updated_since}
+    return query
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot export value of type {type(value).__name__}")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_ndjson(docs: list, fields: list) -> str:
+    return "".join(
+        json.dumps({field: doc.get(field) for field in fields}, default=_json_default) + "\n"
+        for doc in docs
+    )
+
+
+def encode_csv(docs: list, fields: list, header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    writer.writerows([_csv_value(doc.get(field)) for field in fields] for doc in docs)
+    return buffer.getvalue()
+
+
+async def stream_export(
+    collection, export_collection: ExportCollection, export_format: ExportFormat, query: dict,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[str]:
+    """Yield the encoded export one cursor batch at a time."""
+    fields = export_fields(export_collection)
+    projection = {field: 1 for field in fields}
+    projection["_id"] = 0
+    cursor = collection.find(query, projection).batch_size(batch_size)
+
+    if export_format == ExportFormat.CSV:
+        yield encode_csv([], fields, header=True)
+
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield encode_ndjson(batch, fields) if export_format == ExportFormat.NDJSON else encode_csv(batch, fields)
+            batch = []
+    if batch:
+        yield encode_ndjson(batch, fields) if export_format == ExportFormat.NDJSON else encode_csv(batch, fields)
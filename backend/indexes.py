@@ -0,0 +1,211 @@
+"""Declared indexes and a COLLSCAN report for the routes' query shapes.
+
+``INDEXES`` is the single list of indexes the API relies on; it is ensured
+on startup.  ``QUERY_SHAPES`` mirrors the filters/sorts the routes issue and
+``explain_report`` runs ``explain`` on each of them so a missing index shows
+up as a COLLSCAN before it reaches production:
+
+    cd backend && python -m indexes [--ensure]
+
+exits non-zero when any query shape is not index backed.
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from analytics import ACTIVE_DEAL_STAGES
+from assignment import ASSIGNEE_INDEXES, PICK_ORDER, AssignmentStrategy
+from dedupe import CANDIDATE_INDEXES, DEDUPE_INDEXES
+from export import EXPORT_INDEXES
+from forecast import FORECAST_INDEXES
+from listquery import LIST_INDEXES
+from memory_engine import UnsupportedOperation
+from pagination import PAGINATION_INDEXES, SORT_KEY, sort_key
+from search import SEARCH_INDEXES
+from storage import command_db
+
+logger = logging.getLogger(__name__)
+
+ID_INDEX = IndexModel([("id", ASCENDING)], unique=True)
+
+
+def _compound_indexes(*key_lists) -> list:
+    """One ``IndexModel`` per distinct key list, skipping those that are a prefix of another one."""
+    unique = {tuple(keys): keys for keys in key_lists}
+    return [
+        IndexModel(keys)
+        for key, keys in unique.items()
+        if not any(len(other) > len(key) and other[:len(key)] == key for other in unique)
+    ]
+
+
+# Indexes of the reporting queries that only run against one collection
+REPORT_INDEXES = {
+    "deals": FORECAST_INDEXES,
+}
+
+# From LIST_INDEXES, (created_by, stage, created_at, id) also serves the dashboard's per-stage counts and
+# (contact_id, created_at, id) the merge that moves a merged contact's deals
+INDEXES = {
+    "users": [
+        ID_INDEX,
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    **{
+        collection: [
+            ID_INDEX,
+            *_compound_indexes(
+                *PAGINATION_INDEXES, *EXPORT_INDEXES, *LIST_INDEXES[collection], *REPORT_INDEXES.get(collection, [])
+            ),
+            *SEARCH_INDEXES.get(collection, []),
+            *DEDUPE_INDEXES.get(collection, []),
+        ]
+        for collection in ("leads", "contacts", "deals")
+    },
+    "duplicate_candidates": CANDIDATE_INDEXES,
+    "assignees": ASSIGNEE_INDEXES,
+}
+
+# (name, collection, filter, sort) for the reads the routes issue; values are placeholders.
+# Every declared index backs at least one shape: each one slows down every write to its collection.
+QUERY_SHAPES = [
+    ("get_current_user", "users", {"email": "user@example.com"}, None),
+    ("user by id", "users", {"id": "user-id"}, None),
+    ("lead by id", "leads", {"id": "lead-id"}, None),
+    ("contact by id", "contacts", {"id": "contact-id"}, None),
+    ("deal by id", "deals", {"id": "deal-id"}, None),
+    ("get_leads (admin)", "leads", {}, SORT_KEY),
+    ("get_leads (customer)", "leads", {"created_by": "user-id"}, SORT_KEY),
+    ("get_contacts (admin)", "contacts", {}, SORT_KEY),
+    ("get_contacts (customer)", "contacts", {"created_by": "user-id"}, SORT_KEY),
+    ("get_deals (admin)", "deals", {}, SORT_KEY),
+    ("get_deals (customer)", "deals", {"created_by": "user-id"}, SORT_KEY),
+    ("get_leads by stage (admin)", "leads", {"stage": {"$in": ["new", "contacted"]}}, SORT_KEY),
+    ("get_leads by stage (customer)", "leads", {"created_by": "user-id", "stage": {"$in": ["new", "contacted"]}}, SORT_KEY),
+    ("get_leads by source (admin)", "leads", {"source": "referral"}, SORT_KEY),
+    ("get_leads by source (customer)", "leads", {"created_by": "user-id", "source": "referral"}, SORT_KEY),
+    ("get_leads by assignee (admin)", "leads", {"assigned_to": "user-id"}, SORT_KEY),
+    ("get_leads by assignee (customer)", "leads", {"created_by": "user-id", "assigned_to": "user-id"}, SORT_KEY),
+    ("get_deals by stage (admin)", "deals", {"stage": {"$in": ["proposal", "negotiation"]}}, SORT_KEY),
+    ("get_deals by stage (customer)", "deals", {"created_by": "user-id", "stage": "proposal"}, SORT_KEY),
+    ("get_deals of a contact (admin)", "deals", {"contact_id": "contact-id"}, SORT_KEY),
+    ("get_deals of a contact (customer)", "deals", {"created_by": "user-id", "contact_id": "contact-id"}, SORT_KEY),
+    ("get_leads by score (admin)", "leads", {}, sort_key("score", DESCENDING)),
+    ("get_leads by score (customer)", "leads", {"created_by": "user-id"}, sort_key("score", DESCENDING)),
+    ("get_deals closing in range (admin)", "deals",
+     {"expected_close_date": {"$gte": "2025-01-01", "$lt": "2025-04-01"}}, sort_key("expected_close_date")),
+    ("get_deals closing in range (customer)", "deals",
+     {"created_by": "user-id", "expected_close_date": {"$gte": "2025-01-01", "$lt": "2025-04-01"}},
+     sort_key("expected_close_date")),
+    ("lead stage count (customer)", "leads", {"created_by": "user-id", "stage": "new"}, None),
+    ("active deals (customer)", "deals", {"created_by": "user-id", "stage": {"$in": ACTIVE_DEAL_STAGES}}, None),
+    ("lead typeahead (admin)", "leads", {"search_prefixes": {"$all": ["smit", "jo"]}}, None),
+    ("lead typeahead (customer)", "leads", {"created_by": "user-id", "search_prefixes": {"$all": ["smit", "jo"]}}, None),
+    ("contact typeahead (admin)", "contacts", {"search_prefixes": {"$all": ["acme"]}}, None),
+    ("contact typeahead (customer)", "contacts", {"created_by": "user-id", "search_prefixes": {"$all": ["acme"]}}, None),
+    ("lead full-text search (admin)", "leads", {"$text": {"$search": "acme"}}, None),
+    ("contact full-text search (customer)", "contacts", {"created_by": "user-id", "$text": {"$search": "acme"}}, None),
+    ("possible duplicate lead (admin)", "leads", {"dedupe_keys": {"$in": ["e:jo@acme.com", "p:5550102000"]}}, None),
+    ("possible duplicate lead (customer)", "leads",
+     {"created_by": "user-id", "dedupe_keys": {"$in": ["e:jo@acme.com", "p:5550102000"]}}, None),
+    ("possible duplicate contact (admin)", "contacts", {"dedupe_keys": {"$in": ["e:jo@acme.com"]}}, None),
+    ("deals of a merged contact", "deals", {"contact_id": "contact-id"}, None),
+    ("open duplicate contacts (admin)", "duplicate_candidates", {"collection": "contacts", "status": "open"}, [("score", -1)]),
+    ("open duplicate contacts (customer)", "duplicate_candidates",
+     {"collection": "contacts", "owners": ["user-id"], "status": "open"}, [("score", -1)]),
+    ("candidates of a merged record", "duplicate_candidates", {"ids": "lead-id"}, None),
+    ("forecast open pipeline (admin)", "deals",
+     {"stage": {"$in": ACTIVE_DEAL_STAGES}, "expected_close_date": {"$lt": "2026-01-01"}}, None),
+    ("forecast open pipeline (customer)", "deals",
+     {"created_by": "user-id", "stage": {"$in": ACTIVE_DEAL_STAGES}, "expected_close_date": {"$lt": "2026-01-01"}}, None),
+    ("forecast closed trend (admin)", "deals",
+     {"stage": {"$in": ["won", "lost"]}, "updated_at": {"$gte": "2025-01-01"}}, None),
+    ("forecast closed trend (customer)", "deals",
+     {"created_by": "user-id", "stage": {"$in": ["won", "lost"]}, "updated_at": {"$gte": "2025-01-01"}}, None),
+    *(
+        (f"export {collection} since ({scope})", collection, {**owner, "updated_at": {"$gte": "2025-01-01"}}, None)
+        for collection in ("leads", "contacts", "deals")
+        for scope, owner in (("admin", {}), ("customer", {"created_by": "user-id"}))
+    ),
+    ("open leads of a joining assignee", "leads", {"assigned_to": "user-id", "stage": {"$ne": "converted"}}, None),
+    ("open leads of the pool (reconcile)", "leads",
+     {"assigned_to": {"$in": ["user-id", "other-id"]}, "stage": {"$ne": "converted"}}, None),
+    ("pick assignee (round robin)", "assignees", {"active": True, "sources": "website"},
+     PICK_ORDER[AssignmentStrategy.ROUND_ROBIN]),
+    ("pick assignee (least loaded)", "assignees", {"active": True, "sources": "website"},
+     PICK_ORDER[AssignmentStrategy.LEAST_LOADED]),
+]
+
+
+async def ensure_indexes(db):
+    """Create every declared index; existing ones are left untouched."""
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # e.g. duplicate emails blocking the unique index; keep serving and let the report flag it
+            logger.error("Could not create indexes on %s: %s", collection, e)
+
+
+def _plan_stages(plan) -> list:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def explain_shape(db, collection: str, query: dict, sort=None) -> list:
+    command = {"find": collection, "filter": query}
+    if sort:
+        command["sort"] = dict(sort)
+    explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    return _plan_stages(explain["queryPlanner"]["winningPlan"])
+
+
+async def explain_report(db) -> list:
+    """Explain every query shape and flag the ones that scan a whole collection."""
+    report = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        stages = await explain_shape(db, collection, query, sort)
+        report.append({
+            "query": name,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
+
+
+async def _main(ensure: bool) -> int:
+    async with command_db() as db:
+        if ensure:
+            await ensure_indexes(db)
+        try:
+            report = await explain_report(db)
+        except UnsupportedOperation as e:
+            print(e)
+            return 2
+    for row in report:
+        flag = "COLLSCAN" if row["collscan"] else "ok"
+        print(f"{flag:8} {row['collection']:10} {row['query']}: {' <- '.join(row['stages'])}")
+    return 1 if any(row["collscan"] for row in report) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report query shapes that are not index backed")
+    parser.add_argument("--ensure", action="store_true", help="create the declared indexes first")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.ensure)))
+
+
+if __name__ == "__main__":
+    main()
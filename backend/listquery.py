@@ -0,0 +1,170 @@
+"""Sparse fieldsets and the filter/sort query language of the list endpoints.
+
+    GET /api/leads?fields=name,email&filter[stage]=new,contacted&sort=-created_at
+    GET /api/leads?filter[assigned_to]=<user id>&sort=-score
+    GET /api/deals?filter[expected_close_date][gte]=2025-01-01&filter[expected_close_date][lt]=2025-04-01
+
+* ``fields`` is a comma separated list of model fields; ``id`` and the sort
+  field are always returned because the cursor needs them.
+* ``filter[<field>]=a,b`` is an equality (``$in``) filter on the fields in
+  ``FILTER_FIELDS``.
+* ``filter[<field>][gte|gt|lte|lt]=`` is a range on one of ``RANGE_FIELDS``;
+  following the equality-sort-range rule the range field is also the sort
+  field, so ``sort`` defaults to it and may only name it.
+* ``sort=<field>`` or ``sort=-<field>`` orders on one of ``SORT_FIELDS``
+  (ties broken by ``id``).
+
+Every combination compiles to a query whose equality fields, then sort
+field, then ``id`` are a prefix of one of ``LIST_INDEXES``; anything else is
+rejected with a 400 rather than silently scanning and sorting in memory.
+Each filter and sort field costs two indexes that every insert and update
+maintains, so only the fields the list views filter and sort on are offered.
+"""
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, status
+from pymongo import ASCENDING, DESCENDING
+
+from models import DealStage, LeadSource, LeadStage
+from pagination import PAGINATION_INDEXES, SORT_KEY, sort_key
+
+FILTER_FIELDS = {
+    "leads": {"stage": LeadStage, "source": LeadSource, "assigned_to": str},
+    "contacts": {},
+    "deals": {"stage": DealStage, "contact_id": str},
+}
+
+# A range filter sorts on its field, so every range field is also a sort field
+SORT_FIELDS = {
+    "leads": ["created_at", "updated_at", "score"],
+    "contacts": ["created_at", "updated_at"],
+    "deals": ["created_at", "updated_at", "expected_close_date"],
+}
+
+RANGE_FIELDS = {
+    "leads": {"created_at": datetime, "updated_at": datetime},
+    "contacts": {"created_at": datetime, "updated_at": datetime},
+    "deals": {"created_at": datetime, "updated_at": datetime, "expected_close_date": datetime},
+}
+
+RANGE_OPERATORS = {"gte", "gt", "lte", "lt"}
+
+
+def _list_indexes(collection: str) -> list:
+    """Every filter field sorted by creation time, and every sort field on its own, for both scopes."""
+    indexes = []
+    for scope in ([], [("created_by", ASCENDING)]):
+        for field in FILTER_FIELDS[collection]:
+            indexes.append(scope + [(field, ASCENDING)] + SORT_KEY)
+        for field in SORT_FIELDS[collection]:
+            indexes.append(scope + sort_key(field))
+    return indexes
+
+
+LIST_INDEXES = {collection: _list_indexes(collection) for collection in FILTER_FIELDS}
+
+
+def _bad_request(detail: str):
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def is_index_backed(collection: str, equality_fields: set, sort_field: str) -> bool:
+    """True if some declared index starts with the equality fields (any order), then ``sort_field``, then ``id``."""
+    for keys in LIST_INDEXES[collection] + PAGINATION_INDEXES:
+        names = [name for name, _ in keys]
+        size = len(equality_fields)
+        if set(names[:size]) == equality_fields and names[size:size + 2] == [sort_field, "id"]:
+            return True
+    return False
+
+
+def parse_fields(model, fields: Optional[str], sort_field: str) -> Optional[list]:
+    if not fields:
+        return None
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in model.model_fields]
+    if unknown:
+        _bad_request(f"Unknown fields: {', '.join(unknown)}")
+    for required in ("id", sort_field):
+        if required not in requested:
+            requested.append(required)
+    return requested
+
+
+def _parse_value(kind, raw: str, field: str):
+    try:
+        if kind is datetime:
+            return datetime.fromisoformat(raw)
+        if kind is str:
+            return raw
+        return kind(raw).value
+    except ValueError:
+        _bad_request(f"Invalid value for {field}: {raw}")
+
+
+def parse_filters(collection: str, query_params) -> tuple:
+    """Return ``(equality, ranges)`` from the ``filter[...]`` query parameters."""
+    equality, ranges = {}, {}
+    for key, raw in query_params.multi_items():
+        if not key.startswith("filter["):
+            continue
+        parts = key[len("filter"):].replace("]", "").split("[")[1:]
+        if len(parts) == 1 and parts[0] in FILTER_FIELDS[collection]:
+            field = parts[0]
+            kind = FILTER_FIELDS[collection][field]
+            values = [_parse_value(kind, value, field) for value in raw.split(",") if value != ""]
+            equality[field] = values[0] if len(values) == 1 else {"$in": values}
+        elif len(parts) == 2 and parts[0] in RANGE_FIELDS[collection] and parts[1] in RANGE_OPERATORS:
+            field, op = parts
+            ranges.setdefault(field, {})[f"${op}"] = _parse_value(RANGE_FIELDS[collection][field], raw, field)
+        else:
+            _bad_request(f"Unsupported filter: {key}")
+    return equality, ranges
+
+
+def parse_sort(collection: str, sort: Optional[str], ranges: dict) -> list:
+    if len(ranges) > 1:
+        _bad_request("Only one range filter is supported per query")
+    range_field = next(iter(ranges), None)
+    if not sort:
+        return sort_key(range_field) if range_field else SORT_KEY
+    direction = DESCENDING if sort.startswith("-") else ASCENDING
+    field = sort.lstrip("-+")
+    if field not in SORT_FIELDS[collection]:
+        _bad_request(f"Cannot sort on {field}")
+    if range_field and range_field != field:
+        _bad_request(f"A range filter on {range_field} requires sorting on {range_field}")
+    return sort_key(field, direction)
+
+
+class ListQuery:
+    def __init__(self, query: dict, sort: list, fields: Optional[list]):
+        self.query = query
+        self.sort = sort
+        self.fields = fields
+
+    def projection(self, default: dict) -> dict:
+        if self.fields is None:
+            return default
+        projection = {field: 1 for field in self.fields}
+        projection["_id"] = 0
+        return projection
+
+
+def compile_list_query(collection: str, model, query_params, owner_id: Optional[str],
+                       fields: Optional[str] = None, sort: Optional[str] = None) -> ListQuery:
+    equality, ranges = parse_filters(collection, query_params)
+    sort_spec = parse_sort(collection, sort, ranges)
+    sort_field = sort_spec[0][0]
+
+    query = dict(equality)
+    if owner_id is not None:
+        query["created_by"] = owner_id
+    query.update(ranges)
+
+    if not is_index_backed(collection, set(equality) | ({"created_by"} if owner_id is not None else set()), sort_field):
+        filters = ", ".join(sorted(equality)) or "no filter"
+        _bad_request(f"No index supports {filters} sorted by {sort_field}; drop a filter or change the sort")
+
+    return ListQuery(query, sort_spec, parse_fields(model, fields, sort_field))
@@ -0,0 +1,1306 @@
+"""Process-local storage engine implementing the Motor subset the app uses.
+
+Selected with ``STORAGE_ENGINE=memory`` (see ``storage``), it runs the whole
+route stack without a database, for tests and for benchmarks that separate
+framework overhead from database latency.
+
+Each collection keeps its documents in a dict keyed by ``_id`` (insertion
+order is the natural order) plus:
+
+* hash indexes on ``HASH_INDEXED_FIELDS`` and on every single-field unique
+  index declared through ``create_indexes``, mapping a value (or each
+  element of an array value) to the ``_id`` holding it, or to a set of them
+  once there are several.  Equality and ``$in`` filters on those fields
+  only visit the matching documents.
+* ordered indexes, built on the first sorted and limited read of a sort
+  order and then maintained on every write (at most
+  ``MAX_ORDERED_INDEXES`` per collection), partitioned by a selective
+  equality field of the filter such as ``created_by``.  A keyset page is a
+  bisect to the filter's bound on the first sort field followed by a walk
+  that stops once the page is full.
+
+Writes behave like Mongo where the app can tell: values are stored as BSON
+would round-trip them (plain ``str`` for str enums, datetimes truncated to
+milliseconds), reads return copies, ``insert_*`` set ``_id`` on the caller's
+documents, unique violations raise ``DuplicateKeyError``/``BulkWriteError``
+with code 11000, capped collections drop their oldest documents and
+tailable cursors wait for inserts.
+
+Queries support the operators the code base uses (``$eq``, ``$ne``, ``$in``,
+``$nin``, ranges, ``$exists``, ``$all``, ``$and``, ``$or``, ``$nor``; updates
+``$set``, ``$unset``, ``$inc``, ``$setOnInsert``; aggregation ``$match``,
+``$project``, ``$unwind``, ``$group``, ``$sort``, ``$count``, ``$skip``,
+``$limit``).  Anything else, ``$text`` and ``explain`` included, raises
+``UnsupportedOperation``, an ``OperationFailure`` with Mongo's
+``CommandNotSupported`` code that the API answers with ``501``.
+"""
+import asyncio
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import count
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import CursorType, DeleteMany, DeleteOne, InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+# Lookups the routes make by equality; search_prefixes is left out, it would double the memory per lead
+HASH_INDEXED_FIELDS = ("id", "created_by", "stage", "email", "dedupe_keys")
+MAX_ORDERED_INDEXES = 4
+# Below this many candidates from a hash index, sorting them always beats walking an ordered index
+ORDERED_SCAN_MIN = 500
+# Sorting a candidate (computing its sort key) costs about as much as testing this many index entries
+SORT_KEY_COST = 3
+# Equality conditions matching under 1/this of the documents get an ordered index partitioned by that field
+PARTITION_SELECTIVITY = 8
+# Inserts larger than this drop the ordered indexes, which are rebuilt by the next sorted read
+BULK_REBUILD_SIZE = 1000
+# Capped collections are sized in bytes; documents are counted at this average size
+CAPPED_DOCUMENT_BYTES = 512
+
+# Mongo's CommandNotSupported
+UNSUPPORTED_CODE = 115
+
+MISSING = object()
+
+
+class UnsupportedOperation(OperationFailure):
+    """A query, update or command outside the subset this engine implements."""
+
+    def __init__(self, message: str):
+        super().__init__(message, UNSUPPORTED_CODE)
+
+
+# Values ---------------------------------------------------------------------
+
+def _to_storage(value):
+    """``value`` as it would come back from Mongo."""
+    kind = type(value)
+    if kind is str or kind is int or kind is float or kind is bool or value is None or kind is ObjectId:
+        return value
+    if kind is dict:
+        return {key: _to_storage(item) for key, item in value.items()}
+    if kind is list or kind is tuple:
+        return [_to_storage(item) for item in value]
+    if kind is datetime:
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    if isinstance(value, str):
+        return str.__str__(value)
+    if isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, dict):
+        return {key: _to_storage(item) for key, item in value.items()}
+    return value
+
+
+def _copy(value):
+    kind = type(value)
+    if kind is dict:
+        return {key: _copy(item) for key, item in value.items()}
+    if kind is list:
+        return [_copy(item) for item in value]
+    return value
+
+
+def _bracket(value) -> int:
+    """Mongo's type order; comparisons only match values of the same bracket."""
+    if value is None or value is MISSING:
+        return 1
+    kind = type(value)
+    if kind is int or kind is float:
+        return 2
+    if kind is str:
+        return 3
+    if kind is dict:
+        return 4
+    if kind is list:
+        return 5
+    if kind is ObjectId:
+        return 7
+    if kind is bool:
+        return 8
+    if kind is datetime:
+        return 9
+    return 10
+
+
+def _sort_key(value) -> tuple:
+    bracket = _bracket(value)
+    if bracket == 1:
+        return (1, 0)
+    if bracket in (4, 5, 10):
+        return (bracket, repr(value))
+    return (bracket, value)
+
+
+def _getter(path: str):
+    if "." not in path:
+        return lambda doc: doc.get(path, MISSING)
+    parts = path.split(".")
+
+    def get(doc):
+        value = doc
+        for part in parts:
+            if type(value) is dict:
+                value = value.get(part, MISSING)
+            elif type(value) is list and part.isdigit():
+                index = int(part)
+                value = value[index] if index < len(value) else MISSING
+            else:
+                return MISSING
+            if value is MISSING:
+                return MISSING
+        return value
+
+    return get
+
+
+# Both copy the embedded documents along the path, so a shallow copy of a
+# stored document can be updated without changing the stored one
+
+def _set_path(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc[part] = doc = dict(doc.get(part, {}))
+    doc[last] = value
+
+
+def _unset_path(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        child = doc.get(part)
+        if type(child) is not dict:
+            return
+        doc[part] = doc = dict(child)
+    doc.pop(last, None)
+
+
+def _hash_add(index: dict, value, _id):
+    holders = index.get(value, MISSING)
+    if holders is MISSING:
+        index[value] = _id
+    elif type(holders) is set:
+        holders.add(_id)
+    elif holders != _id:
+        index[value] = {holders, _id}
+
+
+def _hash_discard(index: dict, value, _id):
+    holders = index.get(value, MISSING)
+    if type(holders) is set:
+        holders.discard(_id)
+        if len(holders) == 1:
+            index[value] = next(iter(holders))
+    elif holders is not MISSING and holders == _id:
+        del index[value]
+
+
+def _hash_ids(index: dict, value):
+    """``_id``s holding ``value``; a set owned by the index or a tuple, never to be modified."""
+    holders = index.get(value, MISSING)
+    if holders is MISSING:
+        return ()
+    return holders if type(holders) is set else (holders,)
+
+
+# Filters --------------------------------------------------------------------
+
+def _is_operator_dict(value) -> bool:
+    return type(value) is dict and bool(value) and all(key.startswith("$") for key in value)
+
+
+def _equals(value, target) -> bool:
+    kind = type(value)
+    if kind is type(target) and kind is not list:
+        return value == target
+    if value is MISSING:
+        return target is None
+    if kind is list:
+        return value == target or target in value
+    return value == target and _bracket(value) == _bracket(target)
+
+
+def _compile_in(targets: list, negate: bool):
+    targets = [_to_storage(target) for target in targets]
+    has_none = any(target is None for target in targets)
+    try:
+        lookup = frozenset(target for target in targets if type(target) not in (list, dict))
+        plain = len(lookup) == len(targets)
+    except TypeError:
+        plain = False
+
+    def test(value):
+        if value is MISSING:
+            found = has_none
+        elif plain and type(value) not in (list, dict):
+            found = value in lookup and _bracket(value) != 8 or (type(value) is bool and value in lookup)
+        else:
+            found = any(_equals(value, target) for target in targets)
+        return found != negate
+
+    return test
+
+
+def _compile_range(op: str, target):
+    target = _to_storage(target)
+    bracket = _bracket(target)
+
+    def compare(value) -> bool:
+        if _bracket(value) != bracket:
+            return False
+        if bracket == 1:
+            return op in ("$gte", "$lte")
+        if op == "$gt":
+            return value > target
+        if op == "$gte":
+            return value >= target
+        if op == "$lt":
+            return value < target
+        return value <= target
+
+    def test(value):
+        if type(value) is list:
+            return any(compare(item) for item in value)
+        return compare(value)
+
+    return test
+
+
+def _compile_operator(op: str, arg):
+    if op == "$eq":
+        target = _to_storage(arg)
+        return lambda value: _equals(value, target)
+    if op == "$ne":
+        target = _to_storage(arg)
+        return lambda value: not _equals(value, target)
+    if op == "$in":
+        return _compile_in(arg, negate=False)
+    if op == "$nin":
+        return _compile_in(arg, negate=True)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return _compile_range(op, arg)
+    if op == "$exists":
+        wanted = bool(arg)
+        return lambda value: (value is not MISSING) == wanted
+    if op == "$all":
+        targets = [_to_storage(target) for target in arg]
+
+        def test(value):
+            if type(value) is list:
+                return bool(targets) and all(target in value for target in targets)
+            return value is not MISSING and bool(targets) and all(value == target for target in targets)
+
+        return test
+    raise UnsupportedOperation(f"{op} is not supported by the in-memory engine")
+
+
+def _always(doc) -> bool:
+    return True
+
+
+def compile_filter(query: Optional[dict]):
+    """Predicate over stored documents for a Mongo filter."""
+    if not query:
+        return _always
+    clauses = [_compile_clause(key, condition) for key, condition in query.items()]
+    if len(clauses) == 1:
+        return clauses[0]
+    return lambda doc: all(clause(doc) for clause in clauses)
+
+
+def _compile_clause(key: str, condition):
+    if key in ("$and", "$or", "$nor"):
+        branches = [compile_filter(branch) for branch in condition]
+        if key == "$and":
+            return lambda doc: all(branch(doc) for branch in branches)
+        if key == "$or":
+            return lambda doc: any(branch(doc) for branch in branches)
+        return lambda doc: not any(branch(doc) for branch in branches)
+    if key.startswith("$"):
+        raise UnsupportedOperation(f"{key} is not supported by the in-memory engine")
+
+    get = _getter(key)
+    if _is_operator_dict(condition):
+        tests = [_compile_operator(op, arg) for op, arg in condition.items()]
+        if len(tests) == 1:
+            test = tests[0]
+            return lambda doc: test(get(doc))
+
+        def clause(doc):
+            value = get(doc)
+            return all(test(value) for test in tests)
+
+        return clause
+    target = _to_storage(condition)
+    return lambda doc: _equals(get(doc), target)
+
+
+def _equality_values(condition) -> Optional[list]:
+    """Values a hash index can look up for ``condition``, or None if it cannot be used."""
+    if _is_operator_dict(condition):
+        if set(condition) == {"$eq"}:
+            condition = condition["$eq"]
+        elif set(condition) == {"$in"}:
+            values = [_to_storage(value) for value in condition["$in"]]
+            if any(value is None or type(value) in (list, dict) for value in values):
+                return None
+            return values
+        else:
+            return None
+    if condition is None or type(condition) in (list, dict) or _is_operator_dict(condition):
+        return None
+    return [_to_storage(condition)]
+
+
+def _tighten(current, bound, lower: bool):
+    if bound is None:
+        return current
+    if current is None:
+        return bound
+    if current[0] == bound[0]:
+        return (current[0], current[1] and bound[1])
+    return max(current, bound) if lower else min(current, bound)
+
+
+def _loosen(bounds: list, lower: bool):
+    if any(bound is None for bound in bounds):
+        return None
+    loosest = min(bounds) if lower else max(bounds)
+    return (loosest[0], any(bound[1] for bound in bounds if bound[0] == loosest[0]))
+
+
+def _field_bounds(query: dict, field: str) -> tuple:
+    """``(low, high)`` sort-key bounds on ``field`` implied by ``query``; each ``(key, inclusive)`` or None."""
+    low = high = None
+    for key, condition in query.items():
+        if key == field:
+            if _is_operator_dict(condition):
+                for op, arg in condition.items():
+                    bound = (_sort_key(_to_storage(arg)), op in ("$gte", "$lte", "$eq"))
+                    if op in ("$gt", "$gte", "$eq"):
+                        low = _tighten(low, bound, lower=True)
+                    if op in ("$lt", "$lte", "$eq"):
+                        high = _tighten(high, bound, lower=False)
+            elif type(condition) not in (list, dict):
+                bound = (_sort_key(_to_storage(condition)), True)
+                low, high = _tighten(low, bound, True), _tighten(high, bound, False)
+        elif key == "$and":
+            for branch in condition:
+                branch_low, branch_high = _field_bounds(branch, field)
+                low, high = _tighten(low, branch_low, True), _tighten(high, branch_high, False)
+        elif key == "$or":
+            branches = [_field_bounds(branch, field) for branch in condition]
+            low = _tighten(low, _loosen([branch[0] for branch in branches], True), True)
+            high = _tighten(high, _loosen([branch[1] for branch in branches], False), False)
+    return low, high
+
+
+# Projections and sorting ----------------------------------------------------
+
+def compile_projection(projection):
+    if projection is None:
+        return _copy
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = bool(projection.get("_id", True))
+    fields = {field: flag for field, flag in projection.items() if field != "_id"}
+    if any(type(flag) is dict for flag in fields.values()):
+        raise UnsupportedOperation("Projection operators are not supported by the in-memory engine")
+    included = [field for field, flag in fields.items() if flag]
+    if included:
+        nested = [(field, _getter(field)) for field in included if "." in field]
+        wanted = set(included) | ({"_id"} if include_id else set())
+
+        def project(doc):
+            out = {key: _copy(value) for key, value in doc.items() if key in wanted}
+            for field, get in nested:
+                value = get(doc)
+                if value is not MISSING:
+                    _set_path(out, field, _copy(value))
+            return out
+
+        return project
+    excluded = {field for field, flag in fields.items() if not flag}
+    if not include_id:
+        excluded.add("_id")
+    return lambda doc: {key: _copy(value) for key, value in doc.items() if key not in excluded}
+
+
+def _normalize_sort(key_or_list, direction=None) -> list:
+    if key_or_list is None:
+        return []
+    if isinstance(key_or_list, str):
+        return [(key_or_list, 1 if direction is None else direction)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(field, order) for field, order in key_or_list]
+
+
+def _key_function(fields: tuple):
+    getters = [_getter(field) for field in fields]
+    if len(getters) == 1:
+        get = getters[0]
+        return lambda doc: (_sort_key(get(doc)),)
+    return lambda doc: tuple(_sort_key(get(doc)) for get in getters)
+
+
+def _sorted(docs, sort: list) -> list:
+    docs = list(docs)
+    for field, direction in reversed(sort):
+        docs.sort(key=_key_function((field,)), reverse=direction == -1)
+    return docs
+
+
+class OrderedIndex:
+    """Entries ``(sort key, seq, _id)`` kept in ascending order.
+
+    With a ``partition`` field there is one list per value of that field,
+    like a compound index with the field in front.  Such an index stops
+    being ``usable`` once a document holds an array or object there.
+    """
+
+    def __init__(self, partition: Optional[str], fields: tuple, docs: dict, seqs: dict):
+        self.partition = partition
+        self.fields = fields
+        self.key = _key_function(fields)
+        self.first = _getter(fields[0])
+        self.multikey = False
+        self.usable = True
+        self.lists = {}
+        for _id, doc in docs.items():
+            self.lists.setdefault(self._partition_value(doc), []).append(self._entry(_id, doc, seqs[_id]))
+        for entries in self.lists.values():
+            entries.sort()
+
+    def _partition_value(self, doc: dict):
+        if self.partition is None:
+            return None
+        value = doc.get(self.partition)
+        if type(value) in (list, dict):
+            self.usable = False
+            return None
+        return value
+
+    def _entry(self, _id, doc: dict, seq: int) -> tuple:
+        if type(self.first(doc)) is list:
+            self.multikey = True
+        return (self.key(doc), seq, _id)
+
+    def entries(self, value=None) -> list:
+        return self.lists.get(value, [])
+
+    def add(self, _id, doc: dict, seq: int):
+        entry = self._entry(_id, doc, seq)
+        entries = self.lists.setdefault(self._partition_value(doc), [])
+        entries.insert(bisect_left(entries, entry), entry)
+
+    def remove(self, _id, doc: dict, seq: int):
+        value = self._partition_value(doc)
+        entries = self.lists.get(value, [])
+        position = bisect_left(entries, (self.key(doc), seq))
+        if position < len(entries) and entries[position][2] == _id:
+            del entries[position]
+            if not entries and self.partition is not None:
+                del self.lists[value]
+
+    def positions(self, entries: list, low, high) -> tuple:
+        """Range of ``entries`` whose first sort key lies within the bounds."""
+        if self.multikey:
+            return 0, len(entries)
+        first = lambda entry: entry[0][0]
+        start, end = 0, len(entries)
+        if low is not None:
+            start = (bisect_left if low[1] else bisect_right)(entries, low[0], key=first)
+        if high is not None:
+            end = (bisect_right if high[1] else bisect_left)(entries, high[0], key=first)
+        return start, end
+
+
+# Cursors --------------------------------------------------------------------
+
+class MemoryCursor:
+    """``find()`` cursor; the query runs on the first fetch, like Motor's."""
+
+    def __init__(self, collection, query: Optional[dict] = None, projection=None, sort=None, limit: int = 0,
+                 skip: int = 0, cursor_type=CursorType.NON_TAILABLE, batch_size: int = 0, **kwargs):
+        self.collection = collection
+        self.query = query or {}
+        self.project = compile_projection(projection)
+        self._sort = _normalize_sort(sort)
+        self._limit = limit
+        self._skip = skip
+        self.tailable = cursor_type in (CursorType.TAILABLE, CursorType.TAILABLE_AWAIT)
+        self._results = None
+        self._position = 0
+        self._last_seq = -1
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def batch_size(self, batch_size: int):
+        return self
+
+    @property
+    def alive(self) -> bool:
+        return self.tailable or self._results is None or self._position < len(self._results)
+
+    def _fetch(self):
+        if self._results is None:
+            self._results = self.collection._select(self.query, self._sort, self._skip, self._limit)
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        self._fetch()
+        end = len(self._results) if length is None else self._position + length
+        docs = self._results[self._position:end]
+        self._position += len(docs)
+        return [self.project(doc) for doc in docs]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.tailable:
+            return await self._next_tailed()
+        self._fetch()
+        if self._position >= len(self._results):
+            raise StopAsyncIteration
+        doc = self._results[self._position]
+        self._position += 1
+        return self.project(doc)
+
+    async def _next_tailed(self):
+        predicate = compile_filter(self.query)
+        while True:
+            for seq, doc in self.collection._appended_since(self._last_seq):
+                self._last_seq = seq
+                if predicate(doc):
+                    return self.project(doc)
+            await self.collection._wait_for_insert()
+
+
+class MemoryResultCursor:
+    """Cursor over already computed rows, as returned by ``aggregate``."""
+
+    def __init__(self, compute):
+        self._compute = compute
+        self._rows = None
+        self._position = 0
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        if self._rows is None:
+            self._rows = self._compute()
+        end = len(self._rows) if length is None else self._position + length
+        rows = self._rows[self._position:end]
+        self._position += len(rows)
+        return rows
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        rows = await self.to_list(1)
+        if not rows:
+            raise StopAsyncIteration
+        return rows[0]
+
+
+# Aggregation ----------------------------------------------------------------
+
+def _truthy(value) -> bool:
+    return value not in (None, False, 0) and value is not MISSING
+
+
+def _evaluate(expression, doc):
+    if type(expression) is str:
+        if expression.startswith("$"):
+            value = _getter(expression[1:])(doc)
+            return None if value is MISSING else value
+        return expression
+    if type(expression) is list:
+        return [_evaluate(item, doc) for item in expression]
+    if type(expression) is not dict:
+        return expression
+    if not _is_operator_dict(expression):
+        evaluated = {}
+        for key, value in expression.items():
+            # Missing fields are left out of objects rather than set to null
+            if type(value) is str and value.startswith("$") and _getter(value[1:])(doc) is MISSING:
+                continue
+            evaluated[key] = _evaluate(value, doc)
+        return evaluated
+    (op, arg), = expression.items()
+    if op == "$literal":
+        return arg
+    if op == "$cond":
+        if type(arg) is dict:
+            arg = [arg["if"], arg["then"], arg["else"]]
+        return _evaluate(arg[1] if _truthy(_evaluate(arg[0], doc)) else arg[2], doc)
+    args = [_evaluate(item, doc) for item in (arg if type(arg) is list else [arg])]
+    if op == "$ifNull":
+        return next((value for value in args if value is not None), None)
+    if op == "$eq":
+        return args[0] == args[1]
+    if op == "$ne":
+        return args[0] != args[1]
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return _compile_range(op, args[1])(args[0])
+    if op == "$in":
+        return args[0] in args[1]
+    if op == "$and":
+        return all(_truthy(value) for value in args)
+    if op == "$or":
+        return any(_truthy(value) for value in args)
+    if op == "$not":
+        return not _truthy(args[0])
+    if op == "$add":
+        return sum(args)
+    if op == "$subtract":
+        return args[0] - args[1]
+    if op == "$multiply":
+        product = 1
+        for value in args:
+            product *= value
+        return product
+    if op == "$divide":
+        return args[0] / args[1]
+    raise UnsupportedOperation(f"{op} is not supported by the in-memory engine")
+
+
+def _freeze(value):
+    if type(value) is dict:
+        return tuple((key, _freeze(item)) for key, item in value.items())
+    if type(value) is list:
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _is_number(value) -> bool:
+    return type(value) in (int, float)
+
+
+def _group(rows: list, spec: dict) -> list:
+    key_expression = spec["_id"]
+    accumulators = []
+    for name, accumulator in spec.items():
+        if name == "_id":
+            continue
+        (op, arg), = accumulator.items()
+        if op not in ("$sum", "$avg", "$min", "$max", "$first", "$last", "$push", "$addToSet"):
+            raise UnsupportedOperation(f"{op} is not supported by the in-memory engine")
+        accumulators.append((name, op, arg))
+
+    groups = {}
+    for row in rows:
+        key = _evaluate(key_expression, row)
+        group = groups.get(_freeze(key))
+        if group is None:
+            group = groups[_freeze(key)] = {"_id": key, **{name: _initial(op) for name, op, _ in accumulators}}
+        for name, op, arg in accumulators:
+            value = _evaluate(arg, row)
+            if op == "$sum":
+                if _is_number(value):
+                    group[name] += value
+            elif op == "$avg":
+                if _is_number(value):
+                    group[name][0] += value
+                    group[name][1] += 1
+            elif op in ("$min", "$max"):
+                if value is not None and (group[name] is None or (value < group[name]) == (op == "$min")):
+                    group[name] = value
+            elif op == "$first":
+                if group[name] is MISSING:
+                    group[name] = value
+            elif op == "$last":
+                group[name] = value
+            elif op == "$push":
+                group[name].append(value)
+            elif value not in group[name]:
+                group[name].append(value)
+
+    results = []
+    for group in groups.values():
+        for name, op, _ in accumulators:
+            if op == "$avg":
+                total, number = group[name]
+                group[name] = total / number if number else None
+            elif op == "$first" and group[name] is MISSING:
+                group[name] = None
+        results.append(group)
+    return results
+
+
+def _initial(op: str):
+    if op == "$sum":
+        return 0
+    if op == "$avg":
+        return [0, 0]
+    if op in ("$push", "$addToSet"):
+        return []
+    if op == "$first":
+        return MISSING
+    return None
+
+
+def _unwind(rows: list, spec) -> list:
+    path = (spec if type(spec) is str else spec["path"])[1:]
+    get = _getter(path)
+    unwound = []
+    for row in rows:
+        value = get(row)
+        if type(value) is list:
+            for item in value:
+                copy = dict(row)
+                _set_path(copy, path, item)
+                unwound.append(copy)
+        elif value is not MISSING and value is not None:
+            unwound.append(row)
+    return unwound
+
+
+# Collections ----------------------------------------------------------------
+
+class MemoryCollection:
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self.created = False
+        self._docs = {}
+        self._seqs = {}
+        self._sequence = count()
+        self._hash = {field: {} for field in HASH_INDEXED_FIELDS}
+        self._unique = set()
+        self._declared = {"_id_": {"key": [("_id", 1)]}}
+        self._ordered = {}
+        self._capped_max = None
+        self._inserted = None
+
+    # Index maintenance
+
+    def _hash_values(self, doc: dict, field: str) -> list:
+        value = doc.get(field, MISSING)
+        if value is MISSING:
+            return []
+        values = value if type(value) is list else [value]
+        return [item for item in values if type(item) not in (list, dict)]
+
+    def _index(self, _id, doc: dict, seq: int):
+        for field, index in self._hash.items():
+            for value in self._hash_values(doc, field):
+                _hash_add(index, value, _id)
+        for ordered in self._ordered.values():
+            ordered.add(_id, doc, seq)
+
+    def _unindex(self, _id, doc: dict, seq: int, fields=None):
+        for field, index in self._hash.items():
+            if fields is not None and field not in fields:
+                continue
+            for value in self._hash_values(doc, field):
+                _hash_discard(index, value, _id)
+
+    def _check_unique(self, doc: dict, _id=None):
+        for field in self._unique:
+            for value in self._hash_values(doc, field) or [None]:
+                holders = _hash_ids(self._hash[field], value)
+                if any(holder != _id for holder in holders):
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} index: {field}_1 dup key: {value!r}",
+                        11000,
+                    )
+
+    def _store(self, doc: dict):
+        _id = doc["_id"]
+        if _id in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_ dup key: {_id!r}",
+                                    11000)
+        self._check_unique(doc)
+        seq = next(self._sequence)
+        self._docs[_id] = doc
+        self._seqs[_id] = seq
+        self._index(_id, doc, seq)
+        self.created = True
+        if self._capped_max is not None:
+            while len(self._docs) > self._capped_max:
+                self._remove(next(iter(self._docs)))
+
+    def _remove(self, _id):
+        doc = self._docs.pop(_id)
+        seq = self._seqs.pop(_id)
+        self._unindex(_id, doc, seq)
+        for ordered in self._ordered.values():
+            ordered.remove(_id, doc, seq)
+        return doc
+
+    def _replace(self, _id, before: dict, after: dict):
+        changed = {field for field in self._hash if before.get(field, MISSING) != after.get(field, MISSING)}
+        if changed & self._unique:
+            self._check_unique(after, _id)
+        seq = self._seqs[_id]
+        self._unindex(_id, before, seq, changed)
+        for ordered in self._ordered.values():
+            ordered.remove(_id, before, seq)
+        self._docs[_id] = after
+        for field in changed:
+            for value in self._hash_values(after, field):
+                _hash_add(self._hash[field], value, _id)
+        for ordered in self._ordered.values():
+            ordered.add(_id, after, seq)
+
+    def _notify_insert(self):
+        if self._inserted is not None:
+            self._inserted.set()
+            self._inserted = None
+
+    async def _wait_for_insert(self):
+        if self._inserted is None:
+            self._inserted = asyncio.Event()
+        await self._inserted.wait()
+
+    def _appended_since(self, last_seq: int) -> list:
+        newer = []
+        for _id in reversed(self._docs):
+            seq = self._seqs[_id]
+            if seq <= last_seq:
+                break
+            newer.append((seq, self._docs[_id]))
+        newer.reverse()
+        return newer
+
+    # Query planning
+
+    def _best_equality(self, query: dict) -> Optional[tuple]:
+        """``(field, values, ids)`` of the equality condition with the fewest ``_id``s in a hash index."""
+        best = None
+        for field, condition in query.items():
+            if field == "$and":
+                for branch in condition:
+                    found = self._best_equality(branch)
+                    if found is not None and (best is None or len(found[2]) < len(best[2])):
+                        best = found
+                continue
+            index = self._hash.get(field)
+            if index is None:
+                continue
+            values = _equality_values(condition)
+            if values is None:
+                continue
+            if len(values) == 1:
+                ids = _hash_ids(index, values[0])
+            else:
+                ids = set()
+                for value in values:
+                    ids.update(_hash_ids(index, value))
+            if best is None or len(ids) < len(best[2]):
+                best = (field, values, ids)
+        return best
+
+    def _ordered_index(self, partition: Optional[str], fields: tuple) -> OrderedIndex:
+        index = self._ordered.pop((partition, fields), None)
+        if index is None:
+            index = OrderedIndex(partition, fields, self._docs, self._seqs)
+            while len(self._ordered) >= MAX_ORDERED_INDEXES:
+                self._ordered.pop(next(iter(self._ordered)))
+        # Most recently used last
+        self._ordered[(partition, fields)] = index
+        return index
+
+    def _select(self, query: Optional[dict], sort: list = (), skip: int = 0, limit: int = 0) -> list:
+        """Stored documents (not copies) matching ``query``, in order."""
+        query = query or {}
+        predicate = compile_filter(query)
+        equality = self._best_equality(query)
+        candidates = None if equality is None else equality[2]
+        wanted = skip + limit if limit else None
+
+        if not sort or sort[0][0] == "$natural":
+            if candidates is None:
+                source = self._docs.values()
+            else:
+                source = (self._docs[_id] for _id in sorted(candidates, key=self._seqs.__getitem__))
+            if sort and sort[0][1] == -1:
+                source = reversed(list(source))
+            matches = []
+            for doc in source:
+                if predicate(doc):
+                    matches.append(doc)
+                    if wanted is not None and len(matches) >= wanted:
+                        break
+            return matches[skip:]
+
+        fields = tuple(field for field, _ in sort)
+        directions = {direction for _, direction in sort}
+        if wanted is not None and len(directions) == 1:
+            descending = directions.pop() == -1
+            total = len(self._docs)
+            size = total if candidates is None else len(candidates)
+            if size > ORDERED_SCAN_MIN:
+                if equality is not None and len(equality[1]) == 1 and size * PARTITION_SELECTIVITY < total:
+                    index = self._ordered_index(equality[0], fields)
+                    if index.usable:
+                        entries = index.entries(equality[1][0])
+                        return self._walk(index, entries, descending, query, predicate, wanted)[skip:]
+                if wanted * total < size * size * SORT_KEY_COST:
+                    index = self._ordered_index(None, fields)
+                    return self._walk(index, index.entries(), descending, query, predicate, wanted)[skip:]
+            source = self._docs.values() if candidates is None else (self._docs[_id] for _id in candidates)
+            matches = [doc for doc in source if predicate(doc)]
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            return pick(wanted, matches, key=_key_function(fields))[skip:]
+
+        source = self._docs.values() if candidates is None else (self._docs[_id] for _id in candidates)
+        return _sorted([doc for doc in source if predicate(doc)], sort)[skip:wanted]
+
+    def _walk(self, index: OrderedIndex, entries: list, descending: bool, query: dict, predicate,
+              wanted: int) -> list:
+        start, end = index.positions(entries, *_field_bounds(query, index.fields[0]))
+        positions = range(end - 1, start - 1, -1) if descending else range(start, end)
+        docs = self._docs
+        matches = []
+        for position in positions:
+            doc = docs[entries[position][2]]
+            if predicate(doc):
+                matches.append(doc)
+                if len(matches) >= wanted:
+                    break
+        return matches
+
+    # Updates
+
+    def _updated(self, doc: dict, update: dict, inserting: bool) -> dict:
+        if not _is_operator_dict(update):
+            raise UnsupportedOperation("Replacement updates are not supported by the in-memory engine")
+        doc = dict(doc)
+        for op, fields in update.items():
+            if op == "$set":
+                for path, value in fields.items():
+                    _set_path(doc, path, _to_storage(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    for path, value in fields.items():
+                        _set_path(doc, path, _to_storage(value))
+            elif op == "$unset":
+                for path in fields:
+                    _unset_path(doc, path)
+            elif op == "$inc":
+                for path, amount in fields.items():
+                    current = _getter(path)(doc)
+                    if current is MISSING:
+                        current = 0
+                    elif not _is_number(current):
+                        raise OperationFailure(f"Cannot apply $inc to a value of non-numeric type at {path}", 14)
+                    _set_path(doc, path, current + amount)
+            else:
+                raise UnsupportedOperation(f"{op} is not supported by the in-memory engine")
+        return doc
+
+    def _upsert_document(self, query: dict, update: dict) -> dict:
+        doc = {}
+        for field, condition in query.items():
+            if field.startswith("$"):
+                continue
+            if _is_operator_dict(condition):
+                if set(condition) != {"$eq"}:
+                    continue
+                condition = condition["$eq"]
+            _set_path(doc, field, _to_storage(condition))
+        doc = self._updated(doc, update, inserting=True)
+        doc.setdefault("_id", ObjectId())
+        return doc
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool) -> dict:
+        """Apply an update; returns ``{"n", "nModified", "upserted", "before", "after"}``."""
+        targets = self._select(query, limit=0 if many else 1)
+        if not targets:
+            if not upsert:
+                return {"n": 0, "nModified": 0, "upserted": None, "before": None, "after": None}
+            doc = self._upsert_document(query, update)
+            self._store(doc)
+            return {"n": 1, "nModified": 0, "upserted": doc["_id"], "before": None, "after": doc}
+        modified = 0
+        before = after = None
+        for before in targets:
+            after = self._updated(before, update, inserting=False)
+            if after != before:
+                self._replace(before["_id"], before, after)
+                modified += 1
+        return {"n": len(targets), "nModified": modified, "upserted": None, "before": before, "after": after}
+
+    # Motor API
+
+    def find(self, *args, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, *args, **kwargs)
+
+    async def find_one(self, query: Optional[dict] = None, projection=None, sort=None, **kwargs) -> Optional[dict]:
+        docs = self._select(query, _normalize_sort(sort), limit=1)
+        return compile_projection(projection)(docs[0]) if docs else None
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        document.setdefault("_id", ObjectId())
+        self._store(_to_storage(document))
+        self._notify_insert()
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents, ordered: bool = True, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        if len(documents) > BULK_REBUILD_SIZE:
+            self._ordered.clear()
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            try:
+                self._store(_to_storage(document))
+                inserted.append(document["_id"])
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if inserted:
+            self._notify_insert()
+        if errors:
+            raise BulkWriteError(_bulk_result(errors, inserted=len(inserted)))
+        return InsertManyResult(inserted, True)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        result = self._update(query, update, upsert, many=False)
+        return _update_result(result)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        result = self._update(query, update, upsert, many=True)
+        return _update_result(result)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection=None, sort=None, upsert: bool = False,
+                                  return_document=ReturnDocument.BEFORE, **kwargs) -> Optional[dict]:
+        if sort:
+            docs = self._select(query, _normalize_sort(sort), limit=1)
+            query = {"_id": docs[0]["_id"]} if docs else query
+        result = self._update(query, update, upsert, many=False)
+        doc = result["after"] if return_document == ReturnDocument.AFTER else result["before"]
+        return None if doc is None else compile_projection(projection)(doc)
+
+    async def find_one_and_delete(self, query: dict, projection=None, sort=None, **kwargs) -> Optional[dict]:
+        docs = self._select(query, _normalize_sort(sort), limit=1)
+        if not docs:
+            return None
+        return compile_projection(projection)(self._remove(docs[0]["_id"]))
+
+    async def delete_one(self, query: dict, **kwargs) -> DeleteResult:
+        docs = self._select(query, limit=1)
+        for doc in docs:
+            self._remove(doc["_id"])
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def delete_many(self, query: dict, **kwargs) -> DeleteResult:
+        docs = self._select(query)
+        for doc in docs:
+            self._remove(doc["_id"])
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        totals = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    request._doc.setdefault("_id", ObjectId())
+                    self._store(_to_storage(request._doc))
+                    totals["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    result = self._update(request._filter, request._doc, request._upsert, isinstance(request, UpdateMany))
+                    if result["upserted"] is not None:
+                        totals["nUpserted"] += 1
+                        totals["upserted"].append({"index": index, "_id": result["upserted"]})
+                    else:
+                        totals["nMatched"] += result["n"]
+                        totals["nModified"] += result["nModified"]
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    docs = self._select(request._filter, limit=0 if isinstance(request, DeleteMany) else 1)
+                    for doc in docs:
+                        self._remove(doc["_id"])
+                    totals["nRemoved"] += len(docs)
+                else:
+                    raise UnsupportedOperation(f"{type(request).__name__} is not supported by the in-memory engine")
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": request})
+                if ordered:
+                    break
+        if totals["nInserted"] or totals["nUpserted"]:
+            self._notify_insert()
+        if errors:
+            raise BulkWriteError({**totals, "writeErrors": errors, "writeConcernErrors": []})
+        return BulkWriteResult(totals, True)
+
+    async def count_documents(self, query: dict, **kwargs) -> int:
+        return len(self._select(query))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, query: Optional[dict] = None, **kwargs) -> list:
+        get = _getter(key)
+        values, seen = [], set()
+        for doc in self._select(query):
+            value = get(doc)
+            for item in (value if type(value) is list else [value]):
+                if item is MISSING:
+                    continue
+                marker = _freeze(item)
+                if marker not in seen:
+                    seen.add(marker)
+                    values.append(_copy(item))
+        return values
+
+    def aggregate(self, pipeline: list, **kwargs) -> MemoryResultCursor:
+        return MemoryResultCursor(lambda: self._aggregate(list(pipeline)))
+
+    def _aggregate(self, pipeline: list) -> list:
+        if pipeline and "$match" in pipeline[0]:
+            rows = self._select(pipeline.pop(0)["$match"])
+        else:
+            rows = list(self._docs.values())
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                predicate = compile_filter(spec)
+                rows = [row for row in rows if predicate(row)]
+            elif name == "$project":
+                project = compile_projection(spec)
+                rows = [project(row) for row in rows]
+            elif name == "$unwind":
+                rows = _unwind(rows, spec)
+            elif name == "$sort":
+                rows = _sorted(rows, _normalize_sort(spec))
+            elif name == "$group":
+                rows = _group(rows, spec)
+            elif name == "$count":
+                rows = [{spec: len(rows)}] if rows else []
+            elif name == "$skip":
+                rows = rows[spec:]
+            elif name == "$limit":
+                rows = rows[:spec]
+            else:
+                raise UnsupportedOperation(f"{name} is not supported by the in-memory engine")
+        return [_copy(row) for row in rows]
+
+    async def create_indexes(self, models: list, **kwargs) -> list:
+        names = []
+        for model in models:
+            document = model.document
+            keys = list(document["key"].items())
+            if document.get("unique") and len(keys) == 1:
+                field = keys[0][0]
+                if field not in self._hash:
+                    self._hash[field] = {}
+                    for _id, doc in self._docs.items():
+                        for value in self._hash_values(doc, field):
+                            _hash_add(self._hash[field], value, _id)
+                duplicated = [value for value, ids in self._hash[field].items() if type(ids) is set]
+                if duplicated:
+                    raise OperationFailure(f"E11000 duplicate key error collection: {self.name} index: {field}_1", 11000)
+                self._unique.add(field)
+            self._declared[document["name"]] = {key: value for key, value in document.items() if key != "name"}
+            self._declared[document["name"]]["key"] = keys
+            names.append(document["name"])
+        self.created = True
+        return names
+
+    async def index_information(self) -> dict:
+        return _copy(self._declared)
+
+    async def create_index(self, keys, **kwargs) -> str:
+        from pymongo import IndexModel
+
+        return (await self.create_indexes([IndexModel(keys, **kwargs)]))[0]
+
+
+def _update_result(result: dict) -> UpdateResult:
+    raw = {"n": result["n"], "nModified": result["nModified"], "updatedExisting": result["upserted"] is None}
+    if result["upserted"] is not None:
+        raw["upserted"] = result["upserted"]
+    return UpdateResult(raw, True)
+
+
+def _bulk_result(errors: list, inserted: int = 0) -> dict:
+    return {
+        "writeErrors": errors,
+        "writeConcernErrors": [],
+        "nInserted": inserted,
+        "nUpserted": 0,
+        "nMatched": 0,
+        "nModified": 0,
+        "nRemoved": 0,
+        "upserted": [],
+    }
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def create_collection(self, name: str, capped: bool = False, size: Optional[int] = None,
+                                max: Optional[int] = None, **kwargs) -> MemoryCollection:
+        collection = self[name]
+        if collection.created:
+            raise CollectionInvalid(f"collection {name} already exists")
+        if capped:
+            collection._capped_max = max or max_documents(size)
+        collection.created = True
+        return collection
+
+    async def list_collection_names(self, **kwargs) -> list:
+        return [name for name, collection in self._collections.items() if collection.created]
+
+    async def drop_collection(self, name: str, **kwargs):
+        self._collections.pop(name, None)
+
+    async def command(self, command, **kwargs):
+        name = next(iter(command)) if isinstance(command, dict) else command
+        raise UnsupportedOperation(f"The {name} command is not supported by the in-memory engine")
+
+
+def max_documents(size: Optional[int]) -> int:
+    return max(1, (size or 0) // CAPPED_DOCUMENT_BYTES)
+
+
+class MemoryClient:
+    def __init__(self):
+        self._databases = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(name)
+        return database
+
+    async def drop_database(self, name: str):
+        self._databases.pop(name, None)
+
+    def close(self):
+        pass
@@ -0,0 +1,220 @@
+"""Request and MongoDB latency metrics in the Prometheus text format.
+
+* ``MetricsMiddleware`` times every HTTP request (until the last body chunk
+  is sent) into ``http_request_duration_seconds`` by method, route template
+  and status, shed and rate-limited requests included.
+* ``MongoCommandMetrics`` is a pymongo ``CommandListener`` registered on the
+  client; it records ``mongodb_command_duration_seconds`` and, for cursor
+  replies, ``mongodb_documents_returned`` by collection and command.  With
+  ``MONGO_SLOW_MS`` set, commands slower than that are logged with the shape
+  of the command (field names, never values).
+
+Both only do a bucket lookup and two additions under a lock per event, so
+they stay on in production (see ``benchmarks/metrics.py``).  Other modules
+contribute gauges through ``REGISTRY.add_collector``.  Everything is served
+by ``GET /metrics``, which requires ``Authorization: Bearer <METRICS_TOKEN>``
+when that variable is set.  Counters are per worker process.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+MONGO_SLOW_MS = float(os.environ.get('MONGO_SLOW_MS', 0))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DOCUMENT_BUCKETS = (0, 1, 10, 100, 1000, 10000)
+
+# Commands whose first field names something other than a collection
+NON_COLLECTION_COMMANDS = {"getMore", "killCursors"}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def total(self) -> tuple:
+        """``(count, sum)`` over every series."""
+        with self._lock:
+            return (
+                sum(sum(counts) for counts, _ in self._series.values()),
+                sum(total for _, total in self._series.values()),
+            )
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = _labels(self.label_names, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in snapshot)
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, name: str, help_text: str, collect: Callable[[], list], label_names: tuple = (),
+                      kind: str = "gauge"):
+        """Metric read on every scrape; ``collect()`` returns ``[(label values, value)]``."""
+        self._collectors.append((name, help_text, label_names, collect, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, label_names, collect, kind in self._collectors:
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+            lines.extend(f"{name}{_labels(label_names, labels)} {value}" for labels, value in collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"),
+))
+MONGO_DURATION = REGISTRY.register(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("collection", "command"),
+))
+MONGO_DOCUMENTS = REGISTRY.register(Histogram(
+    "mongodb_documents_returned", "Documents per cursor batch", ("collection", "command"), DOCUMENT_BUCKETS,
+))
+MONGO_FAILURES = REGISTRY.register(Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands", ("collection", "command"),
+))
+
+
+def _shape(value):
+    """Field names of a command document, with every value replaced by its type."""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Called from pymongo's threads, hence the locks in the metrics."""
+
+    def __init__(self, slow_ms: float = MONGO_SLOW_MS):
+        self.slow_ms = slow_ms
+        self._started = {}
+
+    def started(self, event):
+        name = event.command_name
+        collection = event.command.get("collection") if name in NON_COLLECTION_COMMANDS else event.command.get(name)
+        if not isinstance(collection, str):
+            collection = "-"
+        command = event.command if self.slow_ms else None
+        self._started[(event.connection_id, event.request_id)] = (collection, command)
+
+    def succeeded(self, event):
+        collection, command = self._started.pop((event.connection_id, event.request_id), ("-", None))
+        labels = (collection, event.command_name)
+        MONGO_DURATION.observe(labels, event.duration_micros / 1e6)
+        cursor = event.reply.get("cursor")
+        if cursor is not None:
+            batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+            if batch is not None:
+                MONGO_DOCUMENTS.observe(labels, len(batch))
+        if command is not None and event.duration_micros / 1000 >= self.slow_ms:
+            logger.warning(
+                "Slow MongoDB %s on %s: %.1f ms %s",
+                event.command_name, collection, event.duration_micros / 1000, _shape(command),
+            )
+
+    def failed(self, event):
+        collection, _ = self._started.pop((event.connection_id, event.request_id), ("-", None))
+        labels = (collection, event.command_name)
+        MONGO_DURATION.observe(labels, event.duration_micros / 1e6)
+        MONGO_FAILURES.inc(labels)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware; ``route_path(method, path)`` maps a request to its route template."""
+
+    def __init__(self, app, route_path: Callable[[str, str], Optional[str]]):
+        self.app = app
+        self.route_path = route_path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self.route_path(scope["method"], scope["path"]) or "<unmatched>"
+            REQUEST_DURATION.observe((scope["method"], route, str(status_code)), time.perf_counter() - start)
@@ -0,0 +1,234 @@
+from pydantic import BaseModel, Field, EmailStr
+from typing import Dict, Generic, List, Optional, TypeVar, Union
+import uuid
+from datetime import datetime
+from enum import Enum
+
+# Enums
+class UserRole(str, Enum):
+    ADMIN = "admin"
+    CUSTOMER = "customer"
+
+class LeadStage(str, Enum):
+    NEW = "new"
+    CONTACTED = "contacted"
+    QUALIFIED = "qualified"
+    CONVERTED = "converted"
+
+class LeadSource(str, Enum):
+    WEBSITE = "website"
+    REFERRAL = "referral"
+    CALL = "call"
+    CAMPAIGN = "campaign"
+
+class DealStage(str, Enum):
+    PROSPECT = "prospect"
+    PROPOSAL = "proposal"
+    NEGOTIATION = "negotiation"
+    WON = "won"
+    LOST = "lost"
+
+def enum_value(enum_or_str) -> str:
+    # Documents hold enum members before they are stored and plain strings once read back
+    return getattr(enum_or_str, "value", enum_or_str)
+
+# Models
+class UserBase(BaseModel):
+    email: EmailStr
+    full_name: str
+    role: UserRole = UserRole.CUSTOMER
+
+class UserCreate(UserBase):
+    password: str
+
+class User(UserBase):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    is_active: bool = True
+
+class UserLogin(BaseModel):
+    email: EmailStr
+    password: str
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+    user: User
+
+class LeadBase(BaseModel):
+    name: str
+    email: EmailStr
+    phone: Optional[str] = None
+    company: Optional[str] = None
+    stage: LeadStage = LeadStage.NEW
+    source: LeadSource = LeadSource.WEBSITE
+    notes: Optional[str] = None
+
+class LeadCreate(LeadBase):
+    assigned_to: Optional[str] = None
+
+class LeadUpdate(BaseModel):
+    name: Optional[str] = None
+    email: Optional[EmailStr] = None
+    phone: Optional[str] = None
+    company: Optional[str] = None
+    stage: Optional[LeadStage] = None
+    source: Optional[LeadSource] = None
+    notes: Optional[str] = None
+    assigned_to: Optional[str] = None
+    version: Optional[int] = None  # expected current version; omit to skip the check
+
+class Lead(LeadBase):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    assigned_to: Optional[str] = None
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0
+    score: Optional[int] = None  # see scoring
+
+class AssigneeUpdate(BaseModel):
+    sources: Optional[List[LeadSource]] = None  # every source when omitted
+    active: bool = True
+
+class Assignee(BaseModel):
+    user_id: str
+    sources: List[LeadSource]
+    active: bool
+    open_leads: int
+    assigned: int
+
+class DealBase(BaseModel):
+    title: str
+    value: float
+    expected_close_date: datetime
+    stage: DealStage = DealStage.PROSPECT
+    description: Optional[str] = None
+
+class DealCreate(DealBase):
+    contact_id: str
+
+class DealUpdate(BaseModel):
+    title: Optional[str] = None
+    value: Optional[float] = None
+    expected_close_date: Optional[datetime] = None
+    stage: Optional[DealStage] = None
+    description: Optional[str] = None
+    contact_id: Optional[str] = None
+    version: Optional[int] = None  # expected current version; omit to skip the check
+
+class Deal(DealBase):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    contact_id: str
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0
+
+class DealTransition(BaseModel):
+    deal_id: str
+    stage: DealStage
+    version: Optional[int] = None  # expected current version; omit to skip the check
+
+class DealTransitionRequest(BaseModel):
+    moves: List[DealTransition] = Field(..., max_length=500)
+
+class DealTransitionError(BaseModel):
+    deal_id: str
+    status: int
+    detail: str
+
+class DealTransitionResult(BaseModel):
+    updated: List[Deal]
+    errors: List[DealTransitionError]
+
+class ContactBase(BaseModel):
+    name: str
+    email: EmailStr
+    phone: Optional[str] = None
+    company: Optional[str] = None
+    position: Optional[str] = None
+
+class ContactCreate(ContactBase):
+    pass
+
+class Contact(ContactBase):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    limit: int
+    next_cursor: Optional[str] = None
+
+class SearchHit(BaseModel):
+    collection: str
+    score: float
+    item: Union[Lead, Contact]
+
+class SearchResult(BaseModel):
+    items: List[SearchHit]
+
+class DuplicateMatch(BaseModel):
+    id: str
+    name: str
+    email: str
+    matched_on: List[str]
+    score: float
+
+class LeadCreated(Lead):
+    possible_duplicates: List[DuplicateMatch] = []
+
+class ContactCreated(Contact):
+    possible_duplicates: List[DuplicateMatch] = []
+
+class DuplicateCandidate(BaseModel):
+    id: str
+    collection: str
+    ids: List[str]
+    owners: List[str]
+    matched_on: List[str]
+    score: float
+    status: str
+    detected_at: datetime
+
+class DuplicateMerge(BaseModel):
+    primary_id: str
+    duplicate_id: str
+
+class ForecastBucket(BaseModel):
+    month: str
+    stage: DealStage
+    deals: int
+    value: float
+    weighted_value: float
+
+class ForecastMonth(BaseModel):
+    month: str
+    deals: int
+    value: float
+    weighted_value: float
+
+class ForecastOverdue(BaseModel):
+    deals: int
+    value: float
+    weighted_value: float
+
+class TrendMonth(BaseModel):
+    month: str
+    won_deals: int
+    won_value: float
+    lost_deals: int
+    lost_value: float
+    win_rate: float
+
+class ForecastReport(BaseModel):
+    pipeline: List[ForecastBucket]
+    forecast: List[ForecastMonth]
+    overdue: ForecastOverdue
+    trends: List[TrendMonth]
+    stage_probabilities: Dict[str, float]
@@ -0,0 +1,92 @@
+"""Keyset pagination for the list endpoints.
+
+Pages are ordered on ``(<sort field>, id)`` (``created_at`` unless the caller
+asks otherwise, see ``listquery``) and the cursor is the sort key of
+the last row returned, so fetching page N is a range scan that starts where
+page N-1 stopped instead of a skip over every earlier row.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, status
+from pymongo import ASCENDING
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def sort_key(field: str, direction: int = ASCENDING) -> list:
+    # id breaks ties so the order is total and the cursor is unambiguous
+    return [(field, direction), ("id", direction)]
+
+
+SORT_KEY = sort_key("created_at")
+
+# Admins page over the whole collection, customers over their own documents
+PAGINATION_INDEXES = [
+    SORT_KEY,
+    [("created_by", ASCENDING)] + SORT_KEY,
+]
+
+
+def _sort_spec(sort: list) -> str:
+    field, direction = sort[0]
+    return f"{field}:{direction}"
+
+
+def encode_cursor(doc: dict, sort: list = SORT_KEY) -> str:
+    field = sort[0][0]
+    value = doc[field]
+    payload = {"s": _sort_spec(sort), "id": doc["id"]}
+    if isinstance(value, datetime):
+        payload["t"] = value.isoformat()
+    else:
+        payload["v"] = value
+    data = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: list = SORT_KEY) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(payload["t"]) if "t" in payload else payload["v"]
+        decoded = {"spec": payload.get("s", "created_at:1"), "value": value, "id": str(payload["id"])}
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if decoded["spec"] != _sort_spec(sort):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor does not match the requested sort")
+    return decoded
+
+
+def after_cursor(cursor: dict, sort: list = SORT_KEY) -> dict:
+    field, direction = sort[0]
+    op = "$gt" if direction == ASCENDING else "$lt"
+    # null sorts below every value but never matches $gt/$lt, so the nulls are stepped over explicitly
+    if cursor["value"] is None:
+        tail = {field: None, "id": {op: cursor["id"]}}
+        return {"$or": [{field: {"$ne": None}}, tail]} if direction == ASCENDING else tail
+    branches = [
+        {field: {op: cursor["value"]}},
+        {field: cursor["value"], "id": {op: cursor["id"]}},
+    ]
+    if direction != ASCENDING:
+        branches.append({field: None})
+    return {"$or": branches}
+
+
+async def fetch_page(collection, query: dict, limit: int, cursor: Optional[str] = None,
+                     projection: Optional[dict] = None, sort: list = SORT_KEY):
+    """Return ``(docs, next_cursor)`` for one page of ``collection``.
+
+    One extra row is read to find out whether another page exists, so the
+    last page reports ``next_cursor=None`` without a second query.
+    """
+    if cursor:
+        position = after_cursor(decode_cursor(cursor, sort), sort)
+        query = {"$and": [query, position]} if query else position
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1], sort) if len(docs) > limit else None
+    return docs[:limit], next_cursor
@@ -0,0 +1,90 @@
+"""Salted scrypt password hashing off the event loop.
+
+scrypt is deliberately slow and memory hard, so each hash runs in a small
+thread pool (``hashlib.scrypt`` releases the GIL) behind a semaphore that
+caps how many run at once; a login storm then queues up for the pool
+instead of stalling every other request on the worker.
+
+Stored hashes look like ``scrypt$<n>$<r>$<p>$<salt>$<hash>``.  Older users
+still carry an unsalted SHA-256 hex digest; ``verify_password`` accepts
+those and reports that the caller should store a fresh hash.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', 1))
+SALT_BYTES = 16
+KEY_BYTES = 32
+HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', min(4, os.cpu_count() or 1)))
+
+_executor = None
+_semaphore = None
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem has to cover 128 * n * r bytes plus OpenSSL's overhead
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES, maxmem=256 * n * r)
+
+
+def hash_password_sync(password: str) -> str:
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}"
+
+
+def verify_password_sync(password: str, stored: str) -> tuple:
+    """Return ``(matches, needs_rehash)`` for ``password`` against ``stored``."""
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, key = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            expected = _unb64(key)
+            candidate = _scrypt(password, _unb64(salt), n, r, p)
+        except ValueError:
+            return False, False
+        matches = hmac.compare_digest(candidate, expected)
+        return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+    # Legacy unsalted SHA-256 hex digest
+    legacy = hashlib.sha256(password.encode()).hexdigest()
+    matches = hmac.compare_digest(legacy, stored)
+    return matches, matches
+
+
+async def _run(fn, *args):
+    global _executor, _semaphore
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=HASH_CONCURRENCY, thread_name_prefix="password-hash")
+        _semaphore = asyncio.Semaphore(HASH_CONCURRENCY)
+    async with _semaphore:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_password_sync, password)
+
+
+async def verify_password(password: str, stored: str) -> tuple:
+    return await _run(verify_password_sync, password, stored)
+
+
+def shutdown():
+    # The pool is recreated on next use, e.g. when the app is started again in the same process
+    global _executor, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = _semaphore = None
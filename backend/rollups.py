@@ -0,0 +1,224 @@
+"""Incrementally maintained dashboard counters.
+
+Every write route turns its change into a delta (see ``lead_delta``,
+``deal_delta`` and ``contact_delta``) and ``apply_delta`` ``$inc``s it into
+two rows of the ``dashboard_rollups`` collection: the owner's row (keyed by
+``created_by``) and the global row read by admins.  The dashboard then reads
+a single document instead of scanning ``leads`` and ``deals``.
+
+The same upsert bumps ``versions.<collection>`` in both rows, so a row also
+tells whether anything in a collection changed for its scope (see
+``conditional``).  ``epoch`` is set when a row is created so that versions
+of a deleted and recreated row are never mistaken for the old ones.
+
+The rows are seeded from the source collections when the server starts
+with none (``seed_rows``), so data written before the rollups existed is
+counted from the first write on.  The counters can drift if a write fails
+half way or data is edited outside the API; ``reconcile`` rebuilds them:
+
+    cd backend && python -m rollups [--dry-run]
+"""
+import argparse
+import asyncio
+import uuid
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from analytics import ACTIVE_DEAL_STAGES, deal_stats_pipeline, lead_stats_pipeline
+from models import LeadStage, DealStage, enum_value
+from storage import command_db
+
+GLOBAL_SCOPE = "__all__"
+COUNTER_FIELDS = ["total_leads", "total_contacts", "total_deals", "won_deals", "pipeline_value"]
+
+# Float sums accumulate rounding error under $inc, so value drift below a cent is ignored
+VALUE_TOLERANCE = 0.01
+
+
+def merge_deltas(*deltas: dict) -> dict:
+    merged = {}
+    for delta in deltas:
+        for field, amount in delta.items():
+            merged[field] = merged.get(field, 0) + amount
+    return {field: amount for field, amount in merged.items() if amount}
+
+
+def lead_delta(lead: dict, sign: int = 1) -> dict:
+    return {
+        "total_leads": sign,
+        f"lead_stages.{enum_value(lead['stage'])}": sign,
+    }
+
+
+def contact_delta(sign: int = 1) -> dict:
+    return {"total_contacts": sign}
+
+
+def deal_delta(deal: dict, sign: int = 1) -> dict:
+    stage = enum_value(deal["stage"])
+    return {
+        "total_deals": sign,
+        "won_deals": sign if stage == DealStage.WON.value else 0,
+        "pipeline_value": sign * (deal.get("value") or 0) if stage in ACTIVE_DEAL_STAGES else 0,
+    }
+
+
+def change_delta(delta_fn, before: dict, after: dict) -> dict:
+    """Delta that moves a document's contribution from ``before`` to ``after``."""
+    return merge_deltas(delta_fn(before, -1), delta_fn(after, 1))
+
+
+async def apply_delta(db, collection: str, owner_id: str, delta: dict):
+    """Atomically add ``delta`` to the owner's row and the global row in one round trip."""
+    await apply_deltas(db, collection, {owner_id: delta})
+
+
+async def apply_deltas(db, collection: str, deltas: dict):
+    """Apply ``{owner_id: delta}`` for several owners, plus their sum to the global row, in one round trip.
+
+    Every row written also gets its ``collection`` version bumped, even when
+    the change leaves the counters alone (e.g. a renamed lead).
+    """
+    if not deltas:
+        return
+    bump = {f"versions.{collection}": 1}
+    rows = {owner_id: merge_deltas(delta, bump) for owner_id, delta in deltas.items()}
+    rows[GLOBAL_SCOPE] = merge_deltas(*deltas.values(), bump)
+    requests = [
+        UpdateOne({"_id": scope}, {"$inc": delta, "$setOnInsert": {"epoch": uuid.uuid4().hex}}, upsert=True)
+        for scope, delta in rows.items()
+    ]
+    await db.dashboard_rollups.bulk_write(requests, ordered=False)
+
+
+def dashboard_from_row(row: dict) -> dict:
+    total_deals = row.get("total_deals", 0)
+    won_deals = row.get("won_deals", 0)
+    stored_stages = row.get("lead_stages", {})
+    return {
+        "total_leads": row.get("total_leads", 0),
+        "total_contacts": row.get("total_contacts", 0),
+        "total_deals": total_deals,
+        "won_deals": won_deals,
+        "pipeline_value": row.get("pipeline_value", 0),
+        "conversion_rate": (won_deals / total_deals * 100) if total_deals > 0 else 0,
+        "lead_stages": {stage.value: stored_stages.get(stage.value, 0) for stage in LeadStage},
+    }
+
+
+async def read_row(db, owner_id: Optional[str] = None, projection: Optional[dict] = None) -> Optional[dict]:
+    """The rollup row of a scope, or ``None`` if the scope has no row yet."""
+    return await db.dashboard_rollups.find_one({"_id": owner_id or GLOBAL_SCOPE}, projection)
+
+
+def _empty_row(scope: str) -> dict:
+    row = {"_id": scope, "lead_stages": {stage.value: 0 for stage in LeadStage}}
+    row.update({field: 0 for field in COUNTER_FIELDS})
+    return row
+
+
+async def compute_rows(db) -> dict:
+    """Recompute every rollup row from the source collections."""
+    lead_rows, deal_rows, contact_rows = await asyncio.gather(
+        db.leads.aggregate(lead_stats_pipeline({}, key={"owner": "$created_by", "stage": "$stage"})).to_list(None),
+        db.deals.aggregate(deal_stats_pipeline({}, key="$created_by")).to_list(None),
+        db.contacts.aggregate([{"$group": {"_id": "$created_by", "count": {"$sum": 1}}}]).to_list(None),
+    )
+    rows = {GLOBAL_SCOPE: _empty_row(GLOBAL_SCOPE)}
+
+    def add(scope, field, amount, stage=None):
+        for key in (scope, GLOBAL_SCOPE):
+            row = rows.setdefault(key, _empty_row(key))
+            row[field] += amount
+            if stage is not None:
+                row["lead_stages"][stage] = row["lead_stages"].get(stage, 0) + amount
+
+    for row in lead_rows:
+        add(row["_id"]["owner"], "total_leads", row["count"], stage=row["_id"]["stage"])
+    for row in deal_rows:
+        for field in ("total_deals", "won_deals", "pipeline_value"):
+            add(row["_id"], field, row[field])
+    for row in contact_rows:
+        add(row["_id"], "total_contacts", row["count"])
+    return rows
+
+
+def _row_drift(stored: dict, expected: dict) -> dict:
+    drift = {}
+    for field in COUNTER_FIELDS:
+        have, want = stored.get(field, 0), expected.get(field, 0)
+        tolerance = VALUE_TOLERANCE if field == "pipeline_value" else 0
+        if abs(have - want) > tolerance:
+            drift[field] = {"stored": have, "expected": want}
+    stored_stages = stored.get("lead_stages", {})
+    for stage, want in expected.get("lead_stages", {}).items():
+        have = stored_stages.get(stage, 0)
+        if have != want:
+            drift[f"lead_stages.{stage}"] = {"stored": have, "expected": want}
+    return drift
+
+
+async def reconcile(db, dry_run: bool = False) -> dict:
+    """Rebuild the rollups from scratch and return the drift found per scope.
+
+    A delta ``$inc``ed into a row between the aggregation and the ``$set``
+    is overwritten, so a scope written to while this runs can be left off by
+    that write; a ``--dry-run`` afterwards shows whether it was.
+    """
+    expected = await compute_rows(db)
+    stored = {row["_id"]: row async for row in db.dashboard_rollups.find()}
+
+    report = {}
+    for scope in set(expected) | set(stored):
+        drift = _row_drift(stored.get(scope, {}), expected.get(scope, _empty_row(scope)))
+        if drift:
+            report[scope] = drift
+
+    if not dry_run:
+        # $set rather than replace so that concurrent version bumps are kept
+        for scope, row in expected.items():
+            counters = {field: value for field, value in row.items() if field != "_id"}
+            await db.dashboard_rollups.update_one(
+                {"_id": scope},
+                {"$set": counters, "$setOnInsert": {"epoch": uuid.uuid4().hex}},
+                upsert=True,
+            )
+        stale = [scope for scope in stored if scope not in expected]
+        if stale:
+            await db.dashboard_rollups.delete_many({"_id": {"$in": stale}})
+    return report
+
+
+async def seed_rows(db) -> bool:
+    """Build every row with ``reconcile`` if there are none yet; True if it did.
+
+    Without this, the first write of a scope would upsert its row from zero
+    and the dashboard would drop the records written before.
+    """
+    if await db.dashboard_rollups.find_one({}, {"_id": 1}) is not None:
+        return False
+    await reconcile(db)
+    return True
+
+
+async def _main(dry_run: bool):
+    async with command_db() as db:
+        report = await reconcile(db, dry_run=dry_run)
+    if not report:
+        print("Rollups are consistent")
+    for scope, drift in sorted(report.items()):
+        for field, values in sorted(drift.items()):
+            print(f"{scope}: {field} stored={values['stored']} expected={values['expected']}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild dashboard rollups and report drift")
+    parser.add_argument("--dry-run", action="store_true", help="only report drift, do not rewrite rollups")
+    args = parser.parse_args()
+    asyncio.run(_main(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
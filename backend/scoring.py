@@ -0,0 +1,204 @@
+"""Lead scores: a 0-100 rank computed from configurable feature weights.
+
+A lead's score is the sum of
+
+* the weight of its ``source`` and of its ``stage``,
+* ``company`` and ``notes`` if those fields are filled in,
+* ``activity``, halved every ``activity_half_life_days`` since the lead was
+  last updated,
+* ``stage_age`` (a penalty, so negative) scaled by how long the lead has
+  been in its stage, reaching the full weight after ``stage_age_days``,
+
+rounded and clipped to 0-100.  ``LEAD_SCORE_WEIGHTS`` is a JSON object
+overriding any of ``DEFAULT_WEIGHTS``, e.g. ``{"source": {"referral": 40}}``.
+
+``score_leads`` scores a batch in one NumPy pass.  New leads get their score
+(and ``stage_entered_at``) when they are created or imported, and an update
+sets the new score in its own write, like the search prefixes (see
+``dedupe.derived_fields``).  The clock-dependent features and changed
+weights only reach the other leads on a full rescore, so run one daily:
+
+    cd backend && python -m scoring [--dry-run]
+
+``rescore_all`` reads only the feature fields, ``SCORING_BATCH_SIZE`` leads
+at a time, and writes back just the scores that changed, as one
+``update_many`` per (score, version) pair in the batch.  The version in the
+filter skips leads updated since they were read; their update has already
+rescored them.  The next batch is read while the previous one is written.
+Once a batch is written, the ``leads`` versions of the owners it touched
+are bumped so that cached pages and ETags (see ``conditional``) do not keep
+the old scores, and those owners' clients are told to refetch at the end.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from pymongo import UpdateMany
+
+from events import publish, refresh_event
+from models import enum_value
+from rollups import apply_deltas
+from storage import command_db
+
+DEFAULT_WEIGHTS = {
+    "source": {"referral": 30, "call": 20, "website": 15, "campaign": 10},
+    "stage": {"new": 5, "contacted": 15, "qualified": 25, "converted": 0},
+    "company": 15,
+    "notes": 5,
+    "activity": 25,
+    "activity_half_life_days": 14,
+    "stage_age": -20,
+    "stage_age_days": 60,
+}
+
+MAX_SCORE = 100
+SCORING_BATCH_SIZE = int(os.environ.get('SCORING_BATCH_SIZE', 10000))
+
+# The fields a full rescore reads
+SCORE_PROJECTION = {
+    field: 1
+    for field in ("id", "created_by", "version", "score", "source", "stage", "company", "notes",
+                  "created_at", "updated_at", "stage_entered_at")
+}
+SCORE_PROJECTION["_id"] = 0
+
+SECONDS_PER_DAY = 86400
+
+
+def load_weights(overrides: Optional[str]) -> dict:
+    """``DEFAULT_WEIGHTS`` updated with a JSON object of overrides."""
+    weights = copy.deepcopy(DEFAULT_WEIGHTS)
+    for name, value in json.loads(overrides or "{}").items():
+        if name not in weights:
+            raise ValueError(f"Unknown lead score weight: {name}")
+        if isinstance(weights[name], dict):
+            weights[name].update(value)
+        else:
+            weights[name] = float(value)
+    return weights
+
+
+WEIGHTS = load_weights(os.environ.get('LEAD_SCORE_WEIGHTS'))
+
+
+def _lookup(table: dict, values: list) -> np.ndarray:
+    return np.fromiter((table.get(enum_value(value), 0) for value in values), float, len(values))
+
+
+def _days_before(now: datetime, values: list) -> np.ndarray:
+    """Days from each datetime to ``now``, 0 for future ones and NaN for missing ones."""
+    # Subtracting in Python is ~10x faster than converting datetime objects to datetime64
+    seconds = np.fromiter(
+        ((now - value).total_seconds() if value is not None else np.nan for value in values), float, len(values)
+    )
+    return np.maximum(seconds / SECONDS_PER_DAY, 0)
+
+
+def score_leads(docs: list, now: Optional[datetime] = None, weights: dict = WEIGHTS) -> np.ndarray:
+    """Integer scores of ``docs``, computed column by column."""
+    now = now or datetime.utcnow()
+    idle_days = _days_before(now, [doc.get("updated_at") for doc in docs])
+    stage_days = _days_before(now, [doc.get("stage_entered_at") or doc.get("created_at") for doc in docs])
+
+    score = _lookup(weights["source"], [doc.get("source") for doc in docs])
+    score += _lookup(weights["stage"], [doc.get("stage") for doc in docs])
+    score += weights["company"] * np.fromiter((bool(doc.get("company")) for doc in docs), bool, len(docs))
+    score += weights["notes"] * np.fromiter((bool(doc.get("notes")) for doc in docs), bool, len(docs))
+    # Missing timestamps (NaN) add nothing
+    score += np.nan_to_num(weights["activity"] * np.exp2(-idle_days / weights["activity_half_life_days"]))
+    score += np.nan_to_num(weights["stage_age"] * np.minimum(stage_days / weights["stage_age_days"], 1))
+    return np.clip(np.rint(score), 0, MAX_SCORE).astype(np.int64)
+
+
+def set_lead_scores(docs: list, now: Optional[datetime] = None) -> list:
+    """Set ``stage_entered_at`` and ``score`` on new lead documents."""
+    for doc in docs:
+        doc["stage_entered_at"] = doc["created_at"]
+    for doc, score in zip(docs, score_leads(docs, now).tolist()):
+        doc["score"] = score
+    return docs
+
+
+def changed_score(before: dict, after: dict) -> dict:
+    """``stage_entered_at`` if an update moved the lead to another stage, and its ``score`` if that changed."""
+    changes = {}
+    if enum_value(before.get("stage")) != enum_value(after.get("stage")):
+        changes["stage_entered_at"] = after["updated_at"]
+    score = score_leads([{**after, **changes}]).tolist()[0]
+    if score != after.get("score"):
+        changes["score"] = score
+    return changes
+
+
+def changed_scores(docs: list, scores: list) -> dict:
+    """Ids of the leads whose score changed, by ``(score, version)``; a missing version is ``None``."""
+    groups = {}
+    for doc, score in zip(docs, scores):
+        if doc.get("score") != score:
+            groups.setdefault((score, doc.get("version")), []).append(doc["id"])
+    return groups
+
+
+async def _write_scores(db, updates: list, owners: set):
+    await db.leads.bulk_write(updates, ordered=False)
+    await apply_deltas(db, "leads", {owner: {} for owner in owners})
+
+
+async def rescore_all(db, dry_run: bool = False, batch_size: int = SCORING_BATCH_SIZE) -> dict:
+    """Rescore every lead; returns how many were read and how many scores changed."""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    report = {"leads": 0, "changed": 0}
+    cursor = db.leads.find({}, SCORE_PROJECTION).batch_size(batch_size)
+    pending = None
+    touched = set()
+    while True:
+        docs = await cursor.to_list(batch_size)
+        if not docs:
+            break
+        scores = score_leads(docs, now).tolist()
+        groups = changed_scores(docs, scores)
+        owners = {doc["created_by"] for doc, score in zip(docs, scores) if doc.get("score") != score}
+        report["leads"] += len(docs)
+        report["changed"] += sum(len(ids) for ids in groups.values())
+        updates = [
+            UpdateMany({"id": {"$in": ids}, "version": version}, {"$set": {"score": score}})
+            for (score, version), ids in groups.items()
+        ]
+        if pending is not None:
+            await pending
+            pending = None
+        if updates and not dry_run:
+            pending = asyncio.ensure_future(_write_scores(db, updates, owners))
+            touched |= owners
+    if pending is not None:
+        await pending
+    if touched:
+        await publish(db, [refresh_event("leads", owner) for owner in sorted(touched)])
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+async def _main(dry_run: bool):
+    async with command_db() as db:
+        report = await rescore_all(db, dry_run=dry_run)
+    verb = "would change" if dry_run else "changed"
+    print(f"Scored {report['leads']} leads in {report['seconds']}s, {verb} {report['changed']} scores")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore every lead")
+    parser.add_argument("--dry-run", action="store_true", help="only count the scores that would change")
+    args = parser.parse_args()
+    asyncio.run(_main(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Typeahead and full-text search over leads and contacts.
+
+Two Mongo-maintained indexes back ``/api/search``:
+
+* ``prefix`` (typeahead): every lead and contact carries ``search_prefixes``,
+  the edge n-grams (``MIN_PREFIX``..``MAX_PREFIX`` characters) of the
+  normalized words of its ``PREFIX_FIELDS``.  They are computed on insert
+  and import, recomputed in the same write when an update touches one of
+  those fields (see ``updates``), and
+  matched with ``$all`` through a multikey index, optionally behind
+  ``created_by``.  The bounded candidate set is ranked in Python.
+* ``text``: one weighted text index per collection over ``TEXT_FIELDS``,
+  queried with ``$text`` and ranked by ``textScore``.
+
+Documents written before the prefixes existed are filled in with
+
+    cd backend && python -m search --backfill
+"""
+import argparse
+import asyncio
+import re
+import unicodedata
+from enum import Enum
+from typing import Optional
+
+from pymongo import ASCENDING, TEXT, IndexModel, UpdateOne
+
+from models import Lead, Contact
+from serialization import model_projection
+from storage import command_db
+
+MIN_PREFIX = 2
+MAX_PREFIX = 12
+MAX_CANDIDATES = 200
+BACKFILL_BATCH_SIZE = 1000
+
+class SearchCollection(str, Enum):
+    LEADS = "leads"
+    CONTACTS = "contacts"
+
+class SearchMode(str, Enum):
+    PREFIX = "prefix"
+    TEXT = "text"
+
+SEARCH_MODELS = {
+    SearchCollection.LEADS: Lead,
+    SearchCollection.CONTACTS: Contact,
+}
+
+# Free-form notes are only searched as full text; they would bloat the prefix arrays
+PREFIX_FIELDS = {
+    SearchCollection.LEADS: ["name", "email", "company"],
+    SearchCollection.CONTACTS: ["name", "email", "company", "position"],
+}
+
+TEXT_FIELDS = {
+    SearchCollection.LEADS: ["name", "email", "company", "notes"],
+    SearchCollection.CONTACTS: ["name", "email", "company", "position"],
+}
+
+FIELD_WEIGHTS = {"name": 10, "email": 5, "company": 5, "position": 2, "notes": 1}
+
+SEARCH_INDEXES = {
+    collection.value: [
+        IndexModel([("search_prefixes", ASCENDING)]),
+        IndexModel([("created_by", ASCENDING), ("search_prefixes", ASCENDING)]),
+        IndexModel(
+            [(field, TEXT) for field in TEXT_FIELDS[collection]],
+            weights={field: FIELD_WEIGHTS[field] for field in TEXT_FIELDS[collection]},
+            name=f"{collection.value}_text",
+        ),
+    ]
+    for collection in SearchCollection
+}
+
+WORD = re.compile(r"[^\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Case- and accent-insensitive form used for both documents and queries."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def words(text: Optional[str]) -> list:
+    return WORD.findall(normalize(text)) if text else []
+
+
+def search_prefixes(collection: SearchCollection, doc: dict) -> list:
+    prefixes = set()
+    for field in PREFIX_FIELDS[collection]:
+        for word in words(doc.get(field)):
+            for size in range(MIN_PREFIX, min(len(word), MAX_PREFIX) + 1):
+                prefixes.add(word[:size])
+    return sorted(prefixes)
+
+
+def set_search_prefixes(collection: SearchCollection, doc: dict) -> dict:
+    doc["search_prefixes"] = search_prefixes(collection, doc)
+    return doc
+
+
+def changed_search_prefixes(collection: SearchCollection, before: dict, after: dict) -> dict:
+    """``{"search_prefixes": ...}`` if an update changed one of the prefix fields, else nothing."""
+    if all(before.get(field) == after.get(field) for field in PREFIX_FIELDS[collection]):
+        return {}
+    return {"search_prefixes": search_prefixes(collection, after)}
+
+
+def _query_terms(q: str) -> list:
+    # Longest first: the planner takes the index bounds from the first $all element
+    terms = {word[:MAX_PREFIX] for word in words(q) if len(word) >= MIN_PREFIX}
+    return sorted(terms, key=len, reverse=True)
+
+
+def prefix_score(collection: SearchCollection, doc: dict, terms: list) -> float:
+    """Sum over query terms of the best field weight, doubled for whole-word matches."""
+    best = dict.fromkeys(terms, 0)
+    for field in PREFIX_FIELDS[collection]:
+        weight = FIELD_WEIGHTS[field]
+        for word in words(doc.get(field)):
+            for term in terms:
+                if word.startswith(term):
+                    best[term] = max(best[term], weight * 2 if word == term else weight)
+    return float(sum(best.values()))
+
+
+async def prefix_search(db, collection: SearchCollection, q: str, owner_id: Optional[str], limit: int) -> list:
+    terms = _query_terms(q)
+    if not terms:
+        return []
+    query = {"search_prefixes": {"$all": terms}}
+    if owner_id is not None:
+        query["created_by"] = owner_id
+    projection = model_projection(SEARCH_MODELS[collection])
+    docs = await db[collection.value].find(query, projection).limit(MAX_CANDIDATES).to_list(MAX_CANDIDATES)
+    hits = [
+        {"collection": collection.value, "score": prefix_score(collection, doc, terms), "item": doc}
+        for doc in docs
+    ]
+    hits.sort(key=lambda hit: (-hit["score"], hit["item"].get("name") or ""))
+    return hits[:limit]
+
+
+async def text_search(db, collection: SearchCollection, q: str, owner_id: Optional[str], limit: int) -> list:
+    query = {"$text": {"$search": q}}
+    if owner_id is not None:
+        query["created_by"] = owner_id
+    projection = {**model_projection(SEARCH_MODELS[collection]), "score": {"$meta": "textScore"}}
+    cursor = db[collection.value].find(query, projection).sort([("score", {"$meta": "textScore"})]).limit(limit)
+    return [
+        {"collection": collection.value, "score": doc.pop("score"), "item": doc}
+        for doc in await cursor.to_list(limit)
+    ]
+
+
+async def search(db, q: str, mode: SearchMode, collections: list, owner_id: Optional[str], limit: int) -> list:
+    """Search ``collections`` concurrently and merge the hits by score."""
+    search_fn = prefix_search if mode == SearchMode.PREFIX else text_search
+    results = await asyncio.gather(*(search_fn(db, collection, q, owner_id, limit) for collection in collections))
+    hits = [hit for result in results for hit in result]
+    hits.sort(key=lambda hit: -hit["score"])
+    return hits[:limit]
+
+
+async def backfill(db, batch_size: int = BACKFILL_BATCH_SIZE) -> dict:
+    """Compute ``search_prefixes`` for documents that have none; returns the count per collection."""
+    counts = {}
+    for collection in SearchCollection:
+        fields = {field: 1 for field in PREFIX_FIELDS[collection]}
+        cursor = db[collection.value].find({"search_prefixes": {"$exists": False}}, {"_id": 1, **fields})
+        requests, counts[collection.value] = [], 0
+        async for doc in cursor:
+            requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"search_prefixes": search_prefixes(collection, doc)}}))
+            if len(requests) >= batch_size:
+                await db[collection.value].bulk_write(requests, ordered=False)
+                counts[collection.value] += len(requests)
+                requests = []
+        if requests:
+            await db[collection.value].bulk_write(requests, ordered=False)
+            counts[collection.value] += len(requests)
+    return counts
+
+
+async def _main():
+    async with command_db() as db:
+        counts = await backfill(db)
+    for collection, count in counts.items():
+        print(f"{collection}: {count} documents updated")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the search prefixes of leads and contacts")
+    parser.add_argument("--backfill", action="store_true", help="fill in prefixes missing from older documents")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("nothing to do, pass --backfill")
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
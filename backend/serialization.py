@@ -0,0 +1,53 @@
+"""Fast JSON path for list responses.
+
+List routes used to build one Pydantic model per document and then let
+FastAPI validate and serialize them all again through ``response_model``.
+Documents we wrote ourselves already have the model's shape, so instead the
+projection is pushed down to Mongo (no ``_id``, only model fields), missing
+defaults are filled in for documents written before a field existed, and the
+page is encoded straight to bytes with orjson.  ``response_model`` is kept
+on the routes for the OpenAPI schema only.
+"""
+from typing import Optional
+
+from fastapi.responses import ORJSONResponse
+
+
+def model_projection(model) -> dict:
+    projection = {field: 1 for field in model.model_fields}
+    projection["_id"] = 0
+    return projection
+
+
+def model_defaults(model) -> dict:
+    """Static defaults of ``model``'s optional fields (factory defaults are only used on create)."""
+    return {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+
+
+class ListSerializer:
+    def __init__(self, model):
+        self.model = model
+        self.projection = model_projection(model)
+        self.defaults = model_defaults(model)
+
+    def fill_defaults(self, docs: list, fields: Optional[list] = None) -> list:
+        if fields is None:
+            defaults, expected = self.defaults, len(self.projection) - 1
+        else:
+            defaults = {field: self.defaults[field] for field in fields if field in self.defaults}
+            expected = len(fields)
+        for doc in docs:
+            if len(doc) != expected:
+                for field, default in defaults.items():
+                    doc.setdefault(field, default)
+        return docs
+
+    def page_response(self, docs: list, limit: int, next_cursor: Optional[str],
+                      fields: Optional[list] = None) -> ORJSONResponse:
+        """``fields`` restricts the defaults filled in to a sparse fieldset."""
+        items = self.fill_defaults(docs, fields)
+        return ORJSONResponse({"items": items, "limit": limit, "next_cursor": next_cursor})
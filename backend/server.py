@@ -1,30 +1,69 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
+from functools import partial
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
-import uuid
 from datetime import datetime, timedelta
-import hashlib
 import jwt
-from enum import Enum
+
+from models import (
+    UserRole,
+    User, UserCreate, UserLogin, Token,
+    Lead, LeadCreate, LeadUpdate, Deal, DealCreate, DealUpdate, Contact, ContactCreate, Page,
+    DealTransitionRequest, DealTransitionResult, SearchResult,
+    LeadCreated, ContactCreated, DuplicateCandidate, DuplicateMerge, ForecastReport,
+    Assignee, AssigneeUpdate,
+)
+from analytics import compute_dashboard
+from admission import Admission, AdmissionMiddleware
+from assignment import assign_lead, remove_assignee, set_assignee, track_load
+from auth_cache import AuthCache
+from coalesce import SingleFlight
+from conditional import VERSION_PROJECTION, etag_matches, list_etag, not_modified, row_etag, with_etag
+from bulk_import import ImportCollection, ImportFormat, import_records, parse_body
+from dedupe import (
+    CandidateStatus, DedupeCollection, candidate_query, dismiss_candidate, find_possible_duplicates,
+    derived_fields, merge_duplicates, set_dedupe_keys,
+)
+from events import ChangeAction, EventBroker, change_event, ensure_events_collection, publish, stream_events, tail_events
+from export import ExportCollection, ExportFormat, MEDIA_TYPES, export_query, stream_export
+from forecast import MAX_MONTHS, compute_forecast
+from indexes import ensure_indexes, explain_report
+from metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, MongoCommandMetrics
+from listquery import compile_list_query
+import passwords
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, fetch_page
+from scoring import set_lead_scores
+from search import SearchCollection, SearchMode, search, set_search_prefixes
+from serialization import ListSerializer
+from memory_engine import UnsupportedOperation
+from storage import configured_storage
+from transitions import apply_transitions
+from updates import delete_owned, non_nullable_fields, update_owned
+from rollups import apply_delta, change_delta, dashboard_from_row, deal_delta, lead_delta, read_row, seed_rows
+from write_buffer import INGEST_MODE, IngestMode, WriteBuffer, commit_created
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (STORAGE_ENGINE=memory runs without one, see storage.py)
+mongo_metrics = MongoCommandMetrics()
+client, db = configured_storage(event_listeners=[mongo_metrics])
 
 # Create the main app without a prefix
 app = FastAPI()
 
+@app.exception_handler(UnsupportedOperation)
+async def unsupported_operation(request: Request, exc: UnsupportedOperation):
+    # Text search and the index report on STORAGE_ENGINE=memory
+    return JSONResponse(status_code=status.HTTP_501_NOT_IMPLEMENTED, content={"detail": str(exc)})
+
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -35,112 +74,31 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
 security = HTTPBearer()
 
-# Enums
-class UserRole(str, Enum):
-    ADMIN = "admin"
-    CUSTOMER = "customer"
-
-class LeadStage(str, Enum):
-    NEW = "new"
-    CONTACTED = "contacted"
-    QUALIFIED = "qualified"
-    CONVERTED = "converted"
-
-class LeadSource(str, Enum):
-    WEBSITE = "website"
-    REFERRAL = "referral"
-    CALL = "call"
-    CAMPAIGN = "campaign"
-
-class DealStage(str, Enum):
-    PROSPECT = "prospect"
-    PROPOSAL = "proposal"
-    NEGOTIATION = "negotiation"
-    WON = "won"
-    LOST = "lost"
-
-# Models
-class UserBase(BaseModel):
-    email: EmailStr
-    full_name: str
-    role: UserRole = UserRole.CUSTOMER
-
-class UserCreate(UserBase):
-    password: str
-
-class User(UserBase):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    is_active: bool = True
-
-class UserLogin(BaseModel):
-    email: EmailStr
-    password: str
-
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-    user: User
-
-class LeadBase(BaseModel):
-    name: str
-    email: EmailStr
-    phone: Optional[str] = None
-    company: Optional[str] = None
-    stage: LeadStage = LeadStage.NEW
-    source: LeadSource = LeadSource.WEBSITE
-    notes: Optional[str] = None
-
-class LeadCreate(LeadBase):
-    assigned_to: Optional[str] = None
-
-class Lead(LeadBase):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    assigned_to: Optional[str] = None
-    created_by: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-
-class DealBase(BaseModel):
-    title: str
-    value: float
-    expected_close_date: datetime
-    stage: DealStage = DealStage.PROSPECT
-    description: Optional[str] = None
-
-class DealCreate(DealBase):
-    contact_id: str
-
-class Deal(DealBase):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    contact_id: str
-    created_by: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-
-class ContactBase(BaseModel):
-    name: str
-    email: EmailStr
-    phone: Optional[str] = None
-    company: Optional[str] = None
-    position: Optional[str] = None
-
-class ContactCreate(ContactBase):
-    pass
-
-class Contact(ContactBase):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    created_by: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+# Required as a bearer token by /metrics when set
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
-# Utility functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+lead_serializer = ListSerializer(Lead)
+contact_serializer = ListSerializer(Contact)
+deal_serializer = ListSerializer(Deal)
+search_serializers = {"leads": lead_serializer, "contacts": contact_serializer}
+
+# Authenticated-user cache; a deactivated user keeps access for at most AUTH_CACHE_TTL_SECONDS
+auth_cache = AuthCache(
+    max_entries=int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', 10000)),
+    user_ttl_seconds=float(os.environ.get('AUTH_CACHE_TTL_SECONDS', 30)),
+    token_ttl_seconds=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+# Fans change events out to this worker's /api/events streams
+event_broker = EventBroker()
+
+# Shares one computation between identical concurrent reads, see coalesce
+coalescer = SingleFlight()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return hash_password(plain_password) == hashed_password
+# Group-commit buffers for new leads and contacts, started unless INGEST_MODE is direct
+write_buffers = {}
 
+# Utility functions
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -151,33 +109,92 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
+def token_email(token: str) -> Optional[str]:
+    """Email of a valid token's subject, cached until the token expires; None if it is not valid."""
+    email = auth_cache.get_email(token)
+    if email is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.PyJWTError:
+            return None
+        email = payload.get("sub")
         if email is None:
+            return None
+        auth_cache.set_email(token, email, payload.get("exp"))
+    return email
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    email = token_email(credentials.credentials)
+    if email is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user_obj = auth_cache.get_user(email)
+    if user_obj is None:
+        user = await db.users.find_one({"email": email})
+        if user is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-    except jwt.PyJWTError:
+        user_obj = User(**user)
+        auth_cache.set_user(email, user_obj)
+    
+    if not user_obj.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
+            detail="Inactive user",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = await db.users.find_one({"email": email})
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
+    return user_obj
+
+def owner_scope(current_user: User) -> Optional[str]:
+    # Admins may act on any document, everyone else only on their own
+    return None if current_user.role == UserRole.ADMIN else current_user.id
+
+def patch_changes(data, model) -> dict:
+    changes = data.dict(exclude_unset=True)
+    changes.pop("version", None)
+    invalid = non_nullable_fields(changes, model)
+    if invalid:
+        raise HTTPException(status_code=422, detail=f"Fields cannot be null: {', '.join(invalid)}")
+    return changes
+
+async def store_created(collection: ImportCollection, document: dict, response: Response) -> bool:
+    """Write a new lead or contact as ``INGEST_MODE`` says; False if it was only queued (write-behind)."""
+    if INGEST_MODE == IngestMode.DIRECT:
+        failed = await commit_created(db, collection, [document])
+        if failed:
+            raise HTTPException(status_code=500, detail=f"Write failed: {failed[0]}")
+        return True
+    await write_buffers[collection].submit(document, wait=INGEST_MODE == IngestMode.GROUP_COMMIT)
+    if INGEST_MODE == IngestMode.WRITE_BEHIND:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return False
+    return True
+
+async def list_page(request: Request, collection: str, model, serializer: ListSerializer, limit: int,
+                    cursor: Optional[str], fields: Optional[str], sort: Optional[str], current_user: User):
+    owner_id = owner_scope(current_user)
+    list_query = compile_list_query(collection, model, request.query_params, owner_id, fields, sort)
+    # Read the version before the data, see conditional
+    etag = list_etag(await read_row(db, owner_id, VERSION_PROJECTION), collection, request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    async def render() -> bytes:
+        docs, next_cursor = await fetch_page(
+            db[collection], list_query.query, limit, cursor, list_query.projection(serializer.projection), list_query.sort
         )
+        return serializer.page_response(docs, limit, next_cursor, list_query.fields).body
     
-    return User(**user)
+    body = await coalescer.run((collection, owner_id, str(request.query_params), etag), render)
+    return with_etag(Response(body, media_type="application/json"), etag)
 
 # Authentication Routes
 @api_router.post("/auth/register", response_model=User)
@@ -192,7 +209,7 @@ async def register(user_data: UserCreate):
     
     # Create new user
     user_dict = user_data.dict()
-    user_dict["password"] = hash_password(user_data.password)
+    user_dict["password"] = await passwords.hash_password(user_data.password)
     user_obj = User(**user_dict)
     
     # Store user with password in database
@@ -200,6 +217,7 @@ async def register(user_data: UserCreate):
     user_db_dict["password"] = user_dict["password"]  # Add password back for storage
     
     await db.users.insert_one(user_db_dict)
+    auth_cache.invalidate_user(user_obj.email)
     return user_obj
 
 @api_router.post("/auth/login", response_model=Token)
@@ -213,13 +231,22 @@ async def login(user_data: UserLogin):
         )
     
     # Check if password field exists and verify
-    if "password" not in user or not verify_password(user_data.password, user["password"]):
+    matches, needs_rehash = (False, False)
+    if "password" in user:
+        matches, needs_rehash = await passwords.verify_password(user_data.password, user["password"])
+    if not matches:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Migrate legacy SHA-256 (or outdated scrypt) hashes now that we know the password
+    if needs_rehash:
+        new_hash = await passwords.hash_password(user_data.password)
+        await db.users.update_one({"email": user["email"]}, {"$set": {"password": new_hash}})
+        auth_cache.invalidate_user(user["email"])
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user["email"]}, expires_delta=access_token_expires
@@ -233,71 +260,92 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Lead Management Routes
-@api_router.post("/leads", response_model=Lead)
-async def create_lead(lead_data: LeadCreate, current_user: User = Depends(get_current_user)):
+@api_router.post("/leads", response_model=LeadCreated)
+async def create_lead(lead_data: LeadCreate, response: Response, current_user: User = Depends(get_current_user)):
     lead_dict = lead_data.dict()
     lead_dict["created_by"] = current_user.id
-    lead_obj = Lead(**lead_dict)
-    
-    await db.leads.insert_one(lead_obj.dict())
-    return lead_obj
-
-@api_router.get("/leads", response_model=List[Lead])
-async def get_leads(current_user: User = Depends(get_current_user)):
-    if current_user.role == UserRole.ADMIN:
-        leads = await db.leads.find().to_list(1000)
-    else:
-        leads = await db.leads.find({"created_by": current_user.id}).to_list(1000)
+    lead_obj = Lead(**await assign_lead(db, lead_dict))
+    document = set_dedupe_keys(set_search_prefixes(SearchCollection.LEADS, lead_obj.dict()))
+    set_lead_scores([document])
+    lead_obj.score = document["score"]
     
-    return [Lead(**lead) for lead in leads]
+    try:
+        stored = await store_created(ImportCollection.LEADS, document, response)
+    except HTTPException:
+        # The lead was counted in its assignee's load
+        await track_load(db, document, None)
+        raise
+    if not stored:
+        return LeadCreated(**lead_obj.dict())
+    duplicates = await find_possible_duplicates(db, DedupeCollection.LEADS, document, owner_scope(current_user))
+    return LeadCreated(**lead_obj.dict(), possible_duplicates=duplicates)
+
+@api_router.get("/leads", response_model=Page[Lead])
+async def get_leads(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    sort: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    return await list_page(request, "leads", Lead, lead_serializer, limit, cursor, fields, sort, current_user)
+
+async def apply_lead_update(lead_id: str, changes: dict, current_user: User, expected_version: Optional[int] = None):
+    lead, updated_lead = await update_owned(
+        db.leads, lead_id, changes, owner_scope(current_user), "Lead", expected_version,
+        derive=partial(derived_fields, DedupeCollection.LEADS),
+    )
+    if updated_lead is lead:
+        return Lead(**lead)
+    await apply_delta(db, "leads", lead["created_by"], change_delta(lead_delta, lead, updated_lead))
+    await publish(db, [change_event("leads", ChangeAction.UPDATED, updated_lead)])
+    await track_load(db, lead, updated_lead)
+    return Lead(**updated_lead)
 
 @api_router.put("/leads/{lead_id}", response_model=Lead)
 async def update_lead(lead_id: str, lead_data: LeadCreate, current_user: User = Depends(get_current_user)):
-    lead = await db.leads.find_one({"id": lead_id})
-    if not lead:
-        raise HTTPException(status_code=404, detail="Lead not found")
-    
-    if current_user.role != UserRole.ADMIN and lead["created_by"] != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to update this lead")
-    
-    update_dict = lead_data.dict()
-    update_dict["updated_at"] = datetime.utcnow()
-    
-    await db.leads.update_one({"id": lead_id}, {"$set": update_dict})
-    
-    updated_lead = await db.leads.find_one({"id": lead_id})
-    return Lead(**updated_lead)
+    changes = lead_data.dict()
+    if "assigned_to" not in lead_data.model_fields_set:
+        # A form that does not show the assignee must not unassign the lead
+        del changes["assigned_to"]
+    return await apply_lead_update(lead_id, changes, current_user)
+
+@api_router.patch("/leads/{lead_id}", response_model=Lead)
+async def patch_lead(lead_id: str, lead_data: LeadUpdate, current_user: User = Depends(get_current_user)):
+    return await apply_lead_update(lead_id, patch_changes(lead_data, Lead), current_user, lead_data.version)
 
 @api_router.delete("/leads/{lead_id}")
 async def delete_lead(lead_id: str, current_user: User = Depends(get_current_user)):
-    lead = await db.leads.find_one({"id": lead_id})
-    if not lead:
-        raise HTTPException(status_code=404, detail="Lead not found")
-    
-    if current_user.role != UserRole.ADMIN and lead["created_by"] != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this lead")
-    
-    await db.leads.delete_one({"id": lead_id})
+    lead = await delete_owned(db.leads, lead_id, owner_scope(current_user), "Lead")
+    await apply_delta(db, "leads", lead["created_by"], lead_delta(lead, -1))
+    await publish(db, [change_event("leads", ChangeAction.DELETED, lead)])
+    await track_load(db, lead, None)
     return {"message": "Lead deleted successfully"}
 
 # Contact Management Routes
-@api_router.post("/contacts", response_model=Contact)
-async def create_contact(contact_data: ContactCreate, current_user: User = Depends(get_current_user)):
+@api_router.post("/contacts", response_model=ContactCreated)
+async def create_contact(contact_data: ContactCreate, response: Response, current_user: User = Depends(get_current_user)):
     contact_dict = contact_data.dict()
     contact_dict["created_by"] = current_user.id
     contact_obj = Contact(**contact_dict)
+    document = set_dedupe_keys(set_search_prefixes(SearchCollection.CONTACTS, contact_obj.dict()))
     
-    await db.contacts.insert_one(contact_obj.dict())
-    return contact_obj
-
-@api_router.get("/contacts", response_model=List[Contact])
-async def get_contacts(current_user: User = Depends(get_current_user)):
-    if current_user.role == UserRole.ADMIN:
-        contacts = await db.contacts.find().to_list(1000)
-    else:
-        contacts = await db.contacts.find({"created_by": current_user.id}).to_list(1000)
-    
-    return [Contact(**contact) for contact in contacts]
+    if not await store_created(ImportCollection.CONTACTS, document, response):
+        return ContactCreated(**contact_obj.dict())
+    duplicates = await find_possible_duplicates(db, DedupeCollection.CONTACTS, document, owner_scope(current_user))
+    return ContactCreated(**contact_obj.dict(), possible_duplicates=duplicates)
+
+@api_router.get("/contacts", response_model=Page[Contact])
+async def get_contacts(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    sort: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    return await list_page(request, "contacts", Contact, contact_serializer, limit, cursor, fields, sort, current_user)
 
 # Deal Management Routes
 @api_router.post("/deals", response_model=Deal)
@@ -312,93 +360,309 @@ async def create_deal(deal_data: DealCreate, current_user: User = Depends(get_cu
     deal_obj = Deal(**deal_dict)
     
     await db.deals.insert_one(deal_obj.dict())
+    await apply_delta(db, "deals", deal_obj.created_by, deal_delta(deal_obj.dict()))
+    await publish(db, [change_event("deals", ChangeAction.CREATED, deal_obj.dict())])
     return deal_obj
 
-@api_router.get("/deals", response_model=List[Deal])
-async def get_deals(current_user: User = Depends(get_current_user)):
-    if current_user.role == UserRole.ADMIN:
-        deals = await db.deals.find().to_list(1000)
-    else:
-        deals = await db.deals.find({"created_by": current_user.id}).to_list(1000)
-    
-    return [Deal(**deal) for deal in deals]
+@api_router.get("/deals", response_model=Page[Deal])
+async def get_deals(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    sort: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    return await list_page(request, "deals", Deal, deal_serializer, limit, cursor, fields, sort, current_user)
+
+async def apply_deal_update(deal_id: str, changes: dict, current_user: User, expected_version: Optional[int] = None):
+    deal, updated_deal = await update_owned(
+        db.deals, deal_id, changes, owner_scope(current_user), "Deal", expected_version
+    )
+    if updated_deal is deal:
+        return Deal(**deal)
+    await apply_delta(db, "deals", deal["created_by"], change_delta(deal_delta, deal, updated_deal))
+    await publish(db, [change_event("deals", ChangeAction.UPDATED, updated_deal)])
+    return Deal(**updated_deal)
 
 @api_router.put("/deals/{deal_id}", response_model=Deal)
 async def update_deal(deal_id: str, deal_data: DealCreate, current_user: User = Depends(get_current_user)):
-    deal = await db.deals.find_one({"id": deal_id})
-    if not deal:
-        raise HTTPException(status_code=404, detail="Deal not found")
+    return await apply_deal_update(deal_id, deal_data.dict(), current_user)
+
+@api_router.patch("/deals/{deal_id}", response_model=Deal)
+async def patch_deal(deal_id: str, deal_data: DealUpdate, current_user: User = Depends(get_current_user)):
+    return await apply_deal_update(deal_id, patch_changes(deal_data, Deal), current_user, deal_data.version)
+
+@api_router.post("/deals/transitions", response_model=DealTransitionResult)
+async def transition_deals(request: DealTransitionRequest, current_user: User = Depends(get_current_user)):
+    result = await apply_transitions(db, request.moves, owner_scope(current_user))
+    return DealTransitionResult(
+        updated=[Deal(**deal) for deal in result["updated"]],
+        errors=result["errors"],
+    )
+
+# Analytics Routes
+@api_router.get("/analytics/dashboard")
+async def get_dashboard_analytics(request: Request, current_user: User = Depends(get_current_user)):
+    owner_id = owner_scope(current_user)
+    row = await read_row(db, owner_id)
+    if row is None:
+        # No rollup row yet: the owner has written nothing since the rows were seeded
+        return await coalescer.run(("dashboard", owner_id, None), lambda: compute_dashboard(db, owner_id))
+    etag = row_etag(row)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     
-    if current_user.role != UserRole.ADMIN and deal["created_by"] != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to update this deal")
+    async def render() -> bytes:
+        return JSONResponse(dashboard_from_row(row)).body
     
-    update_dict = deal_data.dict()
-    update_dict["updated_at"] = datetime.utcnow()
+    body = await coalescer.run(("dashboard", owner_id, etag), render)
+    return with_etag(Response(body, media_type="application/json"), etag)
+
+@api_router.get("/analytics/forecast", response_model=ForecastReport)
+async def get_forecast(
+    request: Request,
+    months_ahead: int = Query(6, ge=1, le=MAX_MONTHS),
+    months_back: int = Query(6, ge=1, le=MAX_MONTHS),
+    current_user: User = Depends(get_current_user),
+):
+    owner_id = owner_scope(current_user)
+    now = datetime.utcnow()
+    # The buckets move with the calendar, so the month is part of the ETag
+    etag = list_etag(await read_row(db, owner_id, VERSION_PROJECTION), "deals", request, now.strftime("%Y-%m"))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     
-    await db.deals.update_one({"id": deal_id}, {"$set": update_dict})
+    async def render() -> bytes:
+        return ORJSONResponse(await compute_forecast(db, owner_id, months_ahead, months_back, now)).body
     
-    updated_deal = await db.deals.find_one({"id": deal_id})
-    return Deal(**updated_deal)
+    body = await coalescer.run(("forecast", owner_id, str(request.query_params), etag), render)
+    return with_etag(Response(body, media_type="application/json"), etag)
+
+# Search Routes
+@api_router.get("/search", response_model=SearchResult)
+async def search_records(
+    q: str = Query(..., min_length=1, max_length=200),
+    mode: SearchMode = SearchMode.PREFIX,
+    collection: Optional[SearchCollection] = None,
+    limit: int = Query(10, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+):
+    collections = [collection] if collection else list(SearchCollection)
+    hits = await search(db, q, mode, collections, owner_scope(current_user), limit)
+    for hit in hits:
+        search_serializers[hit["collection"]].fill_defaults([hit["item"]])
+    
+    return ORJSONResponse({"items": hits})
+
+# Duplicate Routes
+@api_router.get("/duplicates/{collection}", response_model=List[DuplicateCandidate])
+async def get_duplicate_candidates(
+    collection: DedupeCollection,
+    candidate_status: CandidateStatus = Query(CandidateStatus.OPEN, alias="status"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+):
+    query = candidate_query(collection, owner_scope(current_user), candidate_status)
+    candidates = await db.duplicate_candidates.find(query).sort("score", -1).limit(limit).to_list(limit)
+    return [DuplicateCandidate(id=candidate.pop("_id"), **candidate) for candidate in candidates]
+
+@api_router.post("/duplicates/{collection}/merge")
+async def merge_duplicate(collection: DedupeCollection, merge: DuplicateMerge, current_user: User = Depends(get_current_user)):
+    merged = await merge_duplicates(db, collection, merge.primary_id, merge.duplicate_id, owner_scope(current_user))
+    model = Lead if collection == DedupeCollection.LEADS else Contact
+    return model(**merged)
+
+@api_router.post("/duplicates/candidates/{candidate_id}/dismiss")
+async def dismiss_duplicate(candidate_id: str, current_user: User = Depends(get_current_user)):
+    await dismiss_candidate(db, candidate_id, owner_scope(current_user))
+    return {"message": "Duplicate candidate dismissed"}
+
+# Import Routes
+@api_router.post("/import/{collection}")
+async def import_collection(
+    collection: ImportCollection,
+    request: Request,
+    format: Optional[ImportFormat] = None,
+    current_user: User = Depends(get_current_user),
+):
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = ImportFormat.CSV if content_type.startswith("text/csv") else ImportFormat.NDJSON
+    return await import_records(db, collection, parse_body(request.stream(), format), current_user.id)
+
+# Export Routes
+@api_router.get("/export/{collection}")
+async def export_collection(
+    collection: ExportCollection,
+    format: ExportFormat = ExportFormat.NDJSON,
+    updated_since: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+):
+    owner_id = owner_scope(current_user)
+    query = export_query(owner_id, updated_since)
+    return StreamingResponse(
+        stream_export(db[collection.value], collection, format, query),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{collection.value}.{format.value}"'},
+    )
 
-# Analytics Routes
-@api_router.get("/analytics/dashboard")
-async def get_dashboard_analytics(current_user: User = Depends(get_current_user)):
-    # Basic analytics for dashboard
-    if current_user.role == UserRole.ADMIN:
-        total_leads = await db.leads.count_documents({})
-        total_contacts = await db.contacts.count_documents({})
-        total_deals = await db.deals.count_documents({})
-        won_deals = await db.deals.count_documents({"stage": DealStage.WON})
-        
-        # Pipeline value calculation
-        pipeline_value = 0
-        active_deals = await db.deals.find({"stage": {"$in": [DealStage.PROSPECT, DealStage.PROPOSAL, DealStage.NEGOTIATION]}}).to_list(1000)
-        for deal in active_deals:
-            pipeline_value += deal.get("value", 0)
-        
-        # Lead stages breakdown
-        lead_stages = {}
-        for stage in LeadStage:
-            count = await db.leads.count_documents({"stage": stage})
-            lead_stages[stage.value] = count
-    else:
-        total_leads = await db.leads.count_documents({"created_by": current_user.id})
-        total_contacts = await db.contacts.count_documents({"created_by": current_user.id})
-        total_deals = await db.deals.count_documents({"created_by": current_user.id})
-        won_deals = await db.deals.count_documents({"created_by": current_user.id, "stage": DealStage.WON})
-        
-        pipeline_value = 0
-        active_deals = await db.deals.find({
-            "created_by": current_user.id,
-            "stage": {"$in": [DealStage.PROSPECT, DealStage.PROPOSAL, DealStage.NEGOTIATION]}
-        }).to_list(1000)
-        for deal in active_deals:
-            pipeline_value += deal.get("value", 0)
-        
-        lead_stages = {}
-        for stage in LeadStage:
-            count = await db.leads.count_documents({"created_by": current_user.id, "stage": stage})
-            lead_stages[stage.value] = count
+# Real-time Routes
+@api_router.get("/events")
+async def get_events(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user),
+):
+    async def authorized() -> bool:
+        # Cached like every request, so a deactivation shows within AUTH_CACHE_TTL_SECONDS
+        try:
+            await get_current_user(credentials)
+        except HTTPException:
+            return False
+        return True
+
+    subscription = event_broker.subscribe(owner_scope(current_user))
+    return StreamingResponse(
+        stream_events(event_broker, subscription, authorized=authorized),
+        media_type="text/event-stream",
+        # Keep reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Admin Routes
+@api_router.get("/admin/indexes/report")
+async def get_index_report(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view the index report")
+    
+    report = await explain_report(db)
+    return {"collscans": sum(1 for row in report if row["collscan"]), "queries": report}
+
+@api_router.get("/admin/cache/auth")
+async def get_auth_cache_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view cache statistics")
+    
+    return auth_cache.stats()
+
+@api_router.get("/admin/events")
+async def get_event_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view event statistics")
+    
+    return event_broker.stats()
+
+@api_router.get("/admin/admission")
+async def get_admission_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view admission statistics")
+    
+    return admission.stats()
+
+@api_router.get("/admin/ingest")
+async def get_ingest_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view ingest statistics")
     
     return {
-        "total_leads": total_leads,
-        "total_contacts": total_contacts,
-        "total_deals": total_deals,
-        "won_deals": won_deals,
-        "pipeline_value": pipeline_value,
-        "conversion_rate": (won_deals / total_deals * 100) if total_deals > 0 else 0,
-        "lead_stages": lead_stages
+        "mode": INGEST_MODE.value,
+        "buffers": {collection.value: buffer.stats() for collection, buffer in write_buffers.items()},
     }
 
+@api_router.get("/admin/assignees", response_model=List[Assignee])
+async def get_assignees(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view the assignment pool")
+    
+    members = await db.assignees.find().sort("_id", 1).to_list(None)
+    return [Assignee(user_id=member.pop("_id"), **member) for member in members]
+
+@api_router.put("/admin/assignees/{user_id}", response_model=Assignee)
+async def put_assignee(user_id: str, update: AssigneeUpdate, current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to change the assignment pool")
+    
+    user = await db.users.find_one({"id": user_id})
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if update.active and not user.get("is_active", True):
+        raise HTTPException(status_code=400, detail="Inactive users cannot take leads")
+    member = await set_assignee(db, user_id, update.sources, update.active)
+    return Assignee(user_id=member.pop("_id"), **member)
+
+@api_router.delete("/admin/assignees/{user_id}")
+async def delete_assignee(user_id: str, current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to change the assignment pool")
+    
+    if not await remove_assignee(db, user_id):
+        raise HTTPException(status_code=404, detail="Assignee not found")
+    return {"message": "Assignee removed successfully"}
+
+@api_router.get("/admin/coalescing")
+async def get_coalescing_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view coalescing statistics")
+    
+    return coalescer.stats()
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Concurrency limits per route cost class and per-user rate limits;
+# added before CORS so that shed requests still carry the CORS headers
+admission = Admission(app.router, token_email)
+app.add_middleware(AdmissionMiddleware, admission=admission)
+# Outside admission control, so shed requests are timed too
+app.add_middleware(MetricsMiddleware, route_path=admission.route_path)
+
+REGISTRY.add_collector(
+    "admission_active_requests", "Requests running per cost class",
+    lambda: [((cost.value,), limiter.active) for cost, limiter in admission.limiters.items()], ("class",),
+)
+REGISTRY.add_collector(
+    "admission_queued_requests", "Requests waiting per cost class",
+    lambda: [((cost.value,), limiter.stats()["queued"]) for cost, limiter in admission.limiters.items()], ("class",),
+)
+REGISTRY.add_collector(
+    "admission_shed_total", "Requests shed per cost class and reason",
+    lambda: [
+        row
+        for cost, limiter in admission.limiters.items()
+        for row in (((cost.value, "queue_full"), limiter.shed_queue_full), ((cost.value, "timeout"), limiter.shed_timeout))
+    ],
+    ("class", "reason"), kind="counter",
+)
+REGISTRY.add_collector(
+    "rate_limited_total", "Requests refused by the per-tenant rate limit",
+    lambda: [((), admission.buckets.limited)], kind="counter",
+)
+REGISTRY.add_collector("event_subscribers", "Open /api/events streams", lambda: [((), event_broker.stats()["subscribers"])])
+REGISTRY.add_collector(
+    "ingest_pending_documents", "Documents queued in the group-commit buffers",
+    lambda: [((collection.value,), buffer.stats()["pending"]) for collection, buffer in write_buffers.items()],
+    ("collection",),
+)
+REGISTRY.add_collector(
+    "coalesced_reads_total", "Coalesced reads per route: executed, joined in flight or reused",
+    coalescer.counts, ("route", "outcome"), kind="counter",
+)
+
+# Prometheus scrape target, outside /api
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend wait out a 429 as long as the server asks
+    expose_headers=["Retry-After"],
 )
 
 # Configure logging
@@ -408,6 +672,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_client():
+    await ensure_indexes(db)
+    if await seed_rows(db):
+        logger.info("Seeded dashboard rollups from existing data")
+    await ensure_events_collection(db)
+    app.state.event_tail = asyncio.create_task(tail_events(db, event_broker))
+    if INGEST_MODE != IngestMode.DIRECT:
+        for collection in ImportCollection:
+            write_buffers[collection] = WriteBuffer(db, collection)
+            write_buffers[collection].start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    app.state.event_tail.cancel()
+    # Write out queued leads and contacts before the connection goes away
+    await asyncio.gather(*(buffer.close() for buffer in write_buffers.values()))
+    client.close()
+    passwords.shutdown()
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""Storage engines behind the ``db`` handle that routes and subsystems receive.
+
+Every module reaches the database through ``db[...]``/``db.<collection>``
+and the small part of the Motor API spelled out by ``Database``,
+``Collection`` and ``Cursor`` below, so that handle is the repository
+interface.  ``STORAGE_ENGINE`` selects what implements it:
+
+* ``mongo`` (default): Motor, connected to ``MONGO_URL``.
+* ``memory``: ``memory_engine``, process-local dicts with hash and ordered
+  indexes.  For tests and benchmarks: the data lives and dies with the
+  worker, and ``$text`` search and ``explain`` are not available: they
+  raise ``UnsupportedOperation``.
+
+The server and the maintenance commands (``python -m rollups`` ...) open
+theirs from ``backend/.env`` the same way, through ``configured_storage``.
+"""
+import os
+from contextlib import asynccontextmanager
+from enum import Enum
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional, Protocol
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from memory_engine import MemoryClient
+
+ENV_FILE = Path(__file__).parent / '.env'
+
+class StorageEngine(str, Enum):
+    MONGO = "mongo"
+    MEMORY = "memory"
+
+
+class Cursor(Protocol):
+    def sort(self, key_or_list, direction: Optional[int] = None) -> "Cursor": ...
+
+    def limit(self, limit: int) -> "Cursor": ...
+
+    def batch_size(self, batch_size: int) -> "Cursor": ...
+
+    async def to_list(self, length: Optional[int]) -> list: ...
+
+    def __aiter__(self) -> AsyncIterator[dict]: ...
+
+
+class Collection(Protocol):
+    def find(self, filter: Optional[dict] = None, projection: Any = None, **kwargs) -> Cursor: ...
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Any = None, **kwargs) -> Optional[dict]: ...
+
+    async def insert_one(self, document: dict, **kwargs) -> Any: ...
+
+    async def insert_many(self, documents: list, ordered: bool = True, **kwargs) -> Any: ...
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> Any: ...
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> Any: ...
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Any = None, **kwargs) -> Optional[dict]: ...
+
+    async def find_one_and_delete(self, filter: dict, projection: Any = None, **kwargs) -> Optional[dict]: ...
+
+    async def delete_many(self, filter: dict, **kwargs) -> Any: ...
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> Any: ...
+
+    async def count_documents(self, filter: dict, **kwargs) -> int: ...
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, **kwargs) -> list: ...
+
+    def aggregate(self, pipeline: list, **kwargs) -> Cursor: ...
+
+    async def create_indexes(self, indexes: list, **kwargs) -> list: ...
+
+
+class Database(Protocol):
+    def __getitem__(self, name: str) -> Collection: ...
+
+    def __getattr__(self, name: str) -> Collection: ...
+
+    async def create_collection(self, name: str, **kwargs) -> Collection: ...
+
+    async def command(self, command, **kwargs) -> dict: ...
+
+
+def open_storage(engine: StorageEngine, mongo_url: Optional[str], db_name: str, **client_options) -> tuple:
+    """``(client, db)`` for ``engine``; ``client_options`` only apply to Motor."""
+    if engine == StorageEngine.MEMORY:
+        client = MemoryClient()
+    else:
+        client = AsyncIOMotorClient(mongo_url, **client_options)
+    return client, client[db_name]
+
+
+def configured_storage(**client_options) -> tuple:
+    """``open_storage`` for the ``STORAGE_ENGINE``, ``MONGO_URL`` and ``DB_NAME`` of the environment and ``.env``."""
+    load_dotenv(ENV_FILE)
+    engine = StorageEngine(os.environ.get('STORAGE_ENGINE', StorageEngine.MONGO.value))
+    mongo_url = os.environ['MONGO_URL'] if engine == StorageEngine.MONGO else None
+    return open_storage(engine, mongo_url, os.environ['DB_NAME'], **client_options)
+
+
+@asynccontextmanager
+async def command_db() -> AsyncIterator[Database]:
+    """The configured ``db`` of a maintenance command, closed when the command is done.
+
+    On ``STORAGE_ENGINE=memory`` that is a new, empty database, so it is
+    only useful to try a command out.
+    """
+    client, db = configured_storage()
+    try:
+        yield db
+    finally:
+        client.close()
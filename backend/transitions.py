@@ -0,0 +1,90 @@
+"""Batch stage transitions for the sales pipeline board.
+
+A board reorder arrives as a list of ``{deal_id, stage}`` moves.  The deals
+are read once to check ownership and capture their pre-image, then every
+move is written in one unordered ``bulk_write`` whose filters pin the
+version that was read, so each write applies exactly the rollup delta
+computed from that pre-image (or is reported as a conflict).
+"""
+from datetime import datetime
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from events import ChangeAction, change_event, publish
+from rollups import apply_deltas, change_delta, deal_delta, merge_deltas
+from updates import owned_filter
+
+PREIMAGE_FIELDS = {"_id": False}
+
+
+def _error(deal_id: str, status: int, detail: str) -> dict:
+    return {"deal_id": deal_id, "status": status, "detail": detail}
+
+
+async def apply_transitions(db, moves: list, owner_id: Optional[str]) -> dict:
+    """Apply ``moves`` and return ``{"updated": [deal docs], "errors": [...]}``.
+
+    Moves to the stage a deal is already in are no-ops and appear in neither list.
+    """
+    # The last move for a deal wins if the client sent several
+    moves = list({move.deal_id: move for move in moves}.values())
+    current = {
+        deal["id"]: deal
+        async for deal in db.deals.find({"id": {"$in": [move.deal_id for move in moves]}}, PREIMAGE_FIELDS)
+    }
+
+    now = datetime.utcnow()
+    # Mongo stores milliseconds; truncate so the stored value compares equal below
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    errors, planned = [], []
+    for move in moves:
+        deal = current.get(move.deal_id)
+        if deal is None:
+            errors.append(_error(move.deal_id, 404, "Deal not found"))
+            continue
+        if owner_id is not None and deal["created_by"] != owner_id:
+            errors.append(_error(move.deal_id, 403, "Not authorized to update this deal"))
+            continue
+        version = deal.get("version", 0)
+        if move.version is not None and move.version != version:
+            errors.append(_error(move.deal_id, 409, "Deal was modified by someone else"))
+            continue
+        if deal["stage"] == move.stage.value:
+            continue
+        after = {**deal, "stage": move.stage.value, "updated_at": now, "version": version + 1}
+        planned.append((deal, after))
+
+    if not planned:
+        return {"updated": [], "errors": errors}
+
+    result = await db.deals.bulk_write([
+        UpdateOne(
+            owned_filter(deal["id"], owner_id, deal.get("version", 0)),
+            {"$set": {"stage": after["stage"], "updated_at": now}, "$inc": {"version": 1}},
+        )
+        for deal, after in planned
+    ], ordered=False)
+
+    applied = planned
+    if result.modified_count != len(planned):
+        # Someone else wrote some of these deals between our read and write; keep the ones that carry our write
+        written = {
+            deal["id"]: deal
+            async for deal in db.deals.find({"id": {"$in": [deal["id"] for deal, _ in planned]}}, PREIMAGE_FIELDS)
+        }
+        applied = []
+        for deal, after in planned:
+            stored = written.get(deal["id"])
+            if stored is not None and stored.get("version") == after["version"] and stored.get("updated_at") == now:
+                applied.append((deal, after))
+            else:
+                errors.append(_error(deal["id"], 409, "Deal was modified by someone else"))
+
+    deltas = {}
+    for deal, after in applied:
+        owner = deal["created_by"]
+        deltas[owner] = merge_deltas(deltas.get(owner, {}), change_delta(deal_delta, deal, after))
+    await apply_deltas(db, "deals", deltas)
+    await publish(db, [change_event("deals", ChangeAction.UPDATED, after) for _, after in applied])
+    return {"updated": [after for _, after in applied], "errors": errors}
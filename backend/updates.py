@@ -0,0 +1,108 @@
+"""Ownership-checked updates and deletes, in a single round trip where possible.
+
+The ownership predicate (and, when the client sends one, the expected
+``version``) is part of the filter of a ``find_one_and_update`` /
+``find_one_and_delete``, so the check and the write are one atomic
+operation.  Only when nothing matched is the document looked up again to
+tell a 404 from a 403 from a version conflict.
+
+Every update increments ``version``; one without changes (an empty PATCH)
+is only checked, not written.  Documents written before versioning have no
+field and read as version 0.
+
+Fields derived from the whole document (search prefixes, ...) are written
+by the same ``$set``: given ``derive``, ``update_owned`` reads the document
+first, computes them from the updated one and pins the write to the version
+it read, retrying if another update got in between.  Such updates (every
+lead update) take two round trips instead of one.
+"""
+from datetime import datetime
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+
+# Pinned writes that lose a race are retried this many times before a 409
+UPDATE_ATTEMPTS = 5
+
+
+def owned_filter(doc_id: str, owner_id: Optional[str] = None, expected_version: Optional[int] = None) -> dict:
+    query = {"id": doc_id}
+    if owner_id is not None:
+        query["created_by"] = owner_id
+    if expected_version is not None:
+        query["version"] = {"$in": [0, None]} if expected_version == 0 else expected_version
+    return query
+
+
+def non_nullable_fields(changes: dict, model) -> list:
+    """Fields set to null in a PATCH that the stored model does not allow to be null."""
+    return [
+        field for field, value in changes.items()
+        if value is None and (model.model_fields[field].is_required() or model.model_fields[field].default is not None)
+    ]
+
+
+async def _raise_for_miss(collection, doc_id: str, owner_id: Optional[str], expected_version: Optional[int],
+                          label: str, action: str):
+    doc = await collection.find_one({"id": doc_id}, {"created_by": 1, "version": 1})
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"{label} not found")
+    if owner_id is not None and doc["created_by"] != owner_id:
+        raise HTTPException(status_code=403, detail=f"Not authorized to {action} this {label.lower()}")
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={
+            "message": f"{label} was modified by someone else",
+            "expected_version": expected_version,
+            "current_version": doc.get("version", 0),
+        },
+    )
+
+
+async def update_owned(collection, doc_id: str, changes: dict, owner_id: Optional[str], label: str,
+                       expected_version: Optional[int] = None, derive: Optional[Callable] = None) -> tuple:
+    """``$set`` only ``changes`` and return ``(before, after)`` without re-reading the document.
+
+    ``derive(before, after)`` returns the derived fields that change along
+    with ``changes``; they are set in the same write.  Without ``changes``
+    nothing is written and ``after`` is ``before`` itself.
+    """
+    if not changes:
+        before = await collection.find_one(owned_filter(doc_id, owner_id, expected_version), {"_id": False})
+        if before is None:
+            await _raise_for_miss(collection, doc_id, owner_id, expected_version, label, "update")
+        return before, before
+    changes = {**changes, "updated_at": datetime.utcnow()}
+    if derive is None:
+        before = await collection.find_one_and_update(
+            owned_filter(doc_id, owner_id, expected_version),
+            {"$set": changes, "$inc": {"version": 1}},
+            projection={"_id": False},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
+            await _raise_for_miss(collection, doc_id, owner_id, expected_version, label, "update")
+        return before, {**before, **changes, "version": before.get("version", 0) + 1}
+
+    for _ in range(UPDATE_ATTEMPTS):
+        before = await collection.find_one(owned_filter(doc_id, owner_id, expected_version), {"_id": False})
+        if before is None:
+            await _raise_for_miss(collection, doc_id, owner_id, expected_version, label, "update")
+        version = before.get("version", 0)
+        after = {**before, **changes, "version": version + 1}
+        derived = derive(before, after)
+        result = await collection.update_one(
+            owned_filter(doc_id, owner_id, version),
+            {"$set": {**changes, **derived}, "$inc": {"version": 1}},
+        )
+        if result.matched_count:
+            return before, {**after, **derived}
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"{label} is being modified concurrently, retry")
+
+
+async def delete_owned(collection, doc_id: str, owner_id: Optional[str], label: str) -> dict:
+    deleted = await collection.find_one_and_delete(owned_filter(doc_id, owner_id), projection={"_id": False})
+    if deleted is None:
+        await _raise_for_miss(collection, doc_id, owner_id, None, label, "delete")
+    return deleted
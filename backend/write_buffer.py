@@ -0,0 +1,169 @@
+"""Group commit for bursts of ``POST /leads`` and ``POST /contacts``.
+
+By default (``INGEST_MODE=direct``) every create is its own ``insert_one``,
+rollup ``$inc`` and event insert.  With one of the buffered modes the new
+documents are queued in a per-collection ``WriteBuffer`` instead, and a
+single background task commits them ``INGEST_BATCH_SIZE`` at a time with one
+``insert_many``, one rollup ``bulk_write`` and one event insert per batch.
+A batch is sent as soon as it is full, or ``INGEST_MAX_DELAY_MS`` after its
+first document arrived; while one batch is being written the next one fills
+up, so batches grow with the load.  Below ``INGEST_BATCH_SIZE`` concurrent
+creates a batch never fills, and ``INGEST_MAX_DELAY_MS`` is added to every
+group-committed request: the buffered modes pay off for bursts, not for a
+trickle of single posts.
+
+* ``group_commit``: the request waits until its batch is written, so the
+  response still means the lead is stored and insert errors still reach
+  the client.
+* ``write_behind``: the request returns ``202 Accepted`` as soon as the
+  document is queued.  Its ``id`` is already final, but a failed insert is
+  only logged, and the create-time duplicate check is skipped since it
+  could not see the queued documents anyway.
+
+At most ``INGEST_MAX_PENDING`` documents per collection are queued or being
+written; further creates wait for room (backpressure).  On shutdown the
+buffers stop accepting documents and write out what they hold.
+"""
+import asyncio
+import logging
+import os
+from enum import Enum
+from typing import Optional
+
+from fastapi import HTTPException, status
+from pymongo.errors import BulkWriteError
+
+from bulk_import import ROLLUP_DELTAS, ImportCollection
+from events import ChangeAction, change_event, publish
+from rollups import apply_deltas, merge_deltas
+
+logger = logging.getLogger(__name__)
+
+class IngestMode(str, Enum):
+    DIRECT = "direct"
+    GROUP_COMMIT = "group_commit"
+    WRITE_BEHIND = "write_behind"
+
+INGEST_MODE = IngestMode(os.environ.get('INGEST_MODE', IngestMode.DIRECT.value))
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 500))
+INGEST_MAX_DELAY_MS = float(os.environ.get('INGEST_MAX_DELAY_MS', 10))
+INGEST_MAX_PENDING = int(os.environ.get('INGEST_MAX_PENDING', 10000))
+
+
+async def commit_created(db, collection: ImportCollection, documents: list) -> dict:
+    """Insert new ``documents`` with their rollup deltas and events; returns ``{index: error}`` of failed ones."""
+    failed = {}
+    try:
+        await db[collection.value].insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed[error["index"]] = error.get("errmsg", "Write failed")
+    inserted = [doc for index, doc in enumerate(documents) if index not in failed]
+    if not inserted:
+        return failed
+
+    delta_fn = ROLLUP_DELTAS[collection]
+    deltas = {}
+    for doc in inserted:
+        owner = doc["created_by"]
+        deltas[owner] = merge_deltas(deltas.get(owner, {}), delta_fn(doc))
+    await apply_deltas(db, collection.value, deltas)
+    await publish(db, [change_event(collection.value, ChangeAction.CREATED, doc) for doc in inserted])
+    return failed
+
+
+class WriteBuffer:
+    """Queue of new documents of one collection, committed in batches by one background task."""
+
+    def __init__(self, db, collection: ImportCollection, batch_size: int = INGEST_BATCH_SIZE,
+                 max_delay_ms: float = INGEST_MAX_DELAY_MS, max_pending: int = INGEST_MAX_PENDING):
+        self.db = db
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self._room = asyncio.Semaphore(max_pending)
+        self._pending = []
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, document: dict, wait: bool):
+        """Queue ``document``; with ``wait`` return only once it is written, raising if that failed."""
+        if self._closing:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is shutting down")
+        await self._room.acquire()
+        if self._closing:
+            # close() began while we waited for room and _run may already have finished
+            self._room.release()
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is shutting down")
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._pending.append((document, future))
+        self._has_items.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        if future is not None:
+            # Shielded: a client that disconnects must not cancel the shared batch
+            await asyncio.shield(future)
+
+    async def close(self):
+        """Stop accepting documents and wait until the queued ones are written."""
+        self._closing = True
+        self._has_items.set()
+        self._full.set()
+        if self._task is not None:
+            await self._task
+
+    async def _run(self):
+        while True:
+            await self._has_items.wait()
+            if self._closing and not self._pending:
+                return
+            if len(self._pending) < self.batch_size and not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._pending[:self.batch_size]
+            del self._pending[:len(batch)]
+            if len(self._pending) < self.batch_size and not self._closing:
+                self._full.clear()
+            if not self._pending and not self._closing:
+                self._has_items.clear()
+            await self._commit(batch)
+
+    async def _commit(self, batch: list):
+        try:
+            failed = await commit_created(self.db, self.collection, [document for document, _ in batch])
+        except Exception as e:
+            logger.exception("Could not write a batch of %d %s", len(batch), self.collection.value)
+            failed = dict.fromkeys(range(len(batch)), str(e))
+        self.batches += 1
+        self.failed += len(failed)
+        self.committed += len(batch) - len(failed)
+        for index, (document, future) in enumerate(batch):
+            error = failed.get(index)
+            if future is None:
+                if error is not None:
+                    logger.error("Dropped queued %s %s: %s", self.collection.value, document["id"], error)
+            elif not future.done():
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(HTTPException(status_code=500, detail=f"Write failed: {error}"))
+        for _ in batch:
+            self._room.release()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "committed": self.committed,
+            "failed": self.failed,
+        }
@@ -227,7 +227,7 @@ class VaalticCRMTester:
         )
         
         if success:
-            print(f"   Found {len(response)} leads")
+            print(f"   Found {len(response['items'])} leads on the first page")
         
         # Update lead if we have one
         if lead_id:
@@ -302,7 +302,7 @@ class VaalticCRMTester:
         )
         
         if success:
-            print(f"   Found {len(response)} contacts")
+            print(f"   Found {len(response['items'])} contacts on the first page")
 
     def test_deal_management(self):
         """Test deal CRUD operations"""
@@ -372,7 +372,7 @@ class VaalticCRMTester:
         )
         
         if success:
-            print(f"   Found {len(response)} deals")
+            print(f"   Found {len(response['items'])} deals on the first page")
         
         # Update deal if we have one
         if deal_id:
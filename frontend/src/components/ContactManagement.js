@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useContext } from 'react';
 import { AuthContext } from '../App';
+import { fetchPage } from '../lib/fetch-pages';
 import { Card } from './ui/card';
 import { Button } from './ui/button';
 import { Input } from './ui/input';
@@ -16,11 +17,18 @@ import {
   Briefcase
 } from 'lucide-react';
 
+const PAGE_SIZE = 50;
+const SEARCH_LIMIT = 50;
+const SEARCH_DEBOUNCE_MS = 250;
+
 const ContactManagement = () => {
   const { API } = useContext(AuthContext);
   const [contacts, setContacts] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
   const [showAddModal, setShowAddModal] = useState(false);
   const [editingContact, setEditingContact] = useState(null);
 
@@ -36,10 +44,22 @@ const ContactManagement = () => {
     fetchContacts();
   }, []);
 
-  const fetchContacts = async () => {
+  useEffect(() => {
+    // Terms of two or more characters are searched on the server, shorter ones filter the loaded pages
+    const term = searchTerm.trim();
+    if (term.length < 2) {
+      setSearchResults(null);
+      return;
+    }
+    const timer = setTimeout(() => searchContacts(term), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  const searchContacts = async (term) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API}/contacts`, {
+      const params = new URLSearchParams({ q: term, collection: 'contacts', limit: SEARCH_LIMIT });
+      const response = await fetch(`${API}/search?${params}`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -47,8 +67,22 @@ const ContactManagement = () => {
 
       if (response.ok) {
         const data = await response.json();
-        setContacts(data);
+        setSearchResults(data.items.map(hit => hit.item));
       }
+    } catch (error) {
+      console.error('Failed to search contacts:', error);
+    }
+  };
+
+  const fetchContacts = async (cursor = null) => {
+    try {
+      const params = { limit: PAGE_SIZE };
+      if (cursor) {
+        params.cursor = cursor;
+      }
+      const data = await fetchPage(API, 'contacts', params);
+      setContacts(prev => cursor ? [...prev, ...data.items] : data.items);
+      setNextCursor(data.next_cursor);
     } catch (error) {
       console.error('Failed to fetch contacts:', error);
     } finally {
@@ -56,6 +90,12 @@ const ContactManagement = () => {
     }
   };
 
+  const loadMoreContacts = async () => {
+    setLoadingMore(true);
+    await fetchContacts(nextCursor);
+    setLoadingMore(false);
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -86,7 +126,7 @@ const ContactManagement = () => {
     }
   };
 
-  const filteredContacts = contacts.filter(contact => 
+  const filteredContacts = searchResults || contacts.filter(contact => 
     contact.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
     contact.email.toLowerCase().includes(searchTerm.toLowerCase()) ||
     (contact.company && contact.company.toLowerCase().includes(searchTerm.toLowerCase()))
@@ -247,7 +287,15 @@ const ContactManagement = () => {
         ))}
       </div>
 
-      {filteredContacts.length === 0 && (
+      {nextCursor && searchResults === null && (
+        <div className="flex justify-center">
+          <Button variant="outline" onClick={loadMoreContacts} disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load More Contacts'}
+          </Button>
+        </div>
+      )}
+
+      {filteredContacts.length === 0 && (!nextCursor || searchResults !== null) && (
         <Card className="p-12 text-center bg-white border-0 shadow-md">
           <User className="h-16 w-16 text-gray-300 mx-auto mb-4" />
           <h3 className="text-lg font-medium text-gray-900 mb-2">No contacts found</h3>
@@ -1,5 +1,6 @@
-import React, { useState, useEffect, useContext } from 'react';
+import React, { useState, useEffect, useContext, useRef } from 'react';
 import { AuthContext } from '../App';
+import { useChangeEvents } from '../hooks/use-change-events';
 import { Card } from './ui/card';
 import { 
   Users, 
@@ -19,15 +20,32 @@ import {
   User
 } from 'lucide-react';
 
+const REFRESH_DELAY_MS = 1000;
+
 const Dashboard = () => {
   const { API, user } = useContext(AuthContext);
   const [analytics, setAnalytics] = useState(null);
   const [loading, setLoading] = useState(true);
 
+  const refreshTimer = useRef(null);
+
   useEffect(() => {
     fetchAnalytics();
+    return () => clearTimeout(refreshTimer.current);
   }, []);
 
+  // Refetch after pushed changes, at most once per REFRESH_DELAY_MS; the ETag makes unchanged reads cheap
+  const scheduleRefresh = () => {
+    if (!refreshTimer.current) {
+      refreshTimer.current = setTimeout(() => {
+        refreshTimer.current = null;
+        fetchAnalytics();
+      }, REFRESH_DELAY_MS);
+    }
+  };
+
+  useChangeEvents(API, scheduleRefresh, scheduleRefresh);
+
   const fetchAnalytics = async () => {
     try {
       const token = localStorage.getItem('token');
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useContext } from 'react';
 import { AuthContext } from '../App';
+import { applyChange, useChangeEvents } from '../hooks/use-change-events';
 import { Card } from './ui/card';
 import { Button } from './ui/button';
 import { Input } from './ui/input';
@@ -17,11 +18,18 @@ import {
   User
 } from 'lucide-react';
 
+const PAGE_SIZE = 50;
+const SEARCH_LIMIT = 50;
+const SEARCH_DEBOUNCE_MS = 250;
+
 const LeadManagement = () => {
   const { API, user } = useContext(AuthContext);
   const [leads, setLeads] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
   const [filterStage, setFilterStage] = useState('all');
   const [showAddModal, setShowAddModal] = useState(false);
   const [editingLead, setEditingLead] = useState(null);
@@ -52,12 +60,31 @@ const LeadManagement = () => {
 
   useEffect(() => {
     fetchLeads();
-  }, []);
+  }, [filterStage]);
+
+  // Changes made by anyone, this tab included, are pushed by the server
+  useChangeEvents(API, (event) => {
+    if (event.collection === 'leads') {
+      applyLeadChange(event);
+    }
+  }, () => fetchLeads());
 
-  const fetchLeads = async () => {
+  useEffect(() => {
+    // Terms of two or more characters are searched on the server, shorter ones filter the loaded page
+    const term = searchTerm.trim();
+    if (term.length < 2) {
+      setSearchResults(null);
+      return;
+    }
+    const timer = setTimeout(() => searchLeads(term), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  const searchLeads = async (term) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API}/leads`, {
+      const params = new URLSearchParams({ q: term, collection: 'leads', limit: SEARCH_LIMIT });
+      const response = await fetch(`${API}/search?${params}`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -65,7 +92,33 @@ const LeadManagement = () => {
 
       if (response.ok) {
         const data = await response.json();
-        setLeads(data);
+        setSearchResults(data.items.map(hit => hit.item));
+      }
+    } catch (error) {
+      console.error('Failed to search leads:', error);
+    }
+  };
+
+  const fetchLeads = async (cursor = null) => {
+    try {
+      const token = localStorage.getItem('token');
+      const params = new URLSearchParams({ limit: PAGE_SIZE });
+      if (cursor) {
+        params.set('cursor', cursor);
+      }
+      if (filterStage !== 'all') {
+        params.set('filter[stage]', filterStage);
+      }
+      const response = await fetch(`${API}/leads?${params}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      });
+
+      if (response.ok) {
+        const data = await response.json();
+        setLeads(prev => cursor ? [...prev, ...data.items] : data.items);
+        setNextCursor(data.next_cursor);
       }
     } catch (error) {
       console.error('Failed to fetch leads:', error);
@@ -74,13 +127,35 @@ const LeadManagement = () => {
     }
   };
 
+  // Apply a lead change to the loaded pages instead of refetching them
+  const applyLeadChange = (event) => {
+    if (event.action === 'refresh') {
+      fetchLeads();
+      return;
+    }
+    if (event.data && filterStage !== 'all' && event.data.stage !== filterStage) {
+      setLeads(prev => prev.filter(lead => lead.id !== event.id));
+      return;
+    }
+    setLeads(prev => applyChange(prev, event));
+  };
+
+  const loadMoreLeads = async () => {
+    setLoadingMore(true);
+    await fetchLeads(nextCursor);
+    setLoadingMore(false);
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
     try {
       const token = localStorage.getItem('token');
       const url = editingLead ? `${API}/leads/${editingLead.id}` : `${API}/leads`;
-      const method = editingLead ? 'PUT' : 'POST';
+      // An edit only sends the form's fields, so the assignee is left alone,
+      // and the version makes it fail rather than overwrite a newer change
+      const method = editingLead ? 'PATCH' : 'POST';
+      const body = editingLead ? { ...formData, version: editingLead.version } : formData;
 
       const response = await fetch(url, {
         method,
@@ -88,11 +163,12 @@ const LeadManagement = () => {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`
         },
-        body: JSON.stringify(formData)
+        body: JSON.stringify(body)
       });
 
       if (response.ok) {
-        fetchLeads();
+        const { possible_duplicates, ...lead } = await response.json();
+        applyLeadChange({ action: editingLead ? 'updated' : 'created', id: lead.id, data: lead });
         setShowAddModal(false);
         setEditingLead(null);
         setFormData({
@@ -139,18 +215,21 @@ const LeadManagement = () => {
       });
 
       if (response.ok) {
-        fetchLeads();
+        applyLeadChange({ action: 'deleted', id: leadId });
       }
     } catch (error) {
       console.error('Failed to delete lead:', error);
     }
   };
 
-  const filteredLeads = leads.filter(lead => {
-    const matchesSearch = lead.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
+  const filteredLeads = (searchResults || leads).filter(lead => {
+    const matchesSearch = searchResults !== null ||
+                         lead.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
                          lead.email.toLowerCase().includes(searchTerm.toLowerCase()) ||
                          (lead.company && lead.company.toLowerCase().includes(searchTerm.toLowerCase()));
     
+    // The stage filter is applied by the server, this only hides leads just moved out of it
+    // (and filters search results, which are not stage filtered)
     const matchesFilter = filterStage === 'all' || lead.stage === filterStage;
     
     return matchesSearch && matchesFilter;
@@ -374,7 +453,15 @@ const LeadManagement = () => {
         })}
       </div>
 
-      {filteredLeads.length === 0 && (
+      {nextCursor && searchResults === null && (
+        <div className="flex justify-center">
+          <Button variant="outline" onClick={loadMoreLeads} disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load More Leads'}
+          </Button>
+        </div>
+      )}
+
+      {filteredLeads.length === 0 && (!nextCursor || searchResults !== null) && (
         <Card className="p-12 text-center bg-white border-0 shadow-md">
           <User className="h-16 w-16 text-gray-300 mx-auto mb-4" />
           <h3 className="text-lg font-medium text-gray-900 mb-2">No leads found</h3>
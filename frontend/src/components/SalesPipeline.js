@@ -1,5 +1,8 @@
-import React, { useState, useEffect, useContext } from 'react';
+import React, { useState, useEffect, useContext, useRef } from 'react';
 import { AuthContext } from '../App';
+import { applyChange, useChangeEvents } from '../hooks/use-change-events';
+import { fetchAllPages } from '../lib/fetch-pages';
+import { Alert } from './ui/alert';
 import { Card } from './ui/card';
 import { Button } from './ui/button';
 import { Input } from './ui/input';
@@ -15,13 +18,20 @@ import {
   Target
 } from 'lucide-react';
 
+const PAGE_SIZE = 200;
+// Drops within this window are sent to the server as one batch
+const MOVE_BATCH_DELAY_MS = 400;
+
 const SalesPipeline = () => {
   const { API } = useContext(AuthContext);
   const [deals, setDeals] = useState([]);
   const [contacts, setContacts] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [loadError, setLoadError] = useState(null);
   const [showAddModal, setShowAddModal] = useState(false);
   const [draggedDeal, setDraggedDeal] = useState(null);
+  const pendingMoves = useRef({});
+  const flushTimer = useRef(null);
 
   const [formData, setFormData] = useState({
     title: '',
@@ -72,33 +82,46 @@ const SalesPipeline = () => {
 
   useEffect(() => {
     fetchData();
+    // Send any queued moves when leaving the board
+    return () => {
+      if (flushTimer.current) {
+        clearTimeout(flushTimer.current);
+        flushMoves();
+      }
+    };
   }, []);
 
+  // Deals moved or edited by anyone are pushed by the server
+  useChangeEvents(API, (event) => {
+    const setItems = { deals: setDeals, contacts: setContacts }[event.collection];
+    if (!setItems) {
+      return;
+    }
+    if (event.action === 'refresh') {
+      fetchData();
+      return;
+    }
+    setItems(prev => applyChange(prev, event));
+  }, fetchData);
+
+  // Load every page of a collection, rendering each page as soon as it arrives
+  const fetchCollection = (path, setItems) => fetchAllPages(API, path, PAGE_SIZE, (items, isFirstPage) => {
+    setItems(prev => isFirstPage ? items : [...prev, ...items]);
+    setLoading(false);
+  });
+
   const fetchData = async () => {
     try {
-      const token = localStorage.getItem('token');
-      
+      setLoadError(null);
       // Fetch deals and contacts
-      const [dealsResponse, contactsResponse] = await Promise.all([
-        fetch(`${API}/deals`, {
-          headers: { 'Authorization': `Bearer ${token}` }
-        }),
-        fetch(`${API}/contacts`, {
-          headers: { 'Authorization': `Bearer ${token}` }
-        })
+      await Promise.all([
+        fetchCollection('deals', setDeals),
+        fetchCollection('contacts', setContacts)
       ]);
-
-      if (dealsResponse.ok) {
-        const dealsData = await dealsResponse.json();
-        setDeals(dealsData);
-      }
-
-      if (contactsResponse.ok) {
-        const contactsData = await contactsResponse.json();
-        setContacts(contactsData);
-      }
     } catch (error) {
+      // A board missing some pages would look complete, so say so
       console.error('Failed to fetch data:', error);
+      setLoadError('The pipeline could not be loaded completely.');
     } finally {
       setLoading(false);
     }
@@ -125,7 +148,8 @@ const SalesPipeline = () => {
       });
 
       if (response.ok) {
-        fetchData();
+        const deal = await response.json();
+        setDeals(prev => applyChange(prev, { action: 'created', id: deal.id, data: deal }));
         setShowAddModal(false);
         setFormData({
           title: '',
@@ -151,43 +175,62 @@ const SalesPipeline = () => {
     e.dataTransfer.dropEffect = 'move';
   };
 
-  const handleDrop = async (e, newStage) => {
-    e.preventDefault();
-    
-    if (!draggedDeal || draggedDeal.stage === newStage) {
-      setDraggedDeal(null);
+  const flushMoves = async () => {
+    const moves = Object.values(pendingMoves.current);
+    pendingMoves.current = {};
+    flushTimer.current = null;
+    if (moves.length === 0) {
       return;
     }
 
     try {
       const token = localStorage.getItem('token');
-      const contact = contacts.find(c => c.id === draggedDeal.contact_id);
-      
-      const updatedDeal = {
-        title: draggedDeal.title,
-        value: draggedDeal.value,
-        expected_close_date: draggedDeal.expected_close_date,
-        contact_id: draggedDeal.contact_id,
-        stage: newStage,
-        description: draggedDeal.description
-      };
-
-      const response = await fetch(`${API}/deals/${draggedDeal.id}`, {
-        method: 'PUT',
+      const response = await fetch(`${API}/deals/transitions`, {
+        method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`
         },
-        body: JSON.stringify(updatedDeal)
+        body: JSON.stringify({ moves })
       });
 
       if (response.ok) {
+        const result = await response.json();
+        const updatedById = Object.fromEntries(result.updated.map(deal => [deal.id, deal]));
+        setDeals(prev => prev.map(deal => updatedById[deal.id] || deal));
+        // Conflicts or rejected moves leave the board out of sync with the server
+        if (result.errors.length > 0) {
+          fetchData();
+        }
+      } else {
         fetchData();
       }
     } catch (error) {
-      console.error('Failed to update deal:', error);
+      console.error('Failed to update deals:', error);
+      fetchData();
+    }
+  };
+
+  const handleDrop = (e, newStage) => {
+    e.preventDefault();
+    
+    if (!draggedDeal || draggedDeal.stage === newStage) {
+      setDraggedDeal(null);
+      return;
     }
 
+    // Move the card right away and queue the transition; the version is the one the server last sent
+    const queued = pendingMoves.current[draggedDeal.id];
+    pendingMoves.current[draggedDeal.id] = {
+      deal_id: draggedDeal.id,
+      stage: newStage,
+      version: queued ? queued.version : draggedDeal.version
+    };
+    setDeals(prev => prev.map(deal => deal.id === draggedDeal.id ? { ...deal, stage: newStage } : deal));
+
+    clearTimeout(flushTimer.current);
+    flushTimer.current = setTimeout(flushMoves, MOVE_BATCH_DELAY_MS);
+
     setDraggedDeal(null);
   };
 
@@ -307,6 +350,15 @@ const SalesPipeline = () => {
         </Dialog>
       </div>
 
+      {loadError && (
+        <Alert className="flex items-center justify-between bg-red-50 border-red-300 text-red-700">
+          <span>{loadError}</span>
+          <Button variant="outline" size="sm" onClick={fetchData}>
+            Retry
+          </Button>
+        </Alert>
+      )}
+
       {/* Pipeline Statistics */}
       <div className="grid grid-cols-1 md:grid-cols-5 gap-4">
         {pipelineStages.map(stage => (
@@ -0,0 +1,120 @@
+import * as React from "react"
+
+const MAX_RETRY_DELAY = 30000
+
+// Split a Server-Sent Events buffer into complete frames and the unfinished rest
+function parseFrames(buffer) {
+  const frames = buffer.split("\n\n")
+  const rest = frames.pop()
+  const events = frames.map((frame) => {
+    const event = { type: "message", data: "" }
+    for (const line of frame.split("\n")) {
+      if (line.startsWith(":")) {
+        continue
+      }
+      const colon = line.indexOf(":")
+      const field = colon === -1 ? line : line.slice(0, colon)
+      const value = colon === -1 ? "" : line.slice(colon + 1).replace(/^ /, "")
+      if (field === "event") {
+        event.type = value
+      } else if (field === "data") {
+        event.data += value
+      } else if (field === "retry") {
+        event.retry = parseInt(value, 10)
+      }
+    }
+    return event
+  })
+  return { events, rest }
+}
+
+// Subscribe to /events while mounted.  `onChange` receives each change event
+// ({collection, action, id, data}); `onResync` is called when the stream
+// (re)connects or the server reports missed events, and should refetch.
+// EventSource cannot send the Authorization header, so the stream is read
+// with fetch.
+function useChangeEvents(API, onChange, onResync) {
+  const handlers = React.useRef({ onChange, onResync })
+  handlers.current = { onChange, onResync }
+
+  React.useEffect(() => {
+    const controller = new AbortController()
+    let retryDelay = 3000
+    let connectedOnce = false
+    let timer = null
+
+    const connect = async () => {
+      try {
+        const response = await fetch(`${API}/events`, {
+          headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+          signal: controller.signal,
+        })
+        if (!response.ok || !response.body) {
+          throw new Error(`Event stream failed with status ${response.status}`)
+        }
+        // Anything may have changed while we were disconnected
+        if (connectedOnce) {
+          handlers.current.onResync?.()
+        }
+        connectedOnce = true
+
+        const reader = response.body.getReader()
+        const decoder = new TextDecoder()
+        let buffer = ""
+        for (;;) {
+          const { value, done } = await reader.read()
+          if (done) {
+            break
+          }
+          const parsed = parseFrames(buffer + decoder.decode(value, { stream: true }))
+          buffer = parsed.rest
+          for (const event of parsed.events) {
+            if (event.retry) {
+              retryDelay = event.retry
+            } else if (event.type === "resync") {
+              handlers.current.onResync?.()
+            } else if (event.type === "change") {
+              handlers.current.onChange?.(JSON.parse(event.data))
+            }
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) {
+          return
+        }
+        console.error("Event stream disconnected:", error)
+        retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY)
+      }
+      if (!controller.signal.aborted) {
+        timer = setTimeout(connect, retryDelay)
+      }
+    }
+
+    connect()
+    return () => {
+      controller.abort()
+      clearTimeout(timer)
+    }
+  }, [API])
+}
+
+// Insert, replace or remove `event`'s record in a list of records
+function applyChange(items, event) {
+  if (event.action === "deleted") {
+    return items.filter((item) => item.id !== event.id)
+  }
+  const index = items.findIndex((item) => item.id === event.id)
+  if (index === -1) {
+    return event.action === "created" ? [event.data, ...items] : items
+  }
+  const current = items[index]
+  // Ignore events older than what we already have
+  if ((current.version ?? 0) > (event.data.version ?? 0)) {
+    return items
+  }
+  const next = items.slice()
+  next[index] = { ...current, ...event.data }
+  return next
+}
+
+export { useChangeEvents, applyChange }
@@ -0,0 +1,46 @@
+// A rate-limited request is retried this many times before it counts as failed
+const MAX_RATE_LIMIT_RETRIES = 5;
+// Used when a 429 carries no usable Retry-After
+const DEFAULT_RETRY_SECONDS = 1;
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// GET `url`, waiting out 429s for as long as their Retry-After asks.
+// Any other non-2xx response (or too many 429s) throws.
+export async function fetchWithRetry(url, options) {
+  for (let attempt = 0; ; attempt++) {
+    const response = await fetch(url, options);
+    if (response.status === 429 && attempt < MAX_RATE_LIMIT_RETRIES) {
+      const seconds = parseFloat(response.headers.get('Retry-After'));
+      await sleep((Number.isFinite(seconds) ? seconds : DEFAULT_RETRY_SECONDS) * 1000);
+      continue;
+    }
+    if (!response.ok) {
+      throw new Error(`Request to ${url} failed with status ${response.status}`);
+    }
+    return response;
+  }
+}
+
+// Fetch one page of a list route; resolves to {items, next_cursor}
+export async function fetchPage(API, path, params) {
+  const response = await fetchWithRetry(`${API}/${path}?${new URLSearchParams(params)}`, {
+    headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
+  });
+  return response.json();
+}
+
+// Load every page of a list route, handing each page's items to `onPage` as
+// soon as it arrives (`isFirstPage` tells when to replace rather than append)
+export async function fetchAllPages(API, path, pageSize, onPage) {
+  let cursor = null;
+  do {
+    const params = { limit: pageSize };
+    if (cursor) {
+      params.cursor = cursor;
+    }
+    const data = await fetchPage(API, path, params);
+    onPage(data.items, cursor === null);
+    cursor = data.next_cursor;
+  } while (cursor);
+}
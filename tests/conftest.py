@@ -0,0 +1,71 @@
+"""Route tests: the whole app in process on the in-memory storage engine.
+
+Run from the repository root with ``python -m pytest tests``.  The settings
+below are applied before ``server`` is imported, since it reads them at
+import time; ``backend_test.py`` is the separate live test of a deployment.
+"""
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+os.environ['STORAGE_ENGINE'] = 'memory'
+os.environ['INGEST_MODE'] = 'direct'
+# Tests that exercise the limits install their own buckets
+os.environ['RATE_LIMIT_PER_SECOND'] = '1000000'
+os.environ['RATE_LIMIT_BURST'] = '1000000'
+# Leads are only auto-assigned while the pool has members (see the assignees fixture)
+os.environ['LEAD_ASSIGNMENT'] = 'round_robin'
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def run(client):
+    """Call an async function (e.g. a maintenance job on ``server.db``) on the app's event loop."""
+    return lambda fn, *args, **kwargs: client.portal.call(lambda: fn(*args, **kwargs))
+
+
+@pytest.fixture
+def register(client):
+    """Register a fresh user; returns ``(user, auth headers)``."""
+
+    def register(role: str = "customer") -> tuple:
+        email = f"{role}-{uuid.uuid4().hex[:12]}@example.com"
+        response = client.post("/api/auth/register", json={
+            "email": email, "password": "secret", "full_name": f"Test {role}", "role": role,
+        })
+        assert response.status_code == 200, response.text
+        token = client.post("/api/auth/login", json={"email": email, "password": "secret"}).json()["access_token"]
+        return response.json(), {"Authorization": f"Bearer {token}"}
+
+    return register
+
+
+@pytest.fixture
+def admin(register) -> dict:
+    return register("admin")[1]
+
+
+@pytest.fixture
+def customer(register) -> dict:
+    return register("customer")[1]
+
+
+@pytest.fixture
+def assignees(run):
+    """An empty assignment pool, emptied again afterwards so other tests' leads stay unassigned."""
+    run(server.db.assignees.delete_many, {})
+    yield server.db.assignees
+    run(server.db.assignees.delete_many, {})
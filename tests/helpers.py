@@ -0,0 +1,41 @@
+"""Request helpers shared by the route tests."""
+import json
+from datetime import datetime, timedelta
+
+
+def create_lead(client, headers, **fields) -> dict:
+    body = {"name": "Ada Lovelace", "email": "ada@example.com", **fields}
+    response = client.post("/api/leads", headers=headers, json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def create_contact(client, headers, **fields) -> dict:
+    body = {"name": "Grace Hopper", "email": "grace@example.com", **fields}
+    response = client.post("/api/contacts", headers=headers, json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def create_deal(client, headers, contact_id: str, **fields) -> dict:
+    body = {
+        "title": "Annual plan", "value": 1200, "contact_id": contact_id,
+        "expected_close_date": (datetime.utcnow() + timedelta(days=30)).isoformat(), **fields,
+    }
+    response = client.post("/api/deals", headers=headers, json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def join_pool(client, admin, user_id: str) -> dict:
+    response = client.put(f"/api/admin/assignees/{user_id}", headers=admin, json={})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def open_leads(client, admin) -> dict:
+    return {member["user_id"]: member["open_leads"] for member in client.get("/api/admin/assignees", headers=admin).json()}
+
+
+def ndjson(*records) -> str:
+    return "\n".join(json.dumps(record) for record in records)
@@ -0,0 +1,17 @@
+import server
+from admission import TokenBuckets
+
+
+def test_anonymous_rate_limit_is_per_forwarded_client(client, monkeypatch):
+    monkeypatch.setattr(server.admission, "buckets", TokenBuckets(rate=0.001, burst=2))
+    monkeypatch.setattr(server.admission, "trusted_proxies", frozenset({"testclient"}))
+    login = {"email": "nobody@example.com", "password": "wrong"}
+
+    def attempt(address: str) -> int:
+        return client.post("/api/auth/login", json=login, headers={"X-Forwarded-For": address}).status_code
+
+    assert [attempt("203.0.113.1") for _ in range(3)] == [401, 401, 429]
+    assert attempt("203.0.113.2") == 401
+    # A client cannot pick a fresh bucket by forging the header in front of the proxy's
+    assert attempt("198.51.100.7, 203.0.113.1") == 429
+
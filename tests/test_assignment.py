@@ -0,0 +1,58 @@
+import server
+from assignment import reconcile
+from tests.helpers import create_lead, join_pool, open_leads
+
+
+def test_put_keeps_automatic_assignee(client, admin, register, assignees):
+    rep, _ = register()
+    join_pool(client, admin, rep["id"])
+    lead = create_lead(client, admin)
+    assert lead["assigned_to"] == rep["id"]
+
+    response = client.put(f"/api/leads/{lead['id']}", headers=admin, json={"name": "Ada King", "email": "ada@example.com"})
+    assert response.status_code == 200
+    assert response.json()["assigned_to"] == rep["id"]
+    assert open_leads(client, admin) == {rep["id"]: 1}
+
+    client.patch(f"/api/leads/{lead['id']}", headers=admin, json={"stage": "converted"})
+    assert open_leads(client, admin) == {rep["id"]: 0}
+
+
+def test_merge_moves_assignee_load(client, admin, register, run, assignees):
+    rep, _ = register()
+    join_pool(client, admin, rep["id"])
+    primary = create_lead(client, admin, email="twin@example.com", assigned_to=None)
+    duplicate = create_lead(client, admin, email="twin@example.com")
+    assert open_leads(client, admin) == {rep["id"]: 2}
+
+    response = client.post("/api/duplicates/leads/merge", headers=admin,
+                           json={"primary_id": primary["id"], "duplicate_id": duplicate["id"]})
+    assert response.status_code == 200
+    assert open_leads(client, admin) == {rep["id"]: 1}
+    assert run(reconcile, server.db, dry_run=True) == {}
+    assert client.post("/api/duplicates/leads/merge", headers=admin,
+                       json={"primary_id": primary["id"], "duplicate_id": primary["id"]}).status_code == 400
+
+
+def test_assignees_are_admin_only(client, admin, customer, register, assignees):
+    rep, _ = register()
+    assert client.put(f"/api/admin/assignees/{rep['id']}", headers=customer, json={}).status_code == 403
+    assert client.put("/api/admin/assignees/nobody", headers=admin, json={}).status_code == 404
+    member = join_pool(client, admin, rep["id"])
+    assert member["active"] and member["open_leads"] == 0
+    assert client.delete(f"/api/admin/assignees/{rep['id']}", headers=admin).status_code == 200
+    assert client.delete(f"/api/admin/assignees/{rep['id']}", headers=admin).status_code == 404
+
+
+
+def test_reconcile_recounts_open_leads(client, admin, register, run, assignees):
+    rep, _ = register()
+    join_pool(client, admin, rep["id"])
+    create_lead(client, admin)
+    create_lead(client, admin, email="closed@example.com", stage="converted")
+    run(assignees.update_one, {"_id": rep["id"]}, {"$set": {"open_leads": 7}})
+
+    assert run(reconcile, server.db, dry_run=True) == {rep["id"]: {"stored": 7, "expected": 1}}
+    assert open_leads(client, admin) == {rep["id"]: 7}
+    run(reconcile, server.db)
+    assert open_leads(client, admin) == {rep["id"]: 1}
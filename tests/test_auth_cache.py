@@ -0,0 +1,35 @@
+import time
+from types import SimpleNamespace
+
+import auth_cache
+import server
+from auth_cache import TTLCache
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(auth_cache, "time", SimpleNamespace(monotonic=lambda: now[0], time=time.time))
+    cache = TTLCache(max_entries=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3, ttl_seconds=60)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+    # A per-entry TTL never extends the cache's own
+    now[0] = 10
+    assert (cache.get("a"), cache.get("c")) == (None, None)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cached_user_is_dropped_on_invalidation(client, run, register):
+    user, headers = register()
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    run(server.db.users.update_one, {"id": user["id"]}, {"$set": {"is_active": False}})
+    # Served from the cache until the entry expires or is invalidated
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    server.auth_cache.invalidate_user(user["email"])
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Inactive user"
@@ -0,0 +1,52 @@
+import server
+from assignment import AssignmentStrategy, assign_leads, reconcile
+from tests.helpers import join_pool, ndjson, open_leads
+
+
+def test_import_reports_bad_rows(client, customer):
+    body = ndjson(
+        {"name": "Imported One", "email": "one@example.com", "source": "referral"},
+        {"name": "Bad email", "email": "not-an-email"},
+        {"name": "Imported Two", "email": "two@example.com"},
+    ) + "\nnot json\n"
+    report = client.post("/api/import/leads", headers=customer, content=body).json()
+    assert report["inserted"] == 2
+    assert [error["row"] for error in report["errors"]] == [2, 4]
+
+    csv_body = "name,email,company\nCsv Contact,csv@example.com,\"Acme, Inc\"\n"
+    report = client.post("/api/import/contacts", headers={**customer, "Content-Type": "text/csv"}, content=csv_body).json()
+    assert report == {"inserted": 1, "failed": 0, "errors": [], "errors_truncated": False}
+    contacts = client.get("/api/contacts", headers=customer).json()["items"]
+    assert [contact["company"] for contact in contacts] == ["Acme, Inc"]
+
+
+def test_import_assigns_leads(client, admin, register, run, assignees):
+    reps = [register()[0] for _ in range(2)]
+    for rep in reps:
+        join_pool(client, admin, rep["id"])
+    body = ndjson(*({"name": f"Imported {i}", "email": f"imported{i}@example.com"} for i in range(4)))
+    assert client.post("/api/import/leads", headers=admin, content=body).json()["inserted"] == 4
+    assert open_leads(client, admin) == {rep["id"]: 2 for rep in reps}
+    assert run(reconcile, server.db, dry_run=True) == {}
+
+
+def test_batch_assignment_takes_turns_like_single_creates(run, assignees):
+    run(assignees.insert_many, [
+        {"_id": "rep-a", "sources": ["referral", "call"], "active": True, "assigned": 0, "open_leads": 0},
+        {"_id": "rep-b", "sources": ["referral"], "active": True, "assigned": 0, "open_leads": 0},
+        {"_id": "rep-c", "sources": ["referral", "call"], "active": False, "assigned": 0, "open_leads": 0},
+    ])
+    leads = [{"source": "referral", "stage": "new"} for _ in range(4)] + [
+        {"source": "call", "stage": "converted"},
+        {"source": "fax", "stage": "new"},
+        {"source": "referral", "stage": "new", "assigned_to": "rep-b"},
+    ]
+
+    run(assign_leads, server.db, leads, AssignmentStrategy.ROUND_ROBIN)
+
+    assert [lead.get("assigned_to") for lead in leads] == ["rep-a", "rep-b", "rep-a", "rep-b", "rep-a", None, "rep-b"]
+    counters = {
+        member["_id"]: (member["assigned"], member["open_leads"])
+        for member in run(lambda: assignees.find({}).to_list(None))
+    }
+    assert counters == {"rep-a": (3, 2), "rep-b": (2, 3), "rep-c": (0, 0)}
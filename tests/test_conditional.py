@@ -0,0 +1,17 @@
+from tests.helpers import create_lead
+
+
+def test_list_etag_follows_writes_of_its_own_scope(client, register):
+    _, headers = register()
+    _, other = register()
+    create_lead(client, headers)
+    etag = client.get("/api/leads", headers=headers).headers["ETag"]
+
+    def status(etag: str) -> int:
+        return client.get("/api/leads", headers={**headers, "If-None-Match": etag}).status_code
+
+    assert status(etag) == 304
+    create_lead(client, other)
+    assert status(etag) == 304
+    create_lead(client, headers, email="second@example.com")
+    assert status(etag) == 200
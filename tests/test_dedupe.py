@@ -0,0 +1,27 @@
+import server
+from dedupe import DedupeCollection, run_dedupe
+from tests.helpers import create_contact, create_deal
+
+
+def test_create_reports_possible_duplicates(client, customer):
+    first = create_contact(client, customer, phone="+1 555 0100")
+    second = create_contact(client, customer, name="G. Hopper", phone="555-0100")
+    assert [match["id"] for match in second["possible_duplicates"]] == [first["id"]]
+
+
+def test_merge_moves_deals_and_closes_candidates(client, run, customer):
+    primary = create_contact(client, customer, email="merge@example.com")
+    duplicate = create_contact(client, customer, email="merge@example.com", phone="555-0199")
+    deal = create_deal(client, customer, duplicate["id"])
+    run(run_dedupe, server.db, [DedupeCollection.CONTACTS])
+    candidates = client.get("/api/duplicates/contacts", headers=customer).json()
+    assert [sorted(candidate["ids"]) for candidate in candidates] == [sorted([primary["id"], duplicate["id"]])]
+
+    response = client.post("/api/duplicates/contacts/merge", headers=customer,
+                           json={"primary_id": primary["id"], "duplicate_id": duplicate["id"]})
+    assert response.status_code == 200
+    assert response.json()["phone"] == "555-0199"
+    deals = client.get("/api/deals", headers=customer).json()["items"]
+    assert [(item["id"], item["contact_id"]) for item in deals] == [(deal["id"], primary["id"])]
+    assert client.get("/api/duplicates/contacts", headers=customer).json() == []
+    assert client.get("/api/analytics/dashboard", headers=customer).json()["total_contacts"] == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import orjson
+
+import server
+from benchmarks.common import asgi_request
+from events import EventBroker, stream_events
+
+
+def test_event_stream_delivers_own_changes(client, register):
+    user, headers = register()
+
+    async def first_change() -> bytes:
+        chunks, subscribed, done = [], asyncio.Event(), asyncio.Event()
+
+        async def receive():
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                subscribed.set()
+                if b"event: change" in b"".join(chunks):
+                    done.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/api/events", "raw_path": b"/api/events", "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"test"), (b"authorization", headers["Authorization"].encode())],
+            "client": ("127.0.0.1", 0), "server": ("test", 80),
+        }
+        stream = asyncio.ensure_future(server.app(scope, receive, send))
+        await asyncio.wait_for(subscribed.wait(), 5)
+        token = headers["Authorization"].split()[1]
+        status, _ = await asgi_request(server.app, "POST", "/api/leads", token,
+                                       body={"name": "Evented", "email": "evented@example.com"})
+        assert status == 200
+        await asyncio.wait_for(done.wait(), 5)
+        await stream
+        return b"".join(chunks)
+
+    body = client.portal.call(first_change)
+    payload = orjson.loads(body.split(b"event: change\ndata: ")[1].split(b"\n")[0])
+    assert payload["collection"] == "leads" and payload["action"] == "created"
+    assert payload["data"]["created_by"] == user["id"]
+
+
+def test_stream_ends_once_user_is_no_longer_authorized():
+    checks = []
+
+    async def authorized() -> bool:
+        checks.append(True)
+        return len(checks) < 3
+
+    async def read_stream() -> tuple:
+        broker = EventBroker()
+        subscription = broker.subscribe(None)
+        chunks = [chunk async for chunk in stream_events(broker, subscription, heartbeat=0.01, authorized=authorized)]
+        return chunks, broker.stats()["subscribers"]
+
+    chunks, subscribers = asyncio.run(asyncio.wait_for(read_stream(), 5))
+    assert chunks[0].startswith(b"retry:")
+    assert chunks[1:] == [b": ping\n\n"] * 3
+    assert len(checks) == 3
+    assert subscribers == 0
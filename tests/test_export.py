@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta
+
+import orjson
+
+from tests.helpers import create_lead
+
+
+def test_export_streams_owned_records(client, customer, register):
+    create_lead(client, customer, email="export1@example.com")
+    create_lead(client, customer, email="export2@example.com")
+    _, other = register()
+    create_lead(client, other)
+
+    response = client.get("/api/export/leads", headers=customer)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == 'attachment; filename="leads.ndjson"'
+    rows = [orjson.loads(line) for line in response.text.splitlines()]
+    assert sorted(row["email"] for row in rows) == ["export1@example.com", "export2@example.com"]
+
+    lines = client.get("/api/export/leads", headers=customer, params={"format": "csv"}).text.splitlines()
+    assert "email" in lines[0].split(",") and len(lines) == 3
+    future = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    assert client.get("/api/export/leads", headers=customer, params={"updated_since": future}).text == ""
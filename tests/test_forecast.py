@@ -0,0 +1,11 @@
+from tests.helpers import create_contact, create_deal
+
+
+def test_forecast_is_conditional(client, customer):
+    contact = create_contact(client, customer)
+    create_deal(client, customer, contact["id"], value=1000)
+    response = client.get("/api/analytics/forecast", headers=customer)
+    assert response.status_code == 200
+    assert sum(month["value"] for month in response.json()["forecast"]) == 1000
+    etag = response.headers["ETag"]
+    assert client.get("/api/analytics/forecast", headers={**customer, "If-None-Match": etag}).status_code == 304
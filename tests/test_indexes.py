@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from pymongo import ASCENDING, DESCENDING
+
+from indexes import INDEXES, QUERY_SHAPES, _compound_indexes, ensure_indexes
+from memory_engine import MemoryClient
+
+
+def index_keys(collection: str) -> list:
+    return [list(model.document["key"].items()) for model in INDEXES[collection]]
+
+
+@pytest.mark.parametrize("name, collection, query, sort", QUERY_SHAPES, ids=[shape[0] for shape in QUERY_SHAPES])
+def test_query_shape_has_an_index_to_start_from(name, collection, query, sort):
+    keys = index_keys(collection)
+    if "$text" in query:
+        assert any(direction == "text" for index in keys for _, direction in index)
+    elif query:
+        assert any(index[0][0] in query for index in keys)
+    else:
+        # An index serves a sort and its reverse
+        fields = [field for field, _ in sort]
+        assert any([field for field, _ in index[:len(fields)]] == fields for index in keys)
+
+
+def test_compound_indexes_skip_prefixes_of_other_ones():
+    created_at = [("created_at", DESCENDING), ("id", DESCENDING)]
+    models = _compound_indexes(
+        [("created_by", ASCENDING)] + created_at,
+        [("created_by", ASCENDING)],
+        [("created_by", ASCENDING)] + created_at,
+        created_at,
+    )
+    assert [list(model.document["key"].items()) for model in models] == [
+        [("created_by", ASCENDING)] + created_at, created_at,
+    ]
+
+
+def test_ensure_indexes_creates_every_declared_index():
+    async def scenario():
+        db = MemoryClient()["indexes"]
+        await db.users.insert_many([{"id": "1", "email": "twin@example.com"}, {"id": "2", "email": "twin@example.com"}])
+        # The duplicate emails block the unique index; the others are still created
+        await ensure_indexes(db)
+        return {collection: await db[collection].index_information() for collection in INDEXES}
+
+    declared = asyncio.run(scenario())
+    assert "email_1" not in declared["users"]
+    for collection, models in INDEXES.items():
+        if collection != "users":
+            assert set(declared[collection]) - {"_id_"} == {model.document["name"] for model in models}
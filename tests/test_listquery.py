@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def ids(response) -> set:
+    assert response.status_code == 200, response.text
+    return {item["id"] for item in response.json()["items"]}
+
+
+def test_leads_filter_by_stage_source_and_assignee(client, register):
+    rep, _ = register()
+    _, headers = register()
+    leads = [
+        client.post("/api/leads", headers=headers, json={
+            "name": f"Filtered {i}", "email": f"filtered{i}@example.com", **fields,
+        }).json()
+        for i, fields in enumerate([
+            {"source": "referral"},
+            {"source": "referral", "stage": "contacted", "assigned_to": rep["id"]},
+            {"source": "call", "assigned_to": rep["id"]},
+        ])
+    ]
+
+    def listed(params: dict) -> set:
+        return ids(client.get("/api/leads", headers=headers, params=params))
+
+    assert listed({"filter[source]": "referral"}) == {leads[0]["id"], leads[1]["id"]}
+    assert listed({"filter[assigned_to]": rep["id"]}) == {leads[1]["id"], leads[2]["id"]}
+    assert listed({"filter[stage]": "new,qualified", "sort": "-created_at"}) == {leads[0]["id"], leads[2]["id"]}
+    assert client.get("/api/leads", headers=headers, params={"filter[source]": "fax"}).status_code == 400
+
+
+def test_deals_filter_by_stage_and_contact(client, customer):
+    contacts = [
+        client.post("/api/contacts", headers=customer, json={"name": "Deal Contact", "email": f"dc{i}@example.com"}).json()
+        for i in range(2)
+    ]
+    close = (datetime.utcnow() + timedelta(days=10)).isoformat()
+    deals = [
+        client.post("/api/deals", headers=customer, json={
+            "title": f"Deal {i}", "value": 100, "expected_close_date": close, "contact_id": contact["id"], "stage": stage,
+        }).json()
+        for i, (contact, stage) in enumerate([(contacts[0], "prospect"), (contacts[0], "won"), (contacts[1], "won")])
+    ]
+
+    by_contact = client.get("/api/deals", headers=customer, params={"filter[contact_id]": contacts[0]["id"]})
+    assert ids(by_contact) == {deals[0]["id"], deals[1]["id"]}
+    won = client.get("/api/deals", headers=customer, params={"filter[stage]": "won", "sort": "-created_at"})
+    assert ids(won) == {deals[1]["id"], deals[2]["id"]}
+
+
+@pytest.mark.parametrize("params", [
+    {"filter[company]": "Acme"},
+    {"sort": "name"},
+    {"filter[stage]": "new", "sort": "-score"},
+    {"filter[created_at][gte]": "2025-01-01", "sort": "updated_at"},
+    {"filter[created_at][gte]": "not a date"},
+])
+def test_unindexed_or_invalid_queries_are_rejected(client, customer, params):
+    assert client.get("/api/leads", headers=customer, params=params).status_code == 400
+
+
+def test_sparse_fieldsets_keep_id_and_sort_field(client, customer):
+    client.post("/api/leads", headers=customer, json={"name": "Sparse", "email": "sparse@example.com"})
+    items = client.get("/api/leads", headers=customer, params={"fields": "name", "sort": "-score"}).json()["items"]
+    assert set(items[0]) >= {"id", "name", "score"}
+    assert "email" not in items[0] or items[0]["email"] is None
+    assert client.get("/api/leads", headers=customer, params={"fields": "password"}).status_code == 400
@@ -0,0 +1,26 @@
+import server
+from metrics import Histogram
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("job_seconds", "Job latency", ("job",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(("rescore",), value)
+    lines = histogram.render()
+    assert 'job_seconds_bucket{job="rescore",le="0.1"} 1' in lines
+    assert 'job_seconds_bucket{job="rescore",le="1.0"} 2' in lines
+    assert 'job_seconds_bucket{job="rescore",le="+Inf"} 3' in lines
+    assert 'job_seconds_count{job="rescore"} 3' in lines
+
+
+def test_metrics_endpoint_requires_its_token(client, customer, monkeypatch):
+    monkeypatch.setattr(server, "METRICS_TOKEN", "scrape-token")
+    client.get("/api/leads", headers=customer)
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers=customer).status_code == 401
+
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/leads",status="200"}' in response.text
+    assert "event_subscribers " in response.text
@@ -0,0 +1,11 @@
+from tests.helpers import create_lead
+
+
+def test_leads_page_by_cursor(client, customer):
+    for i in range(5):
+        create_lead(client, customer, email=f"page{i}@example.com")
+    first = client.get("/api/leads", headers=customer, params={"limit": 3}).json()
+    second = client.get("/api/leads", headers=customer, params={"limit": 3, "cursor": first["next_cursor"]}).json()
+    assert len(first["items"]) == 3 and len(second["items"]) == 2
+    assert second["next_cursor"] is None
+    assert client.get("/api/leads", headers=customer, params={"sort": "name"}).status_code == 400
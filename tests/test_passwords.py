@@ -0,0 +1,29 @@
+import hashlib
+
+import passwords
+import server
+
+
+def test_login_rehashes_legacy_sha256_password(client, run, register):
+    user, _ = register()
+    run(server.db.users.update_one, {"id": user["id"]},
+        {"$set": {"password": hashlib.sha256(b"legacy secret").hexdigest()}})
+
+    def login(password: str) -> int:
+        return client.post("/api/auth/login", json={"email": user["email"], "password": password}).status_code
+
+    assert login("wrong") == 401
+    assert login("legacy secret") == 200
+    stored = run(server.db.users.find_one, {"id": user["id"]})["password"]
+    assert stored.startswith("scrypt$")
+    assert passwords.verify_password_sync("legacy secret", stored) == (True, False)
+    assert login("legacy secret") == 200
+
+
+def test_outdated_scrypt_parameters_ask_for_a_rehash(monkeypatch):
+    monkeypatch.setattr(passwords, "SCRYPT_N", 2 ** 10)
+    stored = passwords.hash_password_sync("secret")
+    monkeypatch.setattr(passwords, "SCRYPT_N", 2 ** 11)
+    assert passwords.verify_password_sync("secret", stored) == (True, True)
+    assert passwords.verify_password_sync("other", stored) == (False, False)
+    assert passwords.verify_password_sync("secret", "scrypt$garbage") == (False, False)
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import server
+from rollups import read_row, reconcile, seed_rows
+from tests.helpers import create_lead
+
+
+def test_startup_seeds_missing_rollup_rows(client, run, register):
+    user, headers = register()
+    run(server.db.leads.insert_many, [
+        {"id": f"seeded-{user['id']}-{i}", "name": "Seeded", "email": "seeded@example.com", "stage": "new",
+         "source": "website", "created_by": user["id"], "created_at": datetime.utcnow(), "version": 0}
+        for i in range(3)
+    ])
+    run(server.db.dashboard_rollups.delete_many, {})
+
+    assert run(seed_rows, server.db) is True
+    assert run(seed_rows, server.db) is False
+    assert run(read_row, server.db, user["id"])["total_leads"] == 3
+    create_lead(client, headers)
+    assert client.get("/api/analytics/dashboard", headers=headers).json()["total_leads"] == 4
+
+
+def test_reconcile_reports_and_repairs_drift(client, run, register):
+    user, headers = register()
+    create_lead(client, headers, stage="contacted")
+    run(server.db.dashboard_rollups.update_one, {"_id": user["id"]}, {"$inc": {"total_leads": 5}})
+
+    drift = run(reconcile, server.db, dry_run=True)[user["id"]]
+    assert drift == {"total_leads": {"stored": 6, "expected": 1}}
+    assert run(read_row, server.db, user["id"])["total_leads"] == 6
+
+    run(reconcile, server.db)
+    assert user["id"] not in run(reconcile, server.db, dry_run=True)
+    dashboard = client.get("/api/analytics/dashboard", headers=headers).json()
+    assert dashboard["total_leads"] == 1
@@ -0,0 +1,16 @@
+import server
+from scoring import rescore_all
+from tests.helpers import create_lead
+
+
+def test_rescore_changes_list_etag(client, run, customer):
+    lead = create_lead(client, customer)
+    first = client.get("/api/leads", headers=customer)
+    etag = first.headers["ETag"]
+    assert client.get("/api/leads", headers={**customer, "If-None-Match": etag}).status_code == 304
+
+    run(server.db.leads.update_one, {"id": lead["id"]}, {"$set": {"score": 0}})
+    assert run(rescore_all, server.db)["changed"] >= 1
+    response = client.get("/api/leads", headers={**customer, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert [item["score"] for item in response.json()["items"] if item["id"] == lead["id"]] == [lead["score"]]
@@ -0,0 +1,14 @@
+from tests.helpers import create_lead
+
+
+def test_prefix_search_follows_updates(client, customer, register):
+    lead = create_lead(client, customer, name="Zebulon Quartz")
+    hits = client.get("/api/search", headers=customer, params={"q": "zebu"}).json()["items"]
+    assert [hit["item"]["id"] for hit in hits] == [lead["id"]]
+
+    client.patch(f"/api/leads/{lead['id']}", headers=customer, json={"name": "Xanthe Quartz"})
+    assert client.get("/api/search", headers=customer, params={"q": "zebu"}).json()["items"] == []
+    assert len(client.get("/api/search", headers=customer, params={"q": "xant"}).json()["items"]) == 1
+    # Other customers do not see it
+    _, other = register()
+    assert client.get("/api/search", headers=other, params={"q": "xant"}).json()["items"] == []
@@ -0,0 +1,22 @@
+import asyncio
+
+from memory_engine import MemoryDatabase
+from storage import command_db
+
+
+def test_commands_open_the_configured_engine(monkeypatch):
+    monkeypatch.setenv("STORAGE_ENGINE", "memory")
+    monkeypatch.setenv("DB_NAME", "maintenance")
+    monkeypatch.delenv("MONGO_URL", raising=False)
+
+    async def scenario():
+        async with command_db() as db:
+            return db
+
+    db = asyncio.run(scenario())
+    assert isinstance(db, MemoryDatabase) and db.name == "maintenance"
+
+
+def test_memory_engine_answers_unsupported_queries_with_501(client, admin):
+    assert client.get("/api/search", headers=admin, params={"q": "acme", "mode": "text"}).status_code == 501
+    assert client.get("/api/admin/indexes/report", headers=admin).status_code == 501
@@ -0,0 +1,17 @@
+from tests.helpers import create_contact, create_deal
+
+
+def test_transitions_apply_valid_moves(client, customer):
+    contact = create_contact(client, customer)
+    deals = [create_deal(client, customer, contact["id"]) for _ in range(2)]
+    response = client.post("/api/deals/transitions", headers=customer, json={"moves": [
+        {"deal_id": deals[0]["id"], "stage": "proposal", "version": deals[0]["version"]},
+        {"deal_id": deals[1]["id"], "stage": "proposal", "version": deals[1]["version"] + 1},
+        {"deal_id": "missing", "stage": "won"},
+    ]})
+    assert response.status_code == 200
+    result = response.json()
+    assert [(deal["id"], deal["stage"]) for deal in result["updated"]] == [(deals[0]["id"], "proposal")]
+    assert sorted((error["deal_id"], error["status"]) for error in result["errors"]) == [
+        (deals[1]["id"], 409), ("missing", 404),
+    ]
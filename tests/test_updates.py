@@ -0,0 +1,30 @@
+import server
+from tests.helpers import create_lead
+
+
+def test_patch_checks_version_and_rescores(client, customer):
+    lead = create_lead(client, customer)
+    response = client.patch(f"/api/leads/{lead['id']}", headers=customer,
+                            json={"stage": "qualified", "company": "Acme", "version": lead["version"]})
+    assert response.status_code == 200
+    updated = response.json()
+    assert updated["version"] == lead["version"] + 1
+    assert updated["score"] > lead["score"]
+    listed = client.get("/api/leads", headers=customer).json()["items"]
+    assert [item["score"] for item in listed if item["id"] == lead["id"]] == [updated["score"]]
+
+    stale = client.patch(f"/api/leads/{lead['id']}", headers=customer, json={"notes": "late", "version": lead["version"]})
+    assert stale.status_code == 409
+    assert client.patch(f"/api/leads/{lead['id']}", headers=customer, json={"name": None}).status_code == 422
+
+
+def test_empty_patch_is_not_written(client, run, customer):
+    lead = create_lead(client, customer)
+    stored = run(server.db.leads.find_one, {"id": lead["id"]})
+
+    response = client.patch(f"/api/leads/{lead['id']}", headers=customer, json={"version": lead["version"]})
+    assert response.status_code == 200
+    assert response.json()["version"] == lead["version"]
+    assert run(server.db.leads.find_one, {"id": lead["id"]}) == stored
+    assert client.patch(f"/api/leads/{lead['id']}", headers=customer, json={"version": lead["version"] + 1}).status_code == 409
+    assert client.patch("/api/leads/missing", headers=customer, json={}).status_code == 404
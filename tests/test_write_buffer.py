@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pymongo import ASCENDING, IndexModel
+
+from bulk_import import ImportCollection
+from memory_engine import MemoryClient
+from write_buffer import WriteBuffer
+
+
+def contact(number: int) -> dict:
+    return {"id": f"buffered-{number}", "name": "Buffered", "email": "buffered@example.com", "created_by": "owner"}
+
+
+def test_group_commit_writes_in_batches():
+    async def scenario():
+        db = MemoryClient()["buffer"]
+        buffer = WriteBuffer(db, ImportCollection.CONTACTS, batch_size=10, max_delay_ms=5)
+        buffer.start()
+        await asyncio.gather(*(buffer.submit(contact(i), wait=True) for i in range(25)))
+        await buffer.close()
+        return buffer.stats(), await db.contacts.count_documents({})
+
+    stats, stored = asyncio.run(scenario())
+    assert stored == 25
+    assert stats == {"pending": 0, "batches": 3, "committed": 25, "failed": 0}
+
+
+def test_submit_waiting_for_room_is_rejected_once_closed():
+    async def scenario():
+        db = MemoryClient()["buffer"]
+        buffer = WriteBuffer(db, ImportCollection.CONTACTS, batch_size=1, max_delay_ms=1, max_pending=1)
+        buffer.start()
+        # Hold the only slot so that the next submit waits for room
+        await buffer._room.acquire()
+        waiting = asyncio.ensure_future(buffer.submit(contact(1), wait=True))
+        await asyncio.sleep(0)
+        await buffer.close()
+        buffer._room.release()
+        await asyncio.wait_for(waiting, 1)
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(scenario())
+    assert raised.value.status_code == 503
+
+
+def test_failed_insert_reaches_only_its_own_request():
+    async def scenario():
+        db = MemoryClient()["buffer"]
+        await db.contacts.create_indexes([IndexModel([("id", ASCENDING)], unique=True)])
+        await db.contacts.insert_one(contact(1))
+        buffer = WriteBuffer(db, ImportCollection.CONTACTS, batch_size=3, max_delay_ms=5)
+        buffer.start()
+        results = await asyncio.gather(
+            buffer.submit(contact(1), wait=True), buffer.submit(contact(2), wait=True),
+            buffer.submit(contact(1), wait=False), return_exceptions=True,
+        )
+        await buffer.close()
+        return results, buffer.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert isinstance(results[0], HTTPException) and results[0].status_code == 500
+    # A write-behind create never waits for its batch, so its failure is only logged
+    assert results[1:] == [None, None]
+    assert stats == {"pending": 0, "batches": 1, "committed": 1, "failed": 2}